@@ -0,0 +1,330 @@
+"""
+Achievements and personal records
+
+Keeps, per user, the top values of each record (most waves in a session,
+longest session, biggest wave), session counts per spot and per board, and
+the achievements earned so far: session-count milestones, first session at a
+spot, a board's 10th/50th/100th/... session and new personal records. All
+of it is one JSON state row in analytics_state, so showing achievements is a
+primary-key read.
+
+Nothing is replayed after the state is first built:
+- New sessions (of any date) are folded in on the next update(); only the
+  sessions added since the last update are read. The one exception is a
+  session committed after one with a higher id was folded in, which the
+  session count catches; everything is replayed then.
+- Writers that edit sessions call record_edits() in the same transaction,
+  which moves each edited session's counts and record values by the change.
+  Each record keeps its top TOP_RECORDS values, so lowering the record holder
+  promotes the runner-up; the top values are only queried again once every
+  known one has been edited away.
+Achievements are awarded in the order sessions are logged. rebuild()
+recomputes everything, awarding in session date order.
+"""
+import json
+from datetime import datetime
+from sqlalchemy import select
+from models import get_session, get_data_version, count_sessions, AnalyticsState, SurfSession, Board
+
+STATE_NAME = 'achievements'
+
+SESSION_MILESTONES = (1, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+BOARD_MILESTONES = (10, 50, 100, 250, 500, 1000)
+# Field -> (title, unit)
+RECORDS = {
+    'waves_caught': ('Most waves in a session', 'waves'),
+    'session_duration': ('Longest session', 'min'),
+    'wave_height': ('Biggest wave', 'ft'),
+}
+# Session fields the state depends on, as passed to record_edits()
+FIELDS = ('id', 'date', 'location', 'board_id', *RECORDS)
+# Values kept per record, so an edit lowering the holder rarely needs a query
+TOP_RECORDS = 5
+# New records are only announced once there are a few sessions to beat
+MIN_SESSIONS_FOR_RECORDS = 5
+# Earned achievements kept in the state (newest last)
+MAX_AWARDS = 100
+# Rows read per round trip when building the state
+BUILD_BATCH = 10000
+
+def _sessions_query(user_id, after_id=0):
+    return (
+        select(*[getattr(SurfSession, field) for field in FIELDS], Board.name.label('board_name'))
+        .outerjoin(Board, SurfSession.board_id == Board.id)
+        .where(SurfSession.user_id == user_id)
+        .where(SurfSession.id > after_id)
+        .order_by(SurfSession.date, SurfSession.id)
+    )
+
+def session_values(session):
+    """The fields record_edits() needs, from a SurfSession or a row selecting FIELDS"""
+    return {field: getattr(session, field) for field in FIELDS}
+
+def _empty_state():
+    return {
+        'sessions': 0,
+        # Per record: the top values as [value, session id, date], and whether
+        # they are every value there is (so nothing unseen ranks below them)
+        'records': {field: {'top': [], 'complete': True} for field in RECORDS},
+        'spots': {},   # spot key -> sessions
+        'boards': {},  # board id -> {'name', 'sessions'}
+        'earned': [],  # keys of one-off achievements, so they're only awarded once
+        'awards': [],
+    }
+
+def _spot_key(location):
+    return (location or '').strip().lower() or None
+
+def _ordinal(n):
+    suffix = 'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    return f"{n}{suffix}"
+
+def _award(state, awards, key, title, values, once=True):
+    if once:
+        if key in state['earned']:
+            return
+        state['earned'].append(key)
+    award = {'key': key, 'title': title, 'date': values['date'].isoformat(), 'session_id': values['id']}
+    state['awards'].append(award)
+    del state['awards'][:-MAX_AWARDS]
+    awards.append(award)
+
+def _offer(record, value, session_id, when):
+    """
+    Add a value to a record's top values
+    Returns True if it is now the only highest value. A value below every
+    known one of an incomplete list is left out: values ranking between it
+    and them may exist.
+    """
+    top = record['top']
+    if not record['complete'] and (not top or value < top[-1][0]):
+        return False
+    previous = top[0][0] if top else None
+    top.append([value, session_id, when])
+    top.sort(key=lambda entry: -entry[0])
+    if len(top) > TOP_RECORDS:
+        del top[TOP_RECORDS:]
+        record['complete'] = False
+    return previous is None or value > previous
+
+def _withdraw(record, session_id):
+    record['top'] = [entry for entry in record['top'] if entry[1] != session_id]
+
+def _record_award(state, awards, field, values):
+    title, unit = RECORDS[field]
+    if state['sessions'] > MIN_SESSIONS_FOR_RECORDS:
+        _award(state, awards, f"record:{field}",
+               f"New record: {title.lower()} ({values[field]:g} {unit})", values, once=False)
+
+def _count_spot(state, awards, values, sign):
+    spot = _spot_key(values['location'])
+    if spot is None:
+        return
+    count = state['spots'].get(spot, 0) + sign
+    if count > 0:
+        state['spots'][spot] = count
+    else:
+        state['spots'].pop(spot, None)
+    if sign > 0 and count == 1 and state['sessions'] > 1:
+        _award(state, awards, f"spot:{spot}", f"New spot: {values['location'].strip()}", values)
+
+def _count_board(state, awards, values, sign, board_name):
+    if values['board_id'] is None:
+        return
+    board = state['boards'].setdefault(str(values['board_id']), {'name': board_name, 'sessions': 0})
+    board['name'] = board_name or board['name']
+    board['sessions'] += sign
+    if board['sessions'] <= 0:
+        del state['boards'][str(values['board_id'])]
+    elif sign > 0 and board['sessions'] in BOARD_MILESTONES:
+        _award(state, awards, f"board:{values['board_id']}:{board['sessions']}",
+               f"{board['name']}'s {_ordinal(board['sessions'])} session", values)
+
+def fold_session(state, values, awards, board_name=None):
+    """Fold one new session into `state`, appending what it earned to `awards`"""
+    state['sessions'] += 1
+    if state['sessions'] in SESSION_MILESTONES:
+        title = "First session logged" if state['sessions'] == 1 else f"{state['sessions']} sessions"
+        _award(state, awards, f"sessions:{state['sessions']}", title, values)
+    _count_spot(state, awards, values, 1)
+    _count_board(state, awards, values, 1, board_name)
+    for field, record in state['records'].items():
+        if values[field] is not None and _offer(record, values[field], values['id'], values['date'].isoformat()):
+            if len(record['top']) > 1:
+                _record_award(state, awards, field, values)
+
+def apply_edit(state, before, after, awards, board_name=None):
+    """Move one already folded session from its `before` values to its `after` ones"""
+    if _spot_key(before['location']) != _spot_key(after['location']):
+        _count_spot(state, awards, before, -1)
+        _count_spot(state, awards, after, 1)
+    if before['board_id'] != after['board_id']:
+        _count_board(state, awards, before, -1, None)
+        _count_board(state, awards, after, 1, board_name)
+    for field, record in state['records'].items():
+        if before[field] == after[field] and before['date'] == after['date']:
+            continue
+        holder = record['top'][0] if record['top'] else None
+        _withdraw(record, after['id'])
+        if after[field] is not None and _offer(record, after[field], after['id'], after['date'].isoformat()):
+            if holder is not None and holder[1] != after['id'] and after[field] > holder[0]:
+                _record_award(state, awards, field, after)
+
+def _refill(db_session, user_id, state, last_session_id):
+    """Query the top values of records whose every known value was edited away"""
+    for field, record in state['records'].items():
+        if record['top'] or record['complete']:
+            continue
+        column = getattr(SurfSession, field)
+        rows = db_session.execute(
+            select(SurfSession.id, SurfSession.date, column)
+            .where(SurfSession.user_id == user_id, column.isnot(None))
+            # Sessions not folded in yet are offered when they are
+            .where(SurfSession.id <= last_session_id)
+            .order_by(column.desc(), SurfSession.date)
+            .limit(TOP_RECORDS + 1)
+        ).all()
+        record['top'] = [[row[2], row.id, row.date.isoformat()] for row in rows[:TOP_RECORDS]]
+        record['complete'] = len(rows) <= TOP_RECORDS
+
+def _build(db_session, user_id):
+    """Replay every session in date order, streaming them in batches"""
+    state = _empty_state()
+    last_session_id = 0
+    rows = db_session.execute(_sessions_query(user_id), execution_options={'yield_per': BUILD_BATCH})
+    for batch in rows.partitions():
+        for row in batch:
+            fold_session(state, session_values(row), [], row.board_name)
+            last_session_id = max(last_session_id, row.id)
+    return state, last_session_id
+
+def _save(db_session, user_id, state, version, last_session_id):
+    edit_version, _ = get_data_version(db_session, 'surf_sessions_edits', user_id=user_id)
+    db_session.merge(AnalyticsState(
+        name=f"{STATE_NAME}:{user_id}", state=json.dumps(state), data_version=version,
+        edit_version=edit_version, last_session_id=last_session_id,
+        updated_at=datetime.utcnow()
+    ))
+
+def update(user_id):
+    """
+    Bring the user's stored achievements up to date with their sessions
+    Returns (state, achievements earned by the sessions just folded in). The
+    first build returns no new achievements: they were earned in the past.
+    """
+    state_name = f"{STATE_NAME}:{user_id}"
+    db_session = get_session()
+    try:
+        version, _ = get_data_version(db_session, user_id=user_id)
+        stored = db_session.get(AnalyticsState, state_name)
+        if stored is not None and stored.data_version == version:
+            return json.loads(stored.state), []
+
+        # Locked while folding in, so an edit recorded meanwhile isn't overwritten
+        stored = db_session.get(AnalyticsState, state_name, with_for_update=True, populate_existing=True)
+        awards = []
+        if stored is None:
+            state, last_session_id = _build(db_session, user_id)
+        else:
+            state = json.loads(stored.state)
+            last_session_id = stored.last_session_id
+            # Only sessions added since the last update are read
+            for row in db_session.execute(_sessions_query(user_id, after_id=last_session_id)):
+                fold_session(state, session_values(row), awards, row.board_name)
+                last_session_id = max(last_session_id, row.id)
+            if state['sessions'] != count_sessions(db_session, user_id):
+                # A session committed behind last_session_id was skipped; replay
+                # everything and report what the replay awards that wasn't there before
+                known = {(award['key'], award['session_id']) for award in json.loads(stored.state)['awards']}
+                state, last_session_id = _build(db_session, user_id)
+                awards = [award for award in state['awards'] if (award['key'], award['session_id']) not in known]
+        _save(db_session, user_id, state, version, last_session_id)
+        db_session.commit()
+    finally:
+        db_session.close()
+
+    return state, awards
+
+def record_edits(db_session, user_id, before, after):
+    """
+    Apply edited sessions to the user's stored achievements, in the caller's transaction
+    `before` and `after` are session_values() of the same sessions before and
+    after the edit. Returns the achievements earned.
+    """
+    stored = db_session.get(AnalyticsState, f"{STATE_NAME}:{user_id}",
+                            with_for_update=True, populate_existing=True)
+    if stored is None:
+        # Built from the edited sessions on the next update
+        return []
+    # Sessions not folded in yet are read with their edited values when they are
+    edits = [(old, new) for old, new in zip(before, after)
+             if old['id'] <= stored.last_session_id and old != new]
+    if not edits:
+        return []
+
+    state = json.loads(stored.state)
+    new_boards = {new['board_id'] for _, new in edits
+                  if new['board_id'] is not None and str(new['board_id']) not in state['boards']}
+    board_names = dict(db_session.execute(
+        select(Board.id, Board.name).where(Board.id.in_(new_boards))
+    ).all()) if new_boards else {}
+
+    awards = []
+    for old, new in edits:
+        apply_edit(state, old, new, awards, board_names.get(new['board_id']))
+    _refill(db_session, user_id, state, stored.last_session_id)
+    stored.state = json.dumps(state)
+    stored.updated_at = datetime.utcnow()
+    return awards
+
+def summarize(state, recent=10):
+    """Records and the most recent achievements, for the dashboard"""
+    records = []
+    for field, (title, unit) in RECORDS.items():
+        top = state['records'][field]['top']
+        if top:
+            value, session_id, when = top[0]
+            records.append({'title': title, 'unit': unit, 'value': value, 'session_id': session_id, 'date': when})
+    return {
+        'records': records,
+        'recent': list(reversed(state['awards'][-recent:])),
+        'sessions': state['sessions'],
+        'spots': len(state['spots']),
+    }
+
+def get_achievements(user_id):
+    """The user's records and recent achievements, updated first if they have new sessions"""
+    state, _ = update(user_id)
+    return summarize(state)
+
+def rebuild(user_id):
+    """Forget the stored state and replay every session in date order (e.g. after changing the rules)"""
+    db_session = get_session()
+    try:
+        stored = db_session.get(AnalyticsState, f"{STATE_NAME}:{user_id}")
+        if stored is not None:
+            db_session.delete(stored)
+            db_session.commit()
+    finally:
+        db_session.close()
+    state, _ = update(user_id)
+    return state
+
+if __name__ == "__main__":
+    import argparse
+    import users
+
+    parser = argparse.ArgumentParser(description="Show achievements and personal records")
+    parser.add_argument('--rebuild', action='store_true', help="recompute from every session")
+    args = parser.parse_args()
+
+    user_id = users.cli_user_id()
+    state = rebuild(user_id) if args.rebuild else update(user_id)[0]
+    summary = summarize(state, recent=MAX_AWARDS)
+    print(f"\n{summary['sessions']} sessions at {summary['spots']} spots")
+    print("\nPersonal records:")
+    for record in summary['records']:
+        print(f"  {record['title']}: {record['value']:g} {record['unit']} ({record['date'][:10]})")
+    print("\nAchievements (newest first):")
+    for award in summary['recent']:
+        print(f"  {award['date'][:10]}  {award['title']}")
@@ -1,6 +1,8 @@
 # Import required modules
-from models import SurfSession, get_session  # Database models and session management
+from models import SurfSession, get_session, bump_data_version  # Database models and session management
 from datetime import datetime  # For handling dates and timestamps
+import daily_activity  # Per-day totals for the calendar heatmap
+import users  # Which user the session belongs to
 
 # Define standard wave height ranges and their corresponding numerical values
 # The numerical values represent the average height for the range
@@ -117,7 +119,10 @@ def add_new_session():
     db_session = get_session()
     try:
         # Add and commit the new session to the database
+        session.user_id = users.cli_user_id(db_session)  # SURFTRACKER_USER, or the only user
         db_session.add(session)
+        daily_activity.record_sessions(db_session, session.user_id, [(date, waves_caught, duration)])
+        bump_data_version(db_session, user_id=session.user_id)  # Lets the dashboard know its cached responses are stale
         db_session.commit()
         print("\nSession successfully added!")
         
@@ -0,0 +1,183 @@
+"""
+Rolling-window statistics and weekly session streaks
+
+The results are kept in the analytics_state table together with the data
+version they reflect. When new sessions are added, only those sessions are
+folded into the stored state. A full rebuild (vectorized with pandas/NumPy)
+happens only the first time, after existing sessions are edited, when a
+new session is dated before the latest one already counted, or when the
+session count shows one was committed behind the last id folded in. State
+and versions are kept per user.
+"""
+import json
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from models import get_session, get_data_version, count_sessions, AnalyticsState, SurfSession, Board
+
+STATE_NAME = 'rolling'
+WINDOWS_DAYS = (30, 90)
+
+# 1970-01-01 was a Thursday, so shifting by 3 days makes weeks start on Monday
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _week_of(when):
+    """Monday-based week number of a datetime"""
+    return (when.toordinal() - _EPOCH_ORDINAL + 3) // 7
+
+def _sessions_query(user_id, after_id=0):
+    return (
+        select(SurfSession.id, SurfSession.date, SurfSession.location,
+               Board.name.label('board_name'), SurfSession.waves_caught,
+               SurfSession.session_duration)
+        .outerjoin(Board, SurfSession.board_id == Board.id)
+        .where(SurfSession.user_id == user_id)
+        .where(SurfSession.id > after_id)
+        .order_by(SurfSession.date, SurfSession.id)
+    )
+
+def _empty_state():
+    return {
+        'last_date': None, 'last_week': None, 'window': [],
+        'current_streak': 0, 'longest_streak': 0,
+        'last_by_spot': {}, 'last_by_board': {}, 'session_count': 0,
+    }
+
+def _none_if_nan(value):
+    return None if value is None or value != value else int(value)
+
+def build_state(df):
+    """Compute the analytics state from every session in one vectorized pass"""
+    import numpy as np
+    import pandas as pd
+
+    if df.empty:
+        return _empty_state()
+    df = df.sort_values(['date', 'id'])
+    dates = df['date']
+    last_date = dates.iloc[-1]
+
+    # Active weeks, then lengths of each run of consecutive weeks
+    days = dates.to_numpy().astype('datetime64[D]').astype('int64')
+    weeks = np.unique((days + 3) // 7)
+    run_ends = np.append(np.flatnonzero(np.diff(weeks) != 1), len(weeks) - 1)
+    run_lengths = np.diff(np.concatenate(([-1], run_ends)))
+
+    # Only the last max(WINDOWS_DAYS) days are needed for the rolling averages
+    window = df.loc[dates >= last_date - pd.Timedelta(days=max(WINDOWS_DAYS)),
+                    ['date', 'waves_caught', 'session_duration']]
+
+    return {
+        'last_date': last_date.isoformat(),
+        'last_week': int(weeks[-1]),
+        'window': [[d.isoformat(), _none_if_nan(w), _none_if_nan(m)]
+                   for d, w, m in window.itertuples(index=False)],
+        'current_streak': int(run_lengths[-1]),
+        'longest_streak': int(run_lengths.max()),
+        'last_by_spot': {k: v.isoformat() for k, v in df.groupby('location')['date'].max().items()},
+        'last_by_board': {k: v.isoformat() for k, v in df.groupby('board_name')['date'].max().items()},
+        'session_count': len(df),
+    }
+
+def apply_sessions(state, rows):
+    """
+    Fold new sessions (sorted by date) into `state` in place
+    Returns False if a session is older than the latest one already counted;
+    streaks can't be updated incrementally then, so the caller must rebuild.
+    """
+    for _, when, location, board_name, waves, duration in rows:
+        last_date = datetime.fromisoformat(state['last_date']) if state['last_date'] else None
+        if last_date and when < last_date:
+            return False
+
+        week = _week_of(when)
+        if state['last_week'] is None or week > state['last_week'] + 1:
+            state['current_streak'] = 1
+        elif week == state['last_week'] + 1:
+            state['current_streak'] += 1
+        state['longest_streak'] = max(state['longest_streak'], state['current_streak'])
+        state['last_week'] = week
+
+        state['last_date'] = when.isoformat()
+        state['window'].append([when.isoformat(), waves, duration])
+        if location:
+            state['last_by_spot'][location] = when.isoformat()
+        if board_name:
+            state['last_by_board'][board_name] = when.isoformat()
+        state['session_count'] += 1
+
+    if state['last_date']:
+        cutoff = (datetime.fromisoformat(state['last_date']) - timedelta(days=max(WINDOWS_DAYS))).isoformat()
+        state['window'] = [entry for entry in state['window'] if entry[0] >= cutoff]
+    return True
+
+def _average(values):
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 1) if values else None
+
+def summarize(state, now=None):
+    """Turn the stored state into the values shown on the dashboard, as of `now`"""
+    now = now or datetime.now()
+    rolling = {}
+    for days in WINDOWS_DAYS:
+        cutoff = (now - timedelta(days=days)).isoformat()
+        recent = [entry for entry in state['window'] if entry[0] >= cutoff]
+        rolling[f'waves_{days}d'] = _average(entry[1] for entry in recent)
+        rolling[f'duration_{days}d'] = _average(entry[2] for entry in recent)
+        rolling[f'sessions_{days}d'] = len(recent)
+
+    # A streak survives until a whole week passes without a session
+    current_streak = state['current_streak']
+    if state['last_week'] is None or _week_of(now) - state['last_week'] > 1:
+        current_streak = 0
+
+    def days_since(last_dates):
+        since = [(name, (now - datetime.fromisoformat(last)).days) for name, last in last_dates.items()]
+        return sorted(since, key=lambda item: item[1])
+
+    return {
+        'rolling': rolling,
+        'current_streak': current_streak,
+        'longest_streak': state['longest_streak'],
+        'days_since_spot': days_since(state['last_by_spot']),
+        'days_since_board': days_since(state['last_by_board']),
+    }
+
+def get_analytics(user_id, now=None):
+    """Bring the user's stored analytics up to date with their sessions and summarize them"""
+    state_name = f"{STATE_NAME}:{user_id}"
+    db_session = get_session()
+    try:
+        version, _ = get_data_version(db_session, user_id=user_id)
+        edit_version, _ = get_data_version(db_session, 'surf_sessions_edits', user_id=user_id)
+        stored = db_session.get(AnalyticsState, state_name)
+
+        state = None
+        last_session_id = 0
+        if stored is not None and stored.edit_version == edit_version:
+            state = json.loads(stored.state)
+            last_session_id = stored.last_session_id
+            if stored.data_version != version:
+                # Only sessions added since the last update are read
+                rows = db_session.execute(_sessions_query(user_id, after_id=last_session_id)).all()
+                if apply_sessions(state, rows) and state['session_count'] == count_sessions(db_session, user_id):
+                    last_session_id = max([last_session_id] + [row.id for row in rows])
+                else:
+                    state = None
+
+        if state is None:
+            import pandas as pd
+            df = pd.read_sql(_sessions_query(user_id), db_session.bind)
+            state = build_state(df)
+            last_session_id = int(df['id'].max()) if not df.empty else 0
+
+        if stored is None or stored.data_version != version or stored.edit_version != edit_version:
+            db_session.merge(AnalyticsState(
+                name=state_name, state=json.dumps(state), data_version=version,
+                edit_version=edit_version, last_session_id=last_session_id,
+                updated_at=datetime.utcnow()
+            ))
+            db_session.commit()
+    finally:
+        db_session.close()
+
+    return summarize(state, now)
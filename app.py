@@ -1,25 +1,192 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response, send_from_directory, abort, g
+from werkzeug.http import is_resource_modified
 import visualize_data
+import batch_ingest
+import bulk_edit
+import notes_search
+import analytics
+import achievements
+import conditions_analysis
+import forecast_archive
+import daily_activity
+import metrics
+import profiling
+import users
+import spots
+import similarity
+from models import get_engine, get_session, get_data_version
+from datetime import datetime
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'dev')
+metrics.instrument_app(app)
+metrics.instrument_engine(get_engine())
+profiling.install_request_profiler(app)
 
-# Ensure the templates directory exists
-os.makedirs('templates', exist_ok=True)
+# Chart files written by visualize_data.create_visualizations, one directory per user
+CHARTS_DIR = visualize_data.VISUALIZATIONS_DIR
+CHART_FILES = {
+    'progression.html', 'monthly_patterns.html', 'surf_timeline.html',
+    'wave_heights.html', 'surf_locations.html', 'surf_boards.html',
+    'board_performance.html', 'session_duration.html',
+}
+# One lock per user, so users don't wait on each other's chart rendering
+_charts_locks = {}
+
+# Endpoints that don't need a signed-in user
+PUBLIC_ENDPOINTS = {'login', 'static', 'metrics'}
+
+@app.before_request
+def require_user():
+    """Identify the user from the session cookie (or HTTP Basic auth on the API)"""
+    if request.endpoint == 'static' and request.view_args.get('filename', '').startswith('visualizations/'):
+        # Charts hold a user's data; they are only served through /charts/<name>
+        abort(404)
+    if request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    auth = request.authorization
+    if auth and auth.type == 'basic':
+        g.user_id = users.authenticate(auth.username, auth.password)
+    else:
+        g.user_id = session.get('user_id')
+    if g.user_id is not None:
+        return None
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Authentication required'}), 401
+    return redirect(url_for('login', next=request.full_path))
+
+def user_charts_dir(user_id):
+    return os.path.join(CHARTS_DIR, str(user_id))
+
+def current_data_version(user_id):
+    """Return (version, last modified) of a user's session data"""
+    db_session = get_session()
+    try:
+        version, updated_at = get_data_version(db_session, user_id=user_id)
+    finally:
+        db_session.close()
+    # HTTP dates only have one-second resolution
+    return version, updated_at.replace(microsecond=0) if updated_at else None
+
+def set_validators(response, etag, last_modified):
+    """Attach ETag/Last-Modified and ask clients to revalidate on every use"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    # Pages differ per user, so shared caches must not store them
+    response.cache_control.private = True
+    response.vary.add('Cookie')
+    response.vary.add('Authorization')
+    return response
+
+def not_modified(etag, last_modified):
+    """Return a 304 response if the client's cached copy is still current, otherwise None"""
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return set_validators(app.response_class(status=304), etag, last_modified)
+
+def read_charts_version(user_id):
+    """Data version a user's chart files on disk were generated from, or None"""
+    try:
+        with open(os.path.join(user_charts_dir(user_id), '.data_version')) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def refresh_charts(user_id, version):
+    """Regenerate a user's charts and record which data version they show"""
+    output_dir = user_charts_dir(user_id)
+    stats = visualize_data.create_visualizations(user_id, output_dir)
+    with open(os.path.join(output_dir, '.data_version'), 'w') as f:
+        f.write(str(version))
+    return stats
+
+def new_achievements(user_id):
+    """
+    Achievements earned by sessions just saved
+    The sessions are committed by now, so a failure here mustn't fail the
+    request; the next dashboard load folds them in again.
+    """
+    try:
+        return achievements.update(user_id)[1]
+    except Exception:
+        app.logger.exception("Could not update achievements")
+        return []
+
+def charts_lock(user_id):
+    return _charts_locks.setdefault(user_id, threading.Lock())
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    """Sign in with a username and password"""
+    if request.method == 'POST':
+        user_id = users.authenticate(request.form['username'], request.form['password'])
+        if user_id is None:
+            flash('Invalid username or password', 'error')
+            return redirect(url_for('login', next=request.args.get('next')))
+        session.clear()
+        session['user_id'] = user_id
+        next_url = request.args.get('next') or ''
+        # Only follow local paths, never another site
+        return redirect(next_url if next_url.startswith('/') and not next_url.startswith('//') else url_for('dashboard'))
+    return render_template('login.html')
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    session.clear()
+    return redirect(url_for('login'))
 
 @app.route('/')
 def dashboard():
     """Serve the dashboard"""
+    version, _ = current_data_version(g.user_id)
+    # Trends and streaks are relative to today, so the page changes at midnight
+    # even without new sessions: validate on the ETag alone, which includes the date
+    etag = f"dashboard-{g.user_id}-{version}-{datetime.now().date().isoformat()}"
+    # A pending flash message makes this render one-off, so skip caching it
+    cacheable = '_flashes' not in session
+    if cacheable:
+        response = not_modified(etag, None)
+        if response:
+            return response
+
     # Generate fresh visualizations and get statistics
-    summary_stats, yearly_stats, recent_sessions = visualize_data.create_visualizations(visualize_data.load_data_from_db())
-    return render_template('dashboard.html', 
-                         summary_stats=summary_stats, 
+    with charts_lock(g.user_id):
+        summary_stats, yearly_stats, recent_sessions = refresh_charts(g.user_id, version)
+    response = make_response(render_template('dashboard.html',
+                         summary_stats=summary_stats,
                          yearly_stats=yearly_stats,
-                         recent_sessions=recent_sessions)
+                         recent_sessions=recent_sessions,
+                         trends=analytics.get_analytics(g.user_id),
+                         achievements=achievements.get_achievements(g.user_id),
+                         conditions=conditions_analysis.get_analysis(g.user_id)))
+    if cacheable:
+        set_validators(response, etag, None)
+    return response
+
+@app.route('/charts/<name>')
+def chart(name):
+    """Serve a chart, regenerating it first if the data changed since it was drawn"""
+    if name not in CHART_FILES:
+        abort(404)
+    version, updated_at = current_data_version(g.user_id)
+    etag = f"{name.rsplit('.', 1)[0]}-{g.user_id}-{version}"
+    response = not_modified(etag, updated_at)
+    if response:
+        return response
+
+    with charts_lock(g.user_id):
+        if read_charts_version(g.user_id) != version:
+            refresh_charts(g.user_id, version)
+    # A user with no sessions has no charts yet: send_from_directory 404s
+    response = send_from_directory(user_charts_dir(g.user_id), name, conditional=False, etag=False)
+    return set_validators(response, etag, updated_at)
 
 @app.route('/add_session', methods=['GET', 'POST'])
 def add_session():
@@ -31,23 +198,214 @@ def add_session():
             location = request.form['location']
             board_id = request.form['board']
             wave_height = float(request.form['wave_height'])
-            session_duration = int(request.form['duration'])
-            waves_caught = int(request.form['waves'])
+            session_duration = int(request.form['session_duration'])
+            waves_caught = int(request.form['waves_caught'])
             notes = request.form['notes']
 
             # Add session to database
-            visualize_data.add_session_to_db(date, location, board_id, wave_height, 
+            visualize_data.add_session_to_db(g.user_id, date, location, board_id, wave_height, 
                                           session_duration, waves_caught, notes)
             
             flash('Session added successfully!', 'success')
-            return redirect(url_for('dashboard'))
         except Exception as e:
             flash(f'Error adding session: {str(e)}', 'error')
             return redirect(url_for('add_session'))
 
+        for award in new_achievements(g.user_id):
+            flash(f"Achievement: {award['title']}", 'success')
+        return redirect(url_for('dashboard'))
+
     # Get boards for the form
-    boards = visualize_data.get_boards()
-    return render_template('add_session.html', boards=boards)
+    boards = visualize_data.get_boards(g.user_id)
+    return render_template('add_session.html', boards=boards,
+                         today=datetime.now().strftime('%Y-%m-%d'))
+
+@app.route('/api/sessions/batch', methods=['POST'])
+def add_sessions_batch():
+    """Add many sessions at once from a JSON array or NDJSON body"""
+    try:
+        items = batch_ingest.parse_batch(request.get_data(), request.content_type)
+    except batch_ingest.BatchError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = batch_ingest.ingest_sessions(items, g.user_id)
+    created = sum(1 for r in results if r['status'] == 'created')
+    failed = len(results) - created
+    # 207 Multi-Status when only some of the sessions were accepted
+    status = 200 if not failed else (207 if created else 422)
+    earned = new_achievements(g.user_id) if created else []
+    return jsonify({'created': created, 'failed': failed, 'results': results,
+                    'achievements': [award['title'] for award in earned]}), status
+
+@app.route('/api/sessions/bulk_edit', methods=['POST'])
+def bulk_edit_sessions():
+    """
+    Edit many sessions at once, all or nothing
+    Body: {"filter": {...}, "changes": {"set", "add", "scale"}, "expected_versions": {id: version}}
+    or {"patches": [{"id", "version", "set", "add", "scale"}]}. Answers 409 with
+    the conflicting sessions when any changed since the client read them.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': "Expected a JSON object"}), 400
+    try:
+        if 'patches' in body:
+            result = bulk_edit.apply_patches(g.user_id, body['patches'], dry_run=bool(body.get('dry_run')))
+        else:
+            result = bulk_edit.bulk_edit(g.user_id, body.get('filter') or {}, body.get('changes') or {},
+                                         expected_versions=body.get('expected_versions'),
+                                         dry_run=bool(body.get('dry_run')))
+    except bulk_edit.BulkEditError as e:
+        return jsonify({'error': str(e)}), 400
+    except bulk_edit.ConflictError as e:
+        return jsonify({'error': str(e), 'conflicts': e.conflicts}), 409
+    return jsonify(result)
+
+@app.route('/calendar')
+def calendar():
+    """Session calendar heatmap, one or more years at a time"""
+    this_year = datetime.now().year
+    end_year = request.args.get('end', request.args.get('year', this_year, type=int), type=int)
+    start_year = request.args.get('start', end_year, type=int)
+    start_year = max(start_year, end_year - 9)  # At most ten years per page
+    metric = request.args.get('metric', 'sessions')
+    if metric not in daily_activity.METRICS or start_year > end_year:
+        abort(400)
+
+    version, updated_at = current_data_version(g.user_id)
+    etag = f"calendar-{g.user_id}-{start_year}-{end_year}-{metric}-{version}"
+    response = not_modified(etag, updated_at)
+    if response:
+        return response
+
+    db_session = get_session()
+    try:
+        activity = daily_activity.get_activity(db_session, g.user_id, start_year, end_year)
+    finally:
+        db_session.close()
+    years = [(year, daily_activity.build_calendar(activity, year, metric))
+             for year in range(end_year, start_year - 1, -1)]
+    response = make_response(render_template('calendar.html', years=years, metric=metric,
+                                              start_year=start_year, end_year=end_year))
+    return set_validators(response, etag, updated_at)
+
+@app.route('/forecasts')
+def forecast_accuracy():
+    """How archived forecasts compared with logged wave heights"""
+    db_session = get_session()
+    try:
+        versions = [get_data_version(db_session, user_id=g.user_id),
+                    get_data_version(db_session, forecast_archive.VERSION_NAME)]
+    finally:
+        db_session.close()
+    etag = f"forecasts-{g.user_id}-{versions[0][0]}-{versions[1][0]}"
+    changed = [updated_at.replace(microsecond=0) for _, updated_at in versions if updated_at]
+    updated_at = max(changed) if changed else None
+    response = not_modified(etag, updated_at)
+    if response:
+        return response
+
+    response = make_response(render_template('forecasts.html', accuracy=forecast_archive.get_accuracy(g.user_id)))
+    return set_validators(response, etag, updated_at)
+
+@app.route('/api/search')
+def search_sessions():
+    """Full-text search over session notes, with optional filters"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': "Missing search query 'q'"}), 400
+    try:
+        found = notes_search.search_notes(
+            query, g.user_id,
+            location=request.args.get('location'),
+            board_id=request.args.get('board_id', type=int),
+            start_date=notes_search.parse_date_filter(request.args.get('from')),
+            end_date=notes_search.parse_date_filter(request.args.get('to'), end=True),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 20, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(found)
+
+def _similarity_query():
+    """Keyword arguments for similarity.similar_sessions from the query string"""
+    return {
+        'conditions': {feature: request.args.get(feature, type=float) for feature in similarity.NUMERIC_FEATURES},
+        'location': request.args.get('location') or None,
+        'board_id': request.args.get('board_id', type=int),
+        'session_id': request.args.get('session_id', type=int),
+        'k': request.args.get('k', 10, type=int),
+    }
+
+def _has_similarity_criteria(query):
+    """Whether there is anything to match on; without it every session scores the same"""
+    return (query['session_id'] is not None or query['location'] or query['board_id'] is not None
+            or any(value is not None for value in query['conditions'].values()))
+
+@app.route('/api/sessions/similar')
+def similar_sessions_api():
+    """Past sessions most like the given conditions (or like session_id), with how they went"""
+    query = _similarity_query()
+    if not _has_similarity_criteria(query):
+        return jsonify({'error': 'Give session_id, or at least one condition, location or board_id'}), 400
+    try:
+        return jsonify(similarity.similar_sessions(g.user_id, **query))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+@app.route('/similar')
+def similar_sessions_page():
+    """Plan a session: find past sessions in similar conditions"""
+    query = _similarity_query()
+    result = None
+    if _has_similarity_criteria(query):
+        try:
+            result = similarity.similar_sessions(g.user_id, **query)
+        except LookupError:
+            abort(404)
+    return render_template('similar.html', result=result, boards=visualize_data.get_boards(g.user_id),
+                           features=similarity.NUMERIC_FEATURES, args=request.args)
+
+def _position_args(*names):
+    """Read float query parameters, raising ValueError if any is missing or not a number"""
+    values = [request.args.get(name, type=float) for name in names]
+    missing = [name for name, value in zip(names, values) if value is None]
+    if missing:
+        raise ValueError(f"Missing or invalid: {', '.join(missing)}")
+    return values
+
+@app.route('/api/spots/nearby')
+def nearby_spots():
+    """Spots within radius_km (default 25) of lat/lon, closest first"""
+    try:
+        latitude, longitude = _position_args('lat', 'lon')
+        return jsonify({'spots': spots.nearby(latitude, longitude, request.args.get('radius_km', 25, type=float),
+                                              limit=min(request.args.get('limit', 50, type=int), 500))})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/spots/nearest')
+def nearest_spot():
+    """The spot closest to lat/lon (within max_km, if given)"""
+    try:
+        latitude, longitude = _position_args('lat', 'lon')
+        spot = spots.nearest(latitude, longitude, request.args.get('max_km', type=float))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if spot is None:
+        return jsonify({'error': 'No spot found'}), 404
+    return jsonify(spot)
+
+@app.route('/api/spots/map')
+def spot_map():
+    """The user's sessions per spot inside a map's bounding box, optionally clustered into cell-degree cells"""
+    try:
+        south, west, north, east = _position_args('south', 'west', 'north', 'east')
+        return jsonify(spots.map_summary(g.user_id, south, west, north, east,
+                                         cell_degrees=request.args.get('cell', type=float)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 3000))
@@ -0,0 +1,224 @@
+import json
+import math
+from datetime import datetime
+from sqlalchemy import func, insert, or_
+from models import get_session, bump_data_version, SurfSession, Board, WaveQuality
+import daily_activity
+
+# Largest number of sessions accepted in one request
+MAX_BATCH_SIZE = 1000
+
+class BatchError(ValueError):
+    """Raised when a batch request body can't be parsed at all"""
+
+def parse_batch(body, content_type):
+    """
+    Parse a request body into a list of session dictionaries
+    Accepts a JSON array, a JSON object with a "sessions" array, or NDJSON
+    (one JSON object per line) when the content type says so.
+    """
+    try:
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+        if 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            items = json.loads(text)
+            if isinstance(items, dict):
+                items = items.get('sessions')
+    except UnicodeDecodeError:
+        raise BatchError("Body must be UTF-8")
+    except ValueError as e:
+        raise BatchError(f"Invalid JSON: {e}")
+
+    if not isinstance(items, list):
+        raise BatchError("Expected an array of sessions")
+    if len(items) > MAX_BATCH_SIZE:
+        raise BatchError(f"Too many sessions in one batch (max {MAX_BATCH_SIZE})")
+    return items
+
+def _parse_date(value):
+    """
+    Accept 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM' or full ISO 8601 timestamps
+    Sessions are stored in the server's local time, so timestamps with a UTC
+    offset (or Z) are converted to it; ones without are taken as local already.
+    """
+    if not isinstance(value, str):
+        raise ValueError
+    when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return when
+
+def _number(item, errors, field, cast, minimum=None, maximum=None, aliases=()):
+    """Read an optional numeric field, recording a message in `errors` if it's invalid"""
+    for name in (field,) + aliases:
+        if item.get(name) not in (None, ''):
+            value = item[name]
+            break
+    else:
+        return None
+
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        # JSON allows NaN and Infinity, which slip past the range checks
+        if not math.isfinite(float(value)):
+            raise ValueError
+        number = cast(value)
+        if cast is int and number != float(value):
+            raise ValueError
+    except (TypeError, ValueError, OverflowError):
+        errors.append(f"{field} must be {'a whole number' if cast is int else 'a number'}")
+        return None
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        errors.append(f"{field} must be between {minimum} and {maximum}")
+        return None
+    return number
+
+def validate_session(item):
+    """
+    Validate one session dictionary
+    Returns (row, board_ref, errors): the surf_sessions column values, the
+    board id or name still to be resolved, and a list of error messages.
+    """
+    if not isinstance(item, dict):
+        return None, None, ["session must be a JSON object"]
+
+    errors = []
+    row = {'board_id': None}
+
+    try:
+        row['date'] = _parse_date(item.get('date'))
+    except ValueError:
+        errors.append("date is required (YYYY-MM-DD or ISO 8601)")
+
+    location = item.get('location')
+    if not isinstance(location, str) or not location.strip():
+        near = " (no known spot near latitude/longitude)" if item.get('latitude') not in (None, '') else ""
+        errors.append(f"location is required{near}")
+    else:
+        row['location'] = location.strip()[:100]
+
+    row['wave_height'] = _number(item, errors, 'wave_height', float, 0, 100)
+    row['session_duration'] = _number(item, errors, 'session_duration', int, 0, 24 * 60, aliases=('duration',))
+    row['waves_caught'] = _number(item, errors, 'waves_caught', int, 0, 10000, aliases=('waves',))
+    row['wind_speed'] = _number(item, errors, 'wind_speed', float, 0, 200)
+    row['tide_height'] = _number(item, errors, 'tide_height', float, -20, 30)
+    row['water_temp'] = _number(item, errors, 'water_temp', float, 20, 110)
+    row['rating'] = _number(item, errors, 'rating', int, 1, 5)
+
+    wind_direction = item.get('wind_direction')
+    row['wind_direction'] = str(wind_direction)[:50] if wind_direction else None
+
+    quality = item.get('wave_quality')
+    row['wave_quality'] = None
+    if quality:
+        try:
+            row['wave_quality'] = WaveQuality(str(quality).lower())
+        except ValueError:
+            errors.append(f"wave_quality must be one of {[q.value for q in WaveQuality]}")
+
+    notes = item.get('notes')
+    row['notes'] = str(notes) if notes else None
+
+    # Boards can be given by id ("board_id") or by name ("board")
+    board_ref = item.get('board_id')
+    if board_ref in (None, ''):
+        board_ref = item.get('board')
+    if isinstance(board_ref, str):
+        board_ref = int(board_ref) if board_ref.isdecimal() else board_ref.strip().lower()
+    elif board_ref is not None and (isinstance(board_ref, bool) or not isinstance(board_ref, int)):
+        errors.append("board must be a board id or name")
+        board_ref = None
+
+    return row, board_ref, errors
+
+def resolve_boards(db_session, user_id, board_refs):
+    """Look up every referenced board of the user's in one query, returning {ref: board_id}"""
+    ids = {ref for ref in board_refs if isinstance(ref, int)}
+    names = {ref for ref in board_refs if isinstance(ref, str)}
+    if not ids and not names:
+        return {}
+
+    boards = db_session.query(Board.id, Board.name).filter(
+        Board.user_id == user_id,
+        or_(Board.id.in_(ids), func.lower(Board.name).in_(names))
+    ).all()
+    resolved = {}
+    for board_id, name in boards:
+        if board_id in ids:
+            resolved[board_id] = board_id
+        # Keep the first (lowest id) board when several share a name
+        resolved.setdefault(name.lower(), board_id)
+    return resolved
+
+def name_positions(items):
+    """
+    Give sessions that have latitude/longitude but no location the name of
+    the nearest known spot (within spots.ASSIGN_RADIUS_KM), as GPS watches
+    record positions rather than spot names
+    """
+    positions = {}
+    for index, item in enumerate(items):
+        if isinstance(item, dict) and not item.get('location'):
+            try:
+                positions[index] = (float(item['latitude']), float(item['longitude']))
+            except (KeyError, TypeError, ValueError):
+                continue
+    if not positions:
+        return items
+
+    import spots
+    named = list(items)
+    for index, name in zip(positions, spots.assign_locations(positions.values())):
+        if name:
+            named[index] = dict(items[index], location=name)
+    return named
+
+def ingest_sessions(items, user_id):
+    """
+    Validate a batch of a user's sessions and insert the valid ones in one transaction
+    Returns a list with one result per item, in request order:
+    {"index": i, "status": "created", "id": ...} or
+    {"index": i, "status": "error", "errors": [...]}
+    """
+    validated = [validate_session(item) for item in name_positions(items)]
+    results = [None] * len(items)
+
+    db_session = get_session()
+    try:
+        boards = resolve_boards(db_session, user_id, {ref for _, ref, _ in validated if ref is not None})
+
+        rows = []
+        row_indexes = []
+        for index, (row, board_ref, errors) in enumerate(validated):
+            if board_ref is not None:
+                row['board_id'] = boards.get(board_ref)
+                if row['board_id'] is None:
+                    errors.append(f"unknown board: {board_ref}")
+            if errors:
+                results[index] = {'index': index, 'status': 'error', 'errors': errors}
+            else:
+                row['user_id'] = user_id
+                rows.append(row)
+                row_indexes.append(index)
+
+        if rows:
+            # A single executemany INSERT ... RETURNING for the whole batch
+            ids = db_session.scalars(
+                insert(SurfSession).returning(SurfSession.id, sort_by_parameter_order=True),
+                rows
+            ).all()
+            daily_activity.record_sessions(
+                db_session, user_id, [(r['date'], r['waves_caught'], r['session_duration']) for r in rows])
+            bump_data_version(db_session, user_id=user_id)
+            db_session.commit()
+            for index, session_id in zip(row_indexes, ids):
+                results[index] = {'index': index, 'status': 'created', 'id': session_id}
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+    return results
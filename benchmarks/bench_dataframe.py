@@ -0,0 +1,82 @@
+"""
+Benchmark the memory of the dashboard's session DataFrame
+
+Builds N synthetic sessions twice:
+- the old layout: every column from the query, object strings, and
+  year/month/month_name derived with .dt and strftime
+- the layout load_data_from_db now returns: chart columns only, categories,
+  downcast numbers and integer date parts (visualize_data.compact_frame and
+  add_date_parts)
+
+It reports the deep memory usage of each frame, column by column, and how long
+the date parts take. No database is needed; the chunks are built the way
+pd.read_sql returns them.
+
+Usage: python benchmarks/bench_dataframe.py [number_of_sessions]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import numpy as np
+import pandas as pd
+from visualize_data import CHART_COLUMNS, LOAD_CHUNK_ROWS, add_date_parts, compact_frame
+
+LOCATIONS = ['Barneys', 'Pleasure Point', 'Steamer Lane', 'Cowells', 'The Hook', 'Manresa']
+BOARDS = ['Zen', 'Log', 'Fish', 'Step Up', None]
+NOTES = ['', 'glassy', 'blown out by noon', 'crowded but fun, long lefts on the inside at mid tide']
+
+def synthetic_chunks(count):
+    """Yield DataFrames shaped like pd.read_sql chunks of the full session query"""
+    rng = np.random.default_rng(42)
+    start = np.datetime64('2000-01-01T06:00')
+    for offset in range(0, count, LOAD_CHUNK_ROWS):
+        rows = min(LOAD_CHUNK_ROWS, count - offset)
+        index = np.arange(offset, offset + rows)
+        yield pd.DataFrame({
+            'date': start + (index * 6 * 60).astype('timedelta64[m]'),
+            'location': rng.choice(np.array(LOCATIONS, dtype=object), rows),
+            'wave_height': rng.uniform(1, 8, rows).round(1),
+            'session_duration': rng.integers(30, 180, rows),
+            'waves_caught': rng.integers(0, 30, rows),
+            'notes': [NOTES[i % len(NOTES)] for i in index],
+            'board_name': rng.choice(np.array(BOARDS, dtype=object), rows),
+        })
+
+def megabytes(df):
+    return df.memory_usage(deep=True, index=False).sum() / 2**20
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Building {count:,} sessions...")
+
+    before = pd.concat(list(synthetic_chunks(count)), ignore_index=True)
+    started = time.perf_counter()
+    before['month'] = before['date'].dt.month
+    before['year'] = before['date'].dt.year
+    before['month_name'] = before['date'].dt.strftime('%B')
+    before_seconds = time.perf_counter() - started
+
+    after = compact_frame((chunk[CHART_COLUMNS] for chunk in synthetic_chunks(count)), CHART_COLUMNS)
+    started = time.perf_counter()
+    add_date_parts(after)
+    after_seconds = time.perf_counter() - started
+
+    assert (after['year'].to_numpy() == before['year'].to_numpy()).all()
+    assert (after['month'].to_numpy() == before['month'].to_numpy()).all()
+
+    print(f"\n{'column':<18} {'before MB':>10} {'after MB':>10}  dtype")
+    before_usage = before.memory_usage(deep=True, index=False) / 2**20
+    after_usage = after.memory_usage(deep=True, index=False) / 2**20
+    for column in before.columns:
+        if column in after:
+            print(f"{column:<18} {before_usage[column]:>10.1f} {after_usage[column]:>10.1f}  {after[column].dtype}")
+        else:
+            print(f"{column:<18} {before_usage[column]:>10.1f} {'-':>10}  (not loaded)")
+    print(f"{'total':<18} {megabytes(before):>10.1f} {megabytes(after):>10.1f}  "
+          f"({megabytes(after) / megabytes(before):.0%} of before)")
+    print(f"\nDate parts: {before_seconds * 1000:.0f}ms with .dt/strftime, {after_seconds * 1000:.0f}ms with integer ops")
+
+if __name__ == "__main__":
+    main()
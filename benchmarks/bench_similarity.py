@@ -0,0 +1,53 @@
+"""
+Benchmark similar-session queries
+
+Builds a similarity.FeatureMatrix over N synthetic sessions, then times
+building it, appending new sessions and top-k queries. No database is needed.
+
+Usage: python benchmarks/bench_similarity.py [number_of_sessions]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from similarity import FeatureMatrix
+
+LOCATIONS = ['Barneys', 'Pleasure Point', 'Steamer Lane', 'Cowells', 'The Hook', 'Manresa']
+QUERIES = 200
+
+def synthetic_rows(count, rng, first_id=1):
+    """Rows shaped like similarity._features_query results, with some conditions not recorded"""
+    def maybe(value):
+        return value if rng.random() > 0.2 else None
+
+    return [(first_id + i, rng.choice(LOCATIONS), rng.choice([1, 2, 3, None]),
+             maybe(round(rng.uniform(1, 8), 1)), maybe(round(rng.uniform(-1, 6), 1)),
+             maybe(round(rng.uniform(0, 25))), maybe(round(rng.uniform(50, 65))))
+            for i in range(count)]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    rng = random.Random(42)
+    rows = synthetic_rows(count, rng)
+
+    started = time.perf_counter()
+    matrix = FeatureMatrix(rows)
+    print(f"Built matrix of {count:,} sessions in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    matrix.append(synthetic_rows(10, rng, first_id=count + 1))
+    print(f"Appended 10 sessions in {(time.perf_counter() - started) * 1000:.2f}ms")
+
+    queries = [{'wave_height': rng.uniform(1, 8), 'tide_height': rng.uniform(-1, 6),
+                'wind_speed': rng.uniform(0, 25), 'water_temp': rng.uniform(50, 65)} for _ in range(QUERIES)]
+    for label, extra in [("conditions only", {}),
+                         ("conditions + spot + board", {'spot': 'Steamer Lane', 'board_id': 2})]:
+        started = time.perf_counter()
+        for conditions in queries:
+            matrix.nearest(conditions, k=10, **extra)
+        print(f"top-10, {label:<26} {(time.perf_counter() - started) / QUERIES * 1000:.2f}ms/query")
+
+if __name__ == "__main__":
+    main()
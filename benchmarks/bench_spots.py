@@ -0,0 +1,68 @@
+"""
+Benchmark spot queries against the in-process spot index
+
+Builds a SpotIndex over N synthetic spots strung along coastlines (the way
+real spots cluster) and times radius, nearest-spot and map bounding-box
+queries from random points near them. No database is needed.
+
+Usage: python benchmarks/bench_spots.py [number_of_spots]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from spots import SpotIndex, SpotPoint
+
+QUERIES = 10000
+
+def synthetic_spots(count, rng):
+    """Spots along a few hundred random stretches of 'coast'"""
+    spots = []
+    while len(spots) < count:
+        latitude, longitude = rng.uniform(-55, 65), rng.uniform(-180, 180)
+        heading_lat, heading_lon = rng.uniform(-0.05, 0.05), rng.uniform(-0.05, 0.05)
+        for _ in range(min(rng.randint(5, 40), count - len(spots))):
+            latitude = max(-89.9, min(89.9, latitude + heading_lat + rng.uniform(-0.02, 0.02)))
+            longitude = (longitude + heading_lon + rng.uniform(-0.02, 0.02) + 180) % 360 - 180
+            spots.append(SpotPoint(len(spots) + 1, f"spot {len(spots) + 1}", latitude, longitude))
+    return spots
+
+def wrap(longitude):
+    return (longitude + 180) % 360 - 180
+
+def timed(label, queries, function):
+    started = time.perf_counter()
+    results = sum(function(*query) for query in queries)
+    microseconds = (time.perf_counter() - started) / len(queries) * 1e6
+    print(f"{label:<32} {microseconds:>8.1f} us/query  ({results / len(queries):.1f} results on average)")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(42)
+    spots = synthetic_spots(count, rng)
+
+    started = time.perf_counter()
+    index = SpotIndex(spots)
+    print(f"Built index of {count:,} spots in {(time.perf_counter() - started) * 1000:.1f}ms\n")
+
+    # Query from near a random spot, like a GPS fix from a session
+    points = []
+    for _ in range(QUERIES):
+        spot = rng.choice(spots)
+        points.append((spot.latitude + rng.uniform(-0.1, 0.1), spot.longitude + rng.uniform(-0.1, 0.1)))
+    anywhere = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(QUERIES)]
+
+    timed("within 10 km", points, lambda lat, lon: len(index.within(lat, lon, 10)))
+    timed("within 50 km", points, lambda lat, lon: len(index.within(lat, lon, 50)))
+    timed("nearest within 5 km", points, lambda lat, lon: index.nearest(lat, lon, 5) is not None)
+    timed("nearest (near spots)", points, lambda lat, lon: index.nearest(lat, lon) is not None)
+    timed("nearest (anywhere)", anywhere, lambda lat, lon: index.nearest(lat, lon) is not None)
+    timed("map box 1 x 1 degrees", points,
+          lambda lat, lon: len(index.in_box(lat - 0.5, wrap(lon - 0.5), lat + 0.5, wrap(lon + 0.5))))
+    timed("map box 10 x 20 degrees", points,
+          lambda lat, lon: len(index.in_box(lat - 5, wrap(lon - 10), lat + 5, wrap(lon + 10))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark loading a large surf_feedback.SurfLog
+
+Writes a synthetic snapshot of N sessions to a temporary directory, then
+measures how long SurfLog takes to load it and how much memory the loaded
+log keeps alive.
+
+Usage: python benchmarks/bench_surf_log.py [number_of_sessions]
+"""
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from surf_feedback import SurfLog
+
+LOCATIONS = ['Barneys', 'Pleasure Point', 'Steamer Lane', 'Cowells', 'The Hook', 'Manresa']
+
+def write_snapshot(filename, count):
+    """Write a snapshot file with `count` random sessions"""
+    rng = random.Random(42)
+    start = datetime(2015, 1, 1, 6, 0)
+    sessions = []
+    for i in range(count):
+        sessions.append({
+            'quality': rng.choice(['good', 'bad']),
+            'date': (start + timedelta(hours=6 * i)).strftime('%Y-%m-%d %H:%M'),
+            'notes': rng.choice(['', '', 'glassy', 'blown out by noon']),
+            'wave_height': rng.choice([None, 1.5, 2.0, 2.5, 3.0, 4.0]),
+            'location': rng.choice(LOCATIONS),
+        })
+    with open(filename, 'w') as f:
+        json.dump(sessions, f, indent=2)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'surf_log.json')
+        print(f"Writing {count:,} sessions...")
+        write_snapshot(filename, count)
+
+        started = time.perf_counter()
+        surf_log = SurfLog(filename)
+        load_seconds = time.perf_counter() - started
+
+        # Load a second time under tracemalloc, which is too slow to time
+        del surf_log
+        gc.collect()
+        tracemalloc.start()
+        surf_log = SurfLog(filename)
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        surf_log.get_statistics()
+        stats_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for session in surf_log.sessions:
+            pass
+        iterate_seconds = time.perf_counter() - started
+
+    print(f"Load time:          {load_seconds:.2f}s")
+    print(f"Retained memory:    {retained / 2**20:.1f} MiB ({retained / count:.0f} bytes/session)")
+    print(f"Peak load memory:   {peak / 2**20:.1f} MiB")
+    print(f"get_statistics:     {stats_seconds * 1000:.3f}ms")
+    print(f"Iterate sessions:   {iterate_seconds:.2f}s")
+
+if __name__ == "__main__":
+    main()
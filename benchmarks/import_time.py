@@ -0,0 +1,112 @@
+"""
+Cold-start import-time report for the web app and each CLI
+
+Imports each entry point in a fresh interpreter with `python -X importtime`
+and reports its total import time, the slowest modules it pulled in, and
+whether it imported any of the heavy analytics libraries. Exits non-zero
+if an entry point is over its limit or imports a library it shouldn't;
+goals are reported but don't fail the run.
+
+Usage: python benchmarks/import_time.py [--top N]
+"""
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Cold-start limit for each entry point, in milliseconds. The current tree
+# meets these with room for noise; going over one is a regression.
+LIMITS_MS = {
+    'app': 1000,
+    'add_session': 750,
+    'edit_session': 750,
+    'manage_boards': 750,
+    'verify_data': 750,
+    'sync_surf_log': 750,
+    'surf_feedback': 100,
+    'visualize_data': 750,
+    'load_data': 1500,  # Needs pandas to read spreadsheets
+}
+
+# Where we want to get to. Most entry points miss these because importing
+# SQLAlchemy and Flask alone takes longer, so they are only reported.
+GOALS_MS = {
+    'app': 400,
+    'add_session': 250,
+    'edit_session': 250,
+    'manage_boards': 250,
+    'verify_data': 250,
+    'sync_surf_log': 250,
+    'surf_feedback': 50,
+    'visualize_data': 250,
+    'load_data': 1500,
+}
+
+# Libraries that are only needed once charts or spreadsheets are built
+HEAVY_MODULES = ('pandas', 'plotly', 'numpy')
+ALLOWED_HEAVY = {'load_data'}
+
+LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def measure(module):
+    """Import `module` in a new interpreter and return [(cumulative_us, self_us, name, depth)]"""
+    statement = f'import {module}' if module else 'pass'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(cumulative_us), int(self_us), name, (len(indent) - 1) // 2))
+    return rows
+
+def total_ms(rows):
+    """Total import time; only top-level imports (depth 0) add up without double counting"""
+    return sum(cumulative for cumulative, _, _, depth in rows if depth == 0) / 1000
+
+def main():
+    top = int(sys.argv[sys.argv.index('--top') + 1]) if '--top' in sys.argv else 5
+    failures = []
+
+    # Interpreter startup (site, encodings, ...) is paid by every entry point
+    startup = measure(None)
+    startup_ms = total_ms(startup)
+    startup_modules = {name for _, _, name, _ in startup}
+    print(f"Interpreter startup imports: {startup_ms:.1f}ms (excluded below)\n")
+
+    print(f"{'entry point':<16} {'import ms':>10} {'limit ms':>9} {'goal ms':>8}  heavy imports")
+    for module, limit_ms in LIMITS_MS.items():
+        goal_ms = GOALS_MS[module]
+        try:
+            rows = measure(module)
+        except RuntimeError as e:
+            print(f"{module:<16} {'error':>10} {limit_ms:>9} {goal_ms:>8}  {e}")
+            failures.append(module)
+            continue
+
+        rows = [row for row in rows if row[2] not in startup_modules]
+        import_ms = total_ms(rows)
+        imported = {name.split('.')[0] for _, _, name, _ in rows}
+        heavy = sorted(imported.intersection(HEAVY_MODULES))
+        mark = '' if import_ms <= goal_ms else ' (over goal)'
+        print(f"{module:<16} {import_ms:>10.1f} {limit_ms:>9} {goal_ms:>8}  {', '.join(heavy) or '-'}{mark}")
+
+        for cumulative, _, name, _ in sorted(rows, reverse=True)[:top]:
+            print(f"{'':<18}{cumulative / 1000:>8.1f}  {name}")
+
+        if import_ms > limit_ms or (heavy and module not in ALLOWED_HEAVY):
+            failures.append(module)
+
+    if failures:
+        print(f"\nOver limit: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
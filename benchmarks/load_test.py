@@ -0,0 +1,359 @@
+"""
+End-to-end HTTP load test of the web app
+
+Seeds a database with a synthetic session history, starts app:app under
+gunicorn with N workers, and drives a weighted mix of GET /, GET /add_session
+and POST /add_session from C concurrent clients (closed loop: each client
+sends its next request as soon as the previous one is answered). Reports
+throughput, p50/p95/p99 latency and error rate per route.
+
+Everything runs locally and offline. By default the database is a fresh
+SQLite file in a temporary directory. Pass --database-url to load-test
+against PostgreSQL instead. The load-test users (loadtest1, loadtest2, ...)
+are created and seeded there, or reused as they are if they already exist.
+
+Usage: python benchmarks/load_test.py [--workers 4] [--concurrency 16]
+           [--duration 30] [--sessions 5000] [--mix dashboard=8,form=1,add=1]
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'loadtest'
+LOCATIONS = ['Barneys', 'Pleasure Point', 'Steamer Lane', 'Cowells', 'The Hook', 'Manresa']
+BOARDS = ['Zen', 'Log', 'Fish', 'Step Up']
+NOTES = ['', '', 'glassy', 'blown out by noon', 'crowded but fun', 'long lefts on the inside']
+
+# Route name -> (method, path)
+ROUTES = {
+    'dashboard': ('GET', '/'),
+    'form': ('GET', '/add_session'),
+    'add': ('POST', '/add_session'),
+}
+DEFAULT_MIX = 'dashboard=8,form=1,add=1'
+INSERT_BATCH = 10000
+
+def parse_mix(value):
+    """Parse 'dashboard=8,form=1,add=1' into {route: weight}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown route '{name}' (choose from {', '.join(ROUTES)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def seed(user_count, session_count):
+    """
+    Create the load-test users with `session_count` sessions each
+    Returns {username: [board ids]}. Users that already exist are reused
+    without adding sessions, so repeated runs against one database compare
+    like with like.
+    """
+    from werkzeug.security import generate_password_hash
+    from models import init_db, get_session, Board, SurfSession, User, WaveQuality
+    import daily_activity
+
+    init_db()
+    rng = random.Random(42)
+    password_hash = generate_password_hash(PASSWORD)
+    accounts = {}
+    db_session = get_session()
+    try:
+        for i in range(1, user_count + 1):
+            username = f'loadtest{i}'
+            user = db_session.query(User).filter(User.username == username).first()
+            if user is not None:
+                accounts[username] = [b.id for b in db_session.query(Board.id).filter(Board.user_id == user.id)]
+                continue
+
+            user = User(username=username, password_hash=password_hash)
+            db_session.add(user)
+            db_session.flush()
+            boards = [Board(user_id=user.id, name=name, board_type='shortboard', length=6.0) for name in BOARDS]
+            db_session.add_all(boards)
+            db_session.flush()
+            accounts[username] = [board.id for board in boards]
+
+            # Roughly one session every other day, ending today
+            start = datetime.now() - timedelta(days=2 * session_count)
+            rows = []
+            for n in range(session_count):
+                rows.append({
+                    'user_id': user.id,
+                    'date': start + timedelta(days=2 * n, hours=rng.randint(6, 17)),
+                    'location': rng.choice(LOCATIONS),
+                    'board_id': rng.choice(accounts[username]),
+                    'wave_height': round(rng.uniform(1, 8), 1),
+                    'wave_quality': rng.choice(list(WaveQuality)),
+                    'session_duration': rng.randint(30, 180),
+                    'waves_caught': rng.randint(0, 30),
+                    'rating': rng.randint(1, 5),
+                    'notes': rng.choice(NOTES) or None,
+                })
+                if len(rows) == INSERT_BATCH:
+                    db_session.execute(SurfSession.__table__.insert(), rows)
+                    rows = []
+            if rows:
+                db_session.execute(SurfSession.__table__.insert(), rows)
+            print(f"Seeded {username} with {session_count:,} sessions")
+        daily_activity.rebuild(db_session)
+        db_session.commit()
+    finally:
+        db_session.close()
+    return accounts
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(port, workers, env, log_file):
+    """Start gunicorn and wait until it answers"""
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         '--timeout', '120', 'app:app'],
+        cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode} (see {log_file.name})")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/login')
+            connection.getresponse().read()
+            connection.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"gunicorn did not start within 60s (see {log_file.name})")
+
+class Client:
+    """One simulated user: a keep-alive connection plus the session cookie"""
+
+    def __init__(self, port, username, board_ids, rng):
+        self.port = port
+        self.username = username
+        self.board_ids = board_ids
+        self.rng = rng
+        self.cookies = SimpleCookie()
+        self.connection = None
+
+    def request(self, method, path, form=None):
+        """Send a request and return (status, headers); reconnects after connection errors"""
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={m.value}' for k, m in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(cookie)
+        return response.status, response.headers
+
+    def login(self):
+        status, headers = self.request('POST', '/login', {'username': self.username, 'password': PASSWORD})
+        if status != 302 or 'login' in headers.get('Location', ''):
+            raise RuntimeError(f"could not sign in as {self.username} (status {status})")
+
+    def run(self, route):
+        """Perform one request of `route`; returns True if it succeeded"""
+        method, path = ROUTES[route]
+        if route == 'add':
+            status, headers = self.request(method, path, {
+                'date': (datetime.now() - timedelta(days=self.rng.randint(0, 365))).strftime('%Y-%m-%d'),
+                'location': self.rng.choice(LOCATIONS),
+                'board': str(self.rng.choice(self.board_ids)) if self.board_ids else '',
+                'wave_height': str(round(self.rng.uniform(1, 8), 1)),
+                'session_duration': str(self.rng.randint(30, 180)),
+                'waves_caught': str(self.rng.randint(0, 30)),
+                'notes': self.rng.choice(NOTES),
+            })
+            # Failures also redirect, back to the form with a flash message
+            return status == 302 and not headers.get('Location', '').endswith('/add_session')
+        status, _ = self.request(method, path)
+        return status == 200
+
+def drive(port, accounts, concurrency, mix, warmup, duration):
+    """
+    Run the closed-loop clients
+    Returns ({route: [(latency seconds, ok)]}, [sign-in errors]): a client
+    that can't sign in doesn't run, and its error is reported instead.
+    """
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    samples = {route: [] for route in routes}
+    login_errors = []
+    lock = threading.Lock()
+    usernames = sorted(accounts)
+    start = time.monotonic()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        rng = random.Random(index)
+        username = usernames[index % len(usernames)]
+        client = Client(port, username, accounts[username], rng)
+        try:
+            client.login()
+        except (RuntimeError, OSError, http.client.HTTPException) as e:
+            with lock:
+                login_errors.append(f"client {index}: {e}")
+            return
+        own = {route: [] for route in routes}
+        while True:
+            route = rng.choices(routes, weights)[0]
+            started = time.monotonic()
+            if started >= stop_at:
+                break
+            try:
+                ok = client.run(route)
+            except (OSError, http.client.HTTPException):
+                ok = False
+            finished = time.monotonic()
+            if started >= measure_from:
+                own[route].append((finished - started, ok))
+        with lock:
+            for route, values in own.items():
+                samples[route].extend(values)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, login_errors
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(1, math.ceil(fraction * len(sorted_values))) - 1]
+
+def route_stats(values, duration):
+    """Throughput, latency percentiles and errors of [(latency seconds, ok)]"""
+    latencies = sorted(latency for latency, _ in values)
+    errors = sum(1 for _, ok in values if not ok)
+
+    def ms(fraction):
+        return round(percentile(latencies, fraction) * 1000, 1) if latencies else None
+
+    return {
+        'requests': len(values),
+        'throughput': round(len(values) / duration, 2),
+        'p50_ms': ms(0.50),
+        'p95_ms': ms(0.95),
+        'p99_ms': ms(0.99),
+        'errors': errors,
+        'error_rate': round(errors / len(values), 4) if values else 0,
+    }
+
+def summarize(samples, duration):
+    report = {route: route_stats(values, duration) for route, values in samples.items()}
+    report['all'] = route_stats([value for values in samples.values() for value in values], duration)
+    return report
+
+def print_report(report, args, clients):
+    print(f"\n{args.workers} workers, {clients} of {args.concurrency} clients ran, {args.duration}s "
+          f"(after {args.warmup}s warm-up), {args.sessions:,} sessions per user\n")
+    print(f"{'route':<10} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>8}")
+    for route, row in report.items():
+        def ms(value):
+            return f"{value:.1f}" if value is not None else '-'
+        print(f"{route:<10} {row['requests']:>9} {row['throughput']:>8.1f} {ms(row['p50_ms']):>8} "
+              f"{ms(row['p95_ms']):>8} {ms(row['p99_ms']):>8} {row['error_rate']:>8.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the web app under gunicorn")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument('--sessions', type=int, default=5000, help="synthetic sessions per user")
+    parser.add_argument('--users', type=int, default=1, help="load-test users the clients are spread over")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"route weights (default {DEFAULT_MIX})")
+    parser.add_argument('--database-url', help="database to use instead of a temporary SQLite file")
+    parser.add_argument('--json', metavar='FILE', help="also write the report as JSON, for comparing runs")
+    parser.add_argument('--max-p95', type=float, metavar='MS',
+                        help="exit with status 1 if any route's p95 latency is above this")
+    parser.add_argument('--max-error-rate', type=float, default=0.0,
+                        help="exit with status 1 if any route's error rate is above this (default 0)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='surftracker-load-') as tmp:
+        env = dict(os.environ)
+        env['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tmp, 'load_test.db')}"
+        env['SECRET_KEY'] = 'load-test'
+        env['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(tmp, 'metrics')
+        env.pop('SURFTRACKER_PROFILE', None)
+        os.environ['DATABASE_URL'] = env['DATABASE_URL']
+
+        started = time.perf_counter()
+        accounts = seed(args.users, args.sessions)
+        print(f"Seeding took {time.perf_counter() - started:.1f}s")
+
+        port = free_port()
+        with open(os.path.join(tmp, 'gunicorn.log'), 'w+') as log_file:
+            server = start_server(port, args.workers, env, log_file)
+            try:
+                print(f"Running load for {args.warmup + args.duration:.0f}s...")
+                samples, login_errors = drive(port, accounts, args.concurrency, args.mix, args.warmup, args.duration)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            if server.returncode not in (0, -15):
+                log_file.seek(0)
+                print(log_file.read()[-2000:])
+
+    report = summarize(samples, args.duration)
+    clients = args.concurrency - len(login_errors)
+    print_report(report, args, clients)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': {key: value for key, value in vars(args).items() if key != 'json'},
+                       'clients': clients, 'login_errors': login_errors, 'routes': report}, f, indent=2)
+    if login_errors:
+        # Fewer clients than asked for makes every other figure misleading
+        print(f"\n{len(login_errors)} client(s) could not sign in:")
+        for error in login_errors[:10]:
+            print(f"  {error}")
+        sys.exit(1)
+
+    failed = [route for route, row in report.items()
+              if row['error_rate'] > args.max_error_rate
+              or (args.max_p95 is not None and (row['p95_ms'] or 0) > args.max_p95)]
+    if failed:
+        print(f"\nOver the limits: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
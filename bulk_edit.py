@@ -0,0 +1,363 @@
+"""
+Bulk editing of surf sessions
+
+Either pick sessions with a filter (ids, date range, location, board) and
+apply one set of changes to all of them, or apply a patch file with
+per-session changes. Changes can set fields, add to numeric fields or scale
+them (e.g. durations entered in hours). Everything runs as set-based UPDATEs
+in one transaction.
+
+Every session has a version that is bumped on each update. Callers can pass
+the versions they last saw. If any session changed since, nothing is applied
+and the conflicts are reported (optimistic concurrency).
+
+Aggregates are updated incrementally:
+- daily_activity gets the net change per day
+- achievements move each edited session's counts and record values
+- edits that can't affect streaks, rolling averages or similarity search
+  (notes, ratings) don't force cached results to be rebuilt
+"""
+import json
+from sqlalchemy import and_, cast, func, or_, select, update, Integer
+from models import get_session, bump_data_version, SurfSession, WaveQuality
+from batch_ingest import _number, _parse_date, resolve_boards
+import achievements
+import daily_activity
+import notes_search
+
+# Fields that can be set, with (type, minimum, maximum) for numeric ones
+NUMERIC_FIELDS = {
+    'wave_height': (float, 0, 100),
+    'session_duration': (int, 0, 24 * 60),
+    'waves_caught': (int, 0, 10000),
+    'wind_speed': (float, 0, 200),
+    'tide_height': (float, -20, 30),
+    'water_temp': (float, 20, 110),
+    'rating': (int, 1, 5),
+}
+TEXT_FIELDS = {'location': 100, 'wind_direction': 50, 'notes': 500}
+SETTABLE_FIELDS = set(NUMERIC_FIELDS) | set(TEXT_FIELDS) | {'date', 'board', 'wave_quality'}
+
+# Changing these moves a session in daily_activity
+ACTIVITY_FIELDS = {'date', 'waves_caught', 'session_duration'}
+# Changing these can change counts or records in achievements
+ACHIEVEMENT_FIELDS = {'date', 'location', 'board_id', 'waves_caught', 'session_duration', 'wave_height'}
+# Changing these can change streaks and rolling averages (analytics.py) or
+# the conditions sessions are matched on (similarity.py)
+ANALYTICS_FIELDS = ACTIVITY_FIELDS | {'location', 'board_id', 'wave_height', 'tide_height', 'wind_speed', 'water_temp'}
+
+# Largest number of patches accepted in one request
+MAX_PATCHES = 1000
+
+class BulkEditError(ValueError):
+    """Raised when a bulk edit request is invalid; nothing was changed"""
+
+class ConflictError(Exception):
+    """Raised when sessions changed since the caller read them; nothing was changed"""
+    def __init__(self, conflicts):
+        super().__init__(f"{len(conflicts)} session(s) were changed by someone else")
+        self.conflicts = conflicts
+
+def parse_changes(db_session, user_id, changes):
+    """
+    Turn {"set": {...}, "add": {...}, "scale": {...}} into UPDATE values
+    Returns ({column name: value or SQL expression}, set of column names).
+    """
+    set_values = changes.get('set') or {}
+    add = changes.get('add') or {}
+    scale = changes.get('scale') or {}
+    if not all(isinstance(part, dict) for part in (set_values, add, scale)):
+        raise BulkEditError("set, add and scale must be objects")
+
+    errors = []
+    values = {}
+    for field in set_values:
+        if field not in SETTABLE_FIELDS:
+            errors.append(f"{field} can't be set")
+    for field in list(add) + list(scale):
+        if field not in NUMERIC_FIELDS or field == 'rating':
+            errors.append(f"{field} can't be adjusted")
+        elif field in set_values or (field in add and field in scale):
+            errors.append(f"{field} is changed more than once")
+
+    for field, (kind, minimum, maximum) in NUMERIC_FIELDS.items():
+        if field in set_values:
+            values[field] = _number(set_values, errors, field, kind, minimum, maximum)
+    for field, length in TEXT_FIELDS.items():
+        if field in set_values:
+            value = set_values[field]
+            value = str(value).strip()[:length] if value not in (None, '') else None
+            if value is None and field == 'location':
+                errors.append("location can't be empty")
+            values[field] = value
+    if 'date' in set_values:
+        try:
+            values['date'] = _parse_date(set_values['date'])
+        except ValueError:
+            errors.append("date must be YYYY-MM-DD or ISO 8601")
+    if 'wave_quality' in set_values:
+        quality = set_values['wave_quality']
+        try:
+            values['wave_quality'] = WaveQuality(str(quality).lower()) if quality else None
+        except ValueError:
+            errors.append(f"wave_quality must be one of {[q.value for q in WaveQuality]}")
+    if 'board' in set_values:
+        board = set_values['board']
+        if board in (None, ''):
+            values['board_id'] = None
+        else:
+            ref = int(board) if isinstance(board, int) or str(board).isdigit() else str(board).strip().lower()
+            values['board_id'] = resolve_boards(db_session, user_id, {ref}).get(ref)
+            if values['board_id'] is None:
+                errors.append(f"unknown board: {board}")
+
+    for field in add:
+        kind = NUMERIC_FIELDS.get(field, (float,))[0]
+        delta = _number(add, errors, field, kind)
+        if delta is not None:
+            values[field] = getattr(SurfSession, field) + delta
+    for field in scale:
+        multiplier = _number(scale, errors, field, float, 0)
+        if multiplier is not None:
+            scaled = getattr(SurfSession, field) * multiplier
+            values[field] = cast(func.round(scaled), Integer) if NUMERIC_FIELDS[field][0] is int else scaled
+
+    if errors:
+        raise BulkEditError('; '.join(errors))
+    if not values:
+        raise BulkEditError("No changes given")
+    return values, set(values)
+
+def parse_filter(db_session, user_id, filters):
+    """
+    Turn {"ids", "from", "to", "location", "board", "all"} into WHERE conditions
+    Dates are YYYY-MM-DD and "to" includes the whole day. An empty filter
+    must say "all": true, so a missing filter can't edit every session.
+    """
+    conditions = [SurfSession.user_id == user_id]
+    # A string would be iterated digit by digit, editing the wrong sessions
+    if filters.get('ids') is not None and not isinstance(filters['ids'], list):
+        raise BulkEditError("ids must be a list of session ids")
+    try:
+        if filters.get('ids') is not None:
+            conditions.append(SurfSession.id.in_([int(i) for i in filters['ids']]))
+        if filters.get('from'):
+            conditions.append(SurfSession.date >= notes_search.parse_date_filter(filters['from']))
+        if filters.get('to'):
+            conditions.append(SurfSession.date < notes_search.parse_date_filter(filters['to'], end=True))
+    except (TypeError, ValueError):
+        raise BulkEditError("ids must be numbers and dates YYYY-MM-DD")
+    if filters.get('location'):
+        conditions.append(func.lower(SurfSession.location) == str(filters['location']).strip().lower())
+    if filters.get('board'):
+        board = filters['board']
+        ref = int(board) if isinstance(board, int) or str(board).isdigit() else str(board).strip().lower()
+        board_id = resolve_boards(db_session, user_id, {ref}).get(ref)
+        if board_id is None:
+            raise BulkEditError(f"unknown board: {board}")
+        conditions.append(SurfSession.board_id == board_id)
+
+    if len(conditions) == 1 and filters.get('all') is not True:
+        raise BulkEditError('Give a filter, or "all": true to edit every session')
+    return conditions
+
+def _activity(row):
+    return (row.date, row.waves_caught, row.session_duration)
+
+def _run(db_session, user_id, edits, expected_versions, dry_run):
+    """
+    Apply [(conditions, values, fields)] in the caller's transaction
+    The matching rows are read (and locked, where the database supports it)
+    first, to check versions and to know what the aggregates held before.
+    """
+    tracked = (SurfSession.version, *[getattr(SurfSession, field) for field in achievements.FIELDS])
+    before = {row.id: row for row in db_session.execute(
+        select(*tracked)
+        .where(or_(*[and_(*conditions) for conditions, _, _ in edits]))
+        .with_for_update()
+    )}
+
+    conflicts = []
+    for session_id, version in (expected_versions or {}).items():
+        row = before.get(session_id)
+        if row is None or row.version != version:
+            conflicts.append({'id': session_id, 'expected_version': version,
+                              'current_version': row.version if row else None})
+    if conflicts:
+        raise ConflictError(conflicts)
+    if dry_run or not before:
+        return {'matched': len(before), 'updated': 0, 'sessions': [], 'achievements': []}
+
+    after = {}
+    fields = set()
+    for conditions, values, edit_fields in edits:
+        statement = (update(SurfSession).where(*conditions)
+                     .values(version=SurfSession.version + 1, **values)
+                     .returning(*tracked)
+                     .execution_options(synchronize_session=False))
+        for row in db_session.execute(statement):
+            if row.id not in before or row.id in after:
+                # Matched by a session added since it was read, or by two patches
+                raise ConflictError([{'id': row.id, 'expected_version': None, 'current_version': row.version}])
+            after[row.id] = row
+        fields |= edit_fields
+
+    if fields & ACTIVITY_FIELDS:
+        daily_activity.record_edits(db_session, user_id,
+                                    [_activity(before[i]) for i in after],
+                                    [_activity(row) for row in after.values()])
+    earned = []
+    if fields & ACHIEVEMENT_FIELDS:
+        earned = achievements.record_edits(db_session, user_id,
+                                           [achievements.session_values(before[i]) for i in after],
+                                           [achievements.session_values(row) for row in after.values()])
+    bump_data_version(db_session, edited=bool(fields & ANALYTICS_FIELDS), user_id=user_id)
+    return {
+        'matched': len(before),
+        'updated': len(after),
+        'sessions': [{'id': row.id, 'version': row.version} for row in after.values()],
+        'achievements': [award['title'] for award in earned],
+    }
+
+def _versions(mapping):
+    try:
+        return {int(session_id): int(version) for session_id, version in (mapping or {}).items()}
+    except (TypeError, ValueError, AttributeError):
+        raise BulkEditError("expected_versions must map session ids to versions")
+
+def bulk_edit(user_id, filters, changes, expected_versions=None, dry_run=False):
+    """
+    Apply one set of changes to every session of the user's matching `filters`
+    Returns {"matched", "updated", "sessions": [{"id", "version"}], "achievements": [titles earned]}.
+    Raises BulkEditError or ConflictError without changing anything.
+    """
+    db_session = get_session()
+    try:
+        conditions = parse_filter(db_session, user_id, filters)
+        values, fields = parse_changes(db_session, user_id, changes)
+        result = _run(db_session, user_id, [(conditions, values, fields)], _versions(expected_versions), dry_run)
+        if dry_run:
+            db_session.rollback()
+        else:
+            db_session.commit()
+        return result
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+def apply_patches(user_id, patches, dry_run=False):
+    """
+    Apply per-session changes: [{"id", "version" (optional), "set", "add", "scale"}]
+    Patches with identical changes share one UPDATE. All or nothing, like bulk_edit().
+    """
+    if not isinstance(patches, list) or not patches:
+        raise BulkEditError("Expected a non-empty array of patches")
+    if len(patches) > MAX_PATCHES:
+        raise BulkEditError(f"Too many patches in one request (max {MAX_PATCHES})")
+
+    db_session = get_session()
+    try:
+        groups = {}
+        patched = set()
+        expected_versions = {}
+        for index, patch in enumerate(patches):
+            if not isinstance(patch, dict) or not isinstance(patch.get('id'), int):
+                raise BulkEditError(f"patch {index}: id is required")
+            if patch['id'] in patched:
+                raise BulkEditError(f"patch {index}: session {patch['id']} is patched twice")
+            patched.add(patch['id'])
+            if patch.get('version') is not None:
+                expected_versions[patch['id']] = patch['version']
+            changes = {key: patch.get(key) for key in ('set', 'add', 'scale')}
+            key = json.dumps(changes, sort_keys=True, default=str)
+            groups.setdefault(key, (changes, []))[1].append(patch['id'])
+
+        edits = []
+        for changes, ids in groups.values():
+            try:
+                values, fields = parse_changes(db_session, user_id, changes)
+            except BulkEditError as e:
+                raise BulkEditError(f"sessions {ids}: {e}")
+            edits.append(([SurfSession.user_id == user_id, SurfSession.id.in_(ids)], values, fields))
+
+        result = _run(db_session, user_id, edits, _versions(expected_versions), dry_run)
+        # Ids that don't exist (or belong to someone else) are conflicts too
+        missing = [] if dry_run else sorted(patched - {s['id'] for s in result['sessions']})
+        if missing:
+            raise ConflictError([{'id': i, 'expected_version': expected_versions.get(i), 'current_version': None}
+                                 for i in missing])
+        if dry_run:
+            db_session.rollback()
+        else:
+            db_session.commit()
+        return result
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+def _assignments(pairs, option):
+    """Parse repeated field=value command-line options into a dict"""
+    parsed = {}
+    for pair in pairs or []:
+        field, sep, value = pair.partition('=')
+        if not sep:
+            raise SystemExit(f"{option} expects field=value, got '{pair}'")
+        parsed[field.strip()] = value
+    return parsed
+
+def main():
+    import argparse
+    import users
+
+    parser = argparse.ArgumentParser(
+        description="Edit many sessions at once",
+        epilog="e.g. --from 2024-05-01 --to 2024-05-31 --set board=Zen, or --scale session_duration=60"
+    )
+    parser.add_argument('--patch', metavar='FILE', help="JSON file of per-session patches")
+    parser.add_argument('--ids', help="comma-separated session ids")
+    parser.add_argument('--from', dest='start_date', help="YYYY-MM-DD")
+    parser.add_argument('--to', dest='end_date', help="YYYY-MM-DD (inclusive)")
+    parser.add_argument('--location')
+    parser.add_argument('--board', help="board id or name the sessions currently use")
+    parser.add_argument('--all', action='store_true', help="edit every session")
+    parser.add_argument('--set', action='append', metavar='FIELD=VALUE')
+    parser.add_argument('--add', action='append', metavar='FIELD=AMOUNT')
+    parser.add_argument('--scale', action='append', metavar='FIELD=FACTOR')
+    parser.add_argument('--dry-run', action='store_true', help="only report how many sessions match")
+    args = parser.parse_args()
+
+    user_id = users.cli_user_id()
+    try:
+        if args.patch:
+            with open(args.patch) as f:
+                result = apply_patches(user_id, json.load(f), dry_run=args.dry_run)
+        else:
+            filters = {'from': args.start_date, 'to': args.end_date, 'location': args.location,
+                       'board': args.board, 'all': args.all}
+            if args.ids:
+                filters['ids'] = args.ids.split(',')
+            changes = {'set': _assignments(args.set, '--set'), 'add': _assignments(args.add, '--add'),
+                       'scale': _assignments(args.scale, '--scale')}
+            result = bulk_edit(user_id, filters, changes, dry_run=args.dry_run)
+    except BulkEditError as e:
+        raise SystemExit(f"Error: {e}")
+    except ConflictError as e:
+        print(f"Nothing was changed: {e}")
+        for conflict in e.conflicts:
+            print(f"  session {conflict['id']}: expected version {conflict['expected_version']}, "
+                  f"now {conflict['current_version']}")
+        raise SystemExit(1)
+
+    if args.dry_run:
+        print(f"{result['matched']} session(s) would be edited")
+    else:
+        print(f"Updated {result['updated']} session(s)")
+        for title in result['achievements']:
+            print(f"Achievement: {title}")
+
+if __name__ == "__main__":
+    main()
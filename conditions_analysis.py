@@ -0,0 +1,129 @@
+"""
+How conditions relate to outcomes ("what conditions work best for me")
+
+Correlations between conditions (wave height, quality, wind, tide, water
+temperature) and outcomes (waves caught, rating, duration, waves per hour),
+plus outcome tables binned by wave height x board x spot. Everything is
+computed in one vectorized pass with pandas. Results are cached per user in
+analytics_state and in-process, keyed on the user's surf_sessions data
+version, so they are only recomputed after their sessions change.
+"""
+import json
+import threading
+from datetime import datetime
+from sqlalchemy import select
+from models import get_session, get_data_version, AnalyticsState, SurfSession, Board
+
+STATE_NAME = 'conditions'
+
+CONDITIONS = ['wave_height', 'wave_quality_score', 'wind_speed', 'tide_height', 'water_temp']
+OUTCOMES = ['waves_caught', 'rating', 'session_duration', 'waves_per_hour']
+WAVE_QUALITY_SCORES = {'POOR': 1, 'FAIR': 2, 'GOOD': 3, 'EXCELLENT': 4}
+
+# Wave height bins in feet; the last bin is open-ended
+HEIGHT_BINS = [0, 1, 2, 3, 4, 6, float('inf')]
+HEIGHT_LABELS = ['0-1ft', '1-2ft', '2-3ft', '3-4ft', '4-6ft', '6ft+']
+
+# Combinations with fewer sessions than this are left out of the "best" list
+MIN_SESSIONS = 3
+
+# Per-process cache: {user id: (data version, result)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _sessions_query(user_id):
+    return (
+        select(SurfSession.location, Board.name.label('board_name'),
+               SurfSession.wave_height, SurfSession.wave_quality, SurfSession.wind_speed,
+               SurfSession.tide_height, SurfSession.water_temp,
+               SurfSession.waves_caught, SurfSession.rating, SurfSession.session_duration)
+        .outerjoin(Board, SurfSession.board_id == Board.id)
+        .where(SurfSession.user_id == user_id)
+    )
+
+def _records(df):
+    """DataFrame rows as JSON-ready dicts (NaN becomes None)"""
+    return json.loads(df.to_json(orient='records'))
+
+def compute(df):
+    """Run the whole analysis over a DataFrame of sessions"""
+    import numpy as np
+    import pandas as pd
+
+    if df.empty:
+        return {'correlations': {}, 'by_board': {}, 'by_spot': {}, 'binned': [], 'best': [], 'sessions': 0}
+
+    df = df.copy()
+    # Enum values come back as names (PostgreSQL) or WaveQuality members
+    quality = df['wave_quality'].map(lambda q: getattr(q, 'name', q))
+    df['wave_quality_score'] = quality.map(WAVE_QUALITY_SCORES)
+    hours = df['session_duration'].where(df['session_duration'] > 0) / 60
+    df['waves_per_hour'] = df['waves_caught'] / hours
+    df['board_name'] = df['board_name'].fillna('Unknown')
+    numeric = df[CONDITIONS + OUTCOMES].apply(pd.to_numeric, errors='coerce')
+
+    def correlations(frame):
+        """Pearson correlation of each condition with each outcome"""
+        matrix = frame.corr(min_periods=MIN_SESSIONS).loc[CONDITIONS, OUTCOMES]
+        return {condition: {outcome: (None if np.isnan(value) else round(float(value), 2))
+                            for outcome, value in row.items()}
+                for condition, row in matrix.iterrows()}
+
+    grouped = numeric.assign(board_name=df['board_name'], location=df['location'])
+    by_board = {name: correlations(group[CONDITIONS + OUTCOMES])
+                for name, group in grouped.groupby('board_name') if len(group) >= MIN_SESSIONS}
+    by_spot = {name: correlations(group[CONDITIONS + OUTCOMES])
+               for name, group in grouped.groupby('location') if len(group) >= MIN_SESSIONS}
+
+    grouped['height_bin'] = pd.cut(numeric['wave_height'], bins=HEIGHT_BINS, labels=HEIGHT_LABELS,
+                                   right=False)
+    binned = (grouped.groupby(['height_bin', 'board_name', 'location'], observed=True)
+              .agg(sessions=('waves_caught', 'size'),
+                   avg_waves=('waves_caught', 'mean'),
+                   avg_waves_per_hour=('waves_per_hour', 'mean'),
+                   avg_rating=('rating', 'mean'),
+                   avg_duration=('session_duration', 'mean'))
+              .round(1)
+              .reset_index())
+    binned['height_bin'] = binned['height_bin'].astype(str)
+
+    best = (binned[binned['sessions'] >= MIN_SESSIONS]
+            .sort_values(['avg_waves_per_hour', 'avg_waves'], ascending=False)
+            .head(10))
+
+    return {
+        'correlations': correlations(numeric),
+        'by_board': by_board,
+        'by_spot': by_spot,
+        'binned': _records(binned),
+        'best': _records(best),
+        'sessions': len(df),
+    }
+
+def get_analysis(user_id):
+    """Return the analysis of a user's sessions, recomputing only if their sessions changed"""
+    state_name = f"{STATE_NAME}:{user_id}"
+    db_session = get_session()
+    try:
+        version, _ = get_data_version(db_session, user_id=user_id)
+        cached_version, cached = _cache.get(user_id, (None, None))
+        if cached_version == version:
+            return cached
+
+        with _cache_lock:
+            stored = db_session.get(AnalyticsState, state_name)
+            if stored is not None and stored.data_version == version:
+                result = json.loads(stored.state)
+            else:
+                import pandas as pd
+                result = compute(pd.read_sql(_sessions_query(user_id), db_session.bind))
+                edit_version, _ = get_data_version(db_session, 'surf_sessions_edits', user_id=user_id)
+                db_session.merge(AnalyticsState(
+                    name=state_name, state=json.dumps(result), data_version=version,
+                    edit_version=edit_version, last_session_id=0, updated_at=datetime.utcnow()
+                ))
+                db_session.commit()
+            _cache[user_id] = (version, result)
+        return result
+    finally:
+        db_session.close()
@@ -0,0 +1,254 @@
+"""
+Local tide and weather history, and backfilling sessions from it
+
+Observations are bulk-loaded per spot from local exports into the
+condition_observations table (indexed by lower(spot) and time, since spots
+are matched case-insensitively):
+- generic CSV with a time column and any of tide_height (ft), wind_speed
+  (mph), wind_direction, water_temp (F)
+- NOAA CO-OPS tide CSV exports ("Date Time" plus "Water Level" or
+  "Prediction", in English units)
+- NOAA NDBC standard meteorological files (WDIR/WSPD/WTMP/TIDE columns)
+
+backfill() fills tide_height, wind_speed, wind_direction and water_temp on
+sessions (of every user) from the latest observation at or before each
+session at the same spot. It uses one vectorized as-of join per field rather
+than a lookup per session. Importers call fill_conditions() before committing
+their inserts instead, so new sessions arrive with conditions and aren't
+counted as edits.
+"""
+from datetime import timedelta
+from sqlalchemy import bindparam, delete, func, insert, or_, select, update
+from models import get_session, bump_data_version, ConditionObservation, SurfSession
+
+FIELDS = ['tide_height', 'wind_speed', 'wind_direction', 'water_temp']
+INSERT_CHUNK_SIZE = 5000
+COMPASS_POINTS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                  'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+
+def _compass(degrees):
+    """Convert a direction in degrees (Series) to a 16-point compass label"""
+    index = ((degrees % 360) / 22.5 + 0.5).floordiv(1).mod(16)
+    return index.map(lambda i: COMPASS_POINTS[int(i)] if i == i else None)
+
+def detect_format(path):
+    with open(path, 'r', errors='replace') as f:
+        first_line = f.readline()
+    if first_line.startswith('#YY') or first_line.startswith('YY'):
+        return 'ndbc'
+    if 'Date Time' in first_line:
+        return 'coops'
+    return 'csv'
+
+def _read_ndbc(path):
+    import pandas as pd
+    missing = ['MM', 99.0, 999.0, 9999.0]
+    df = pd.read_csv(path, sep=r'\s+', skiprows=[1], na_values=missing)
+    df.columns = [c.lstrip('#') for c in df.columns]
+    year = df['YY'] if 'YY' in df.columns else df['YYYY']
+    observed_at = pd.to_datetime(dict(year=year, month=df['MM'], day=df['DD'],
+                                      hour=df['hh'], minute=df.get('mm', 0)))
+    out = pd.DataFrame({'observed_at': observed_at})
+    if 'WSPD' in df.columns:
+        out['wind_speed'] = df['WSPD'] * 2.23694  # m/s -> mph
+    if 'WDIR' in df.columns:
+        out['wind_direction'] = _compass(df['WDIR'])
+    if 'WTMP' in df.columns:
+        out['water_temp'] = df['WTMP'] * 9 / 5 + 32  # C -> F
+    if 'TIDE' in df.columns:
+        out['tide_height'] = df['TIDE']
+    return out
+
+def _read_coops(path):
+    import pandas as pd
+    df = pd.read_csv(path, skipinitialspace=True)
+    df.columns = [c.strip() for c in df.columns]
+    level = next(c for c in ('Water Level', 'Prediction', 'Verified (ft)', 'Predicted (ft)') if c in df.columns)
+    return pd.DataFrame({
+        'observed_at': pd.to_datetime(df['Date Time']),
+        'tide_height': pd.to_numeric(df[level], errors='coerce'),
+    })
+
+def _read_csv(path):
+    import pandas as pd
+    df = pd.read_csv(path)
+    df.columns = [c.strip().lower() for c in df.columns]
+    time_column = next(c for c in ('observed_at', 'time', 'datetime', 'date') if c in df.columns)
+    out = pd.DataFrame({'observed_at': pd.to_datetime(df[time_column])})
+    for field in FIELDS:
+        if field in df.columns:
+            out[field] = df[field] if field == 'wind_direction' else pd.to_numeric(df[field], errors='coerce')
+    return out
+
+READERS = {'ndbc': _read_ndbc, 'coops': _read_coops, 'csv': _read_csv}
+
+def read_observations(path, fmt='auto', timezone=None):
+    """
+    Parse an export into a DataFrame of observed_at plus condition columns
+    If `timezone` is given, times in the file are taken as UTC and converted
+    to that zone's local time (sessions are stored in local time).
+    """
+    fmt = detect_format(path) if fmt == 'auto' else fmt
+    df = READERS[fmt](path).dropna(subset=['observed_at'])
+    if timezone:
+        df['observed_at'] = (df['observed_at'].dt.tz_localize('UTC')
+                             .dt.tz_convert(timezone).dt.tz_localize(None))
+    for field in FIELDS:
+        if field not in df.columns:
+            df[field] = None
+    return df.sort_values('observed_at'), fmt
+
+def load_observations(spot, path, fmt='auto', source=None, timezone=None):
+    """Replace this spot's observations from `source` over the file's time range with the file's rows"""
+    df, fmt = read_observations(path, fmt, timezone)
+    source = source or fmt
+    if df.empty:
+        print(f"No observations found in {path}")
+        return 0
+
+    rows = df[['observed_at'] + FIELDS].astype(object).where(df[['observed_at'] + FIELDS].notna(), None)
+    rows = rows.assign(spot=spot, source=source).to_dict('records')
+
+    db_session = get_session()
+    try:
+        db_session.execute(
+            delete(ConditionObservation)
+            .where(func.lower(ConditionObservation.spot) == spot.lower())
+            .where(ConditionObservation.source == source)
+            .where(ConditionObservation.observed_at.between(df['observed_at'].min(), df['observed_at'].max()))
+        )
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            db_session.execute(insert(ConditionObservation), rows[start:start + INSERT_CHUNK_SIZE])
+        db_session.commit()
+        print(f"Loaded {len(rows)} {source} observations for {spot}")
+        return len(rows)
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+def fill_conditions(db_session, session_ids=None, max_gap_hours=6, overwrite=False):
+    """
+    Fill condition fields on sessions from the nearest earlier observation,
+    as part of the caller's transaction (sessions it has just inserted are
+    seen too)
+    Observations more than `max_gap_hours` before a session are ignored.
+    Only empty fields are filled unless `overwrite` is set.
+    Returns the ids of the users whose sessions were updated, with a count
+    of updated sessions for each. Data versions are left to the caller.
+    """
+    import pandas as pd
+
+    query = select(SurfSession.id, SurfSession.user_id, SurfSession.location, SurfSession.date,
+                   *[getattr(SurfSession, field) for field in FIELDS])
+    if session_ids is not None:
+        if not session_ids:
+            return {}
+        query = query.where(SurfSession.id.in_(session_ids))
+    if not overwrite:
+        query = query.where(or_(*[getattr(SurfSession, field).is_(None) for field in FIELDS]))
+
+    connection = db_session.connection()
+    sessions = pd.read_sql(query, connection)
+    if sessions.empty:
+        print("No sessions to backfill")
+        return {}
+    sessions['spot_key'] = sessions['location'].str.strip().str.lower()
+    sessions = sessions.sort_values('date')
+
+    gap = timedelta(hours=max_gap_hours)
+    observations = pd.read_sql(
+        select(func.lower(ConditionObservation.spot).label('spot_key'),
+               ConditionObservation.observed_at, *[getattr(ConditionObservation, f) for f in FIELDS])
+        .where(func.lower(ConditionObservation.spot).in_(sessions['spot_key'].unique().tolist()))
+        .where(ConditionObservation.observed_at.between(sessions['date'].min() - gap, sessions['date'].max())),
+        connection
+    )
+    if observations.empty:
+        print("No observations match these sessions")
+        return {}
+    observations['spot_key'] = observations['spot_key'].str.strip()
+    observations = observations.sort_values('observed_at')
+
+    filled = sessions.set_index('id')[FIELDS].copy()
+    for field in FIELDS:
+        # Latest observation of this field at or before each session, per spot
+        available = observations.loc[observations[field].notna(), ['spot_key', 'observed_at', field]]
+        if available.empty:
+            continue
+        matched = pd.merge_asof(
+            sessions[['id', 'spot_key', 'date']], available,
+            left_on='date', right_on='observed_at', by='spot_key',
+            direction='backward', tolerance=pd.Timedelta(gap)
+        ).set_index('id')[field]
+        current = filled[field]
+        if overwrite:
+            filled[field] = matched.where(matched.notna(), current)
+        else:
+            filled[field] = current.where(current.notna(), matched)
+
+    original = sessions.set_index('id')[FIELDS]
+    unchanged = ((filled == original) | (filled.isna() & original.isna())).all(axis=1)
+    changed = filled[~unchanged]
+    if changed.empty:
+        print("Sessions are already up to date")
+        return {}
+
+    updates = changed.astype(object).where(changed.notna(), None).reset_index().to_dict('records')
+    # One UPDATE sent as an executemany, bumping each row's version like any other edit
+    table = SurfSession.__table__
+    db_session.execute(
+        update(table).where(table.c.id == bindparam('session_id'))
+        .values(version=table.c.version + 1, **{field: bindparam(f'new_{field}') for field in FIELDS}),
+        [dict({f'new_{field}': row[field] for field in FIELDS}, session_id=row['id']) for row in updates]
+    )
+    print(f"Backfilled conditions for {len(updates)} sessions")
+    # Observations are shared, so one backfill can touch several users' sessions
+    counts = sessions.loc[sessions['id'].isin(changed.index), 'user_id'].value_counts()
+    return {int(user_id): int(count) for user_id, count in counts.items()}
+
+def backfill(session_ids=None, max_gap_hours=6, overwrite=False):
+    """
+    Fill condition fields on already stored sessions (see fill_conditions)
+    These are edits, so caches built from the sessions are told to rebuild.
+    Returns the number of sessions updated.
+    """
+    db_session = get_session()
+    try:
+        updated = fill_conditions(db_session, session_ids, max_gap_hours, overwrite)
+        for user_id in updated:
+            bump_data_version(db_session, edited=True, user_id=user_id)
+        db_session.commit()
+        return sum(updated.values())
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load tide/weather history and backfill sessions")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('load', help="load observations for a spot from a file")
+    load.add_argument('spot', help="spot name, as used for session locations")
+    load.add_argument('file')
+    load.add_argument('--format', choices=['auto'] + list(READERS), default='auto')
+    load.add_argument('--source', help="label for these rows (defaults to the format)")
+    load.add_argument('--timezone', help="convert UTC times in the file to this zone, e.g. America/Los_Angeles")
+
+    fill = commands.add_parser('backfill', help="fill session conditions from stored observations")
+    fill.add_argument('--max-gap-hours', type=float, default=6)
+    fill.add_argument('--overwrite', action='store_true', help="replace values already on sessions")
+
+    args = parser.parse_args()
+    if args.command == 'load':
+        load_observations(args.spot, args.file, args.format, args.source, args.timezone)
+    else:
+        backfill(max_gap_hours=args.max_gap_hours, overwrite=args.overwrite)
+
+if __name__ == "__main__":
+    main()
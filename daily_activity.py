@@ -0,0 +1,153 @@
+"""
+Per-day activity totals behind the calendar heatmap
+
+daily_activity holds one row per user per day with sessions, waves and
+minutes. Writers call record_sessions / record_edit in the same transaction
+as the session change, so the calendar can read a user's year with one
+primary-key range scan instead of grouping their sessions.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from models import DailyActivity, SurfSession
+
+def _update_then_insert(db_session, user_id, totals):
+    """
+    Upsert for databases without ON CONFLICT: lock the user's existing days,
+    add onto those and insert the rest
+    """
+    existing = set(db_session.execute(
+        select(DailyActivity.day)
+        .where(DailyActivity.user_id == user_id, DailyActivity.day.in_(list(totals)))
+        .with_for_update()
+    ).scalars())
+    rows = [{'key_user_id': user_id, 'key_day': day, 'add_sessions': sessions,
+             'add_waves': waves, 'add_minutes': minutes}
+            for day, (sessions, waves, minutes) in totals.items()]
+    updates = [row for row in rows if row['key_day'] in existing]
+    inserts = [row for row in rows if row['key_day'] not in existing]
+    if updates:
+        # One UPDATE sent as an executemany; adding onto the locked row keeps concurrent writers' totals
+        table = DailyActivity.__table__
+        db_session.execute(
+            update(table).where(table.c.user_id == bindparam('key_user_id'), table.c.day == bindparam('key_day'))
+            .values(sessions=table.c.sessions + bindparam('add_sessions'),
+                    waves=table.c.waves + bindparam('add_waves'),
+                    minutes=table.c.minutes + bindparam('add_minutes')),
+            updates
+        )
+    if inserts:
+        db_session.execute(insert(DailyActivity), [
+            {'user_id': row['key_user_id'], 'day': row['key_day'], 'sessions': row['add_sessions'],
+             'waves': row['add_waves'], 'minutes': row['add_minutes']}
+            for row in inserts
+        ])
+
+def _upsert(db_session, user_id, totals):
+    """Add {day: [sessions, waves, minutes]} onto the user's daily_activity (one statement on PostgreSQL and SQLite)"""
+    if not totals:
+        return
+    dialect = db_session.bind.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        _update_then_insert(db_session, user_id, totals)
+        return
+
+    statement = dialect_insert(DailyActivity)
+    statement = statement.on_conflict_do_update(
+        index_elements=[DailyActivity.user_id, DailyActivity.day],
+        set_={
+            'sessions': DailyActivity.sessions + statement.excluded.sessions,
+            'waves': DailyActivity.waves + statement.excluded.waves,
+            'minutes': DailyActivity.minutes + statement.excluded.minutes,
+        }
+    )
+    db_session.execute(statement, [
+        {'user_id': user_id, 'day': day, 'sessions': sessions, 'waves': waves, 'minutes': minutes}
+        for day, (sessions, waves, minutes) in totals.items()
+    ])
+
+def _count(value):
+    """Treat missing values (None or NaN from pandas) as zero"""
+    return int(value) if value is not None and value == value else 0
+
+def _add_totals(totals, sessions, sign):
+    for when, waves, minutes in sessions:
+        day_totals = totals[when.date() if hasattr(when, 'date') else when]
+        day_totals[0] += sign
+        day_totals[1] += sign * _count(waves)
+        day_totals[2] += sign * _count(minutes)
+
+def record_sessions(db_session, user_id, sessions, sign=1):
+    """
+    Add (or with sign=-1, remove) one user's sessions from their daily totals
+    `sessions` is an iterable of (date, waves_caught, session_duration).
+    """
+    totals = defaultdict(lambda: [0, 0, 0])
+    _add_totals(totals, sessions, sign)
+    _upsert(db_session, user_id, totals)
+
+def record_edit(db_session, user_id, before, after):
+    """Move a session's contribution from its old (date, waves, minutes) to its new ones"""
+    record_edits(db_session, user_id, [before], [after])
+
+def record_edits(db_session, user_id, before, after):
+    """Move many sessions' contributions at once, with one upsert of the net change per day"""
+    totals = defaultdict(lambda: [0, 0, 0])
+    _add_totals(totals, before, -1)
+    _add_totals(totals, after, 1)
+    _upsert(db_session, user_id, {day: t for day, t in totals.items() if any(t)})
+
+def rebuild(db_session):
+    """Recompute the whole table from surf_sessions (for backfills and repairs)"""
+    day = func.date(SurfSession.date)
+    db_session.execute(delete(DailyActivity))
+    db_session.execute(insert(DailyActivity).from_select(
+        ['user_id', 'day', 'sessions', 'waves', 'minutes'],
+        select(SurfSession.user_id, day, func.count(),
+               func.coalesce(func.sum(SurfSession.waves_caught), 0),
+               func.coalesce(func.sum(SurfSession.session_duration), 0))
+        .group_by(SurfSession.user_id, day)
+    ))
+
+def get_activity(db_session, user_id, start_year, end_year):
+    """Return {day: (sessions, waves, minutes)} for whole years, via one range scan"""
+    rows = db_session.execute(
+        select(DailyActivity.day, DailyActivity.sessions, DailyActivity.waves, DailyActivity.minutes)
+        .where(DailyActivity.user_id == user_id)
+        .where(DailyActivity.day >= date(start_year, 1, 1))
+        .where(DailyActivity.day < date(end_year + 1, 1, 1))
+    ).all()
+    return {row.day: (row.sessions, row.waves, row.minutes) for row in rows if row.sessions > 0}
+
+METRICS = {'sessions': 0, 'waves': 1, 'minutes': 2}
+
+def build_calendar(activity, year, metric='sessions'):
+    """
+    Lay out one year as a list of week columns (Monday to Sunday)
+    Each cell is None (outside the year) or {'day', 'value', 'level'} with a
+    colour level from 0 (no activity) to 4.
+    """
+    index = METRICS[metric]
+    first = date(year, 1, 1)
+    last = date(year, 12, 31)
+    values = {day: totals[index] for day, totals in activity.items() if first <= day <= last}
+    peak = max(values.values(), default=0)
+
+    weeks = []
+    day = first - timedelta(days=first.weekday())  # Monday on or before Jan 1
+    while day <= last:
+        week = []
+        for _ in range(7):
+            if first <= day <= last:
+                value = values.get(day, 0)
+                level = 0 if not value or not peak else min(4, 1 + (4 * value - 1) // peak)
+                week.append({'day': day, 'value': value, 'level': level})
+            else:
+                week.append(None)
+            day += timedelta(days=1)
+        weeks.append(week)
+    return weeks
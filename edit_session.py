@@ -1,9 +1,14 @@
-from models import get_session, SurfSession
+from models import get_session, bump_data_version, SurfSession
 from datetime import datetime
+from sqlalchemy.orm.exc import StaleDataError
+import achievements
+import daily_activity
+import users
 
-def show_sessions(db_session, limit=10):
-    """Show the most recent sessions"""
-    sessions = db_session.query(SurfSession).order_by(SurfSession.date.desc()).limit(limit).all()
+def show_sessions(db_session, user_id, limit=10):
+    """Show the user's most recent sessions"""
+    sessions = (db_session.query(SurfSession).filter(SurfSession.user_id == user_id)
+                .order_by(SurfSession.date.desc()).limit(limit).all())
     
     print("\nRecent Sessions:")
     print("---------------")
@@ -20,9 +25,10 @@ def edit_session():
     """Edit an existing surf session"""
     db_session = get_session()
     try:
+        user_id = users.cli_user_id(db_session)
         while True:
             # Show recent sessions
-            sessions = show_sessions(db_session)
+            sessions = show_sessions(db_session, user_id)
             
             # Get session selection
             print("\nEnter the number of the session to edit (or 'q' to quit):")
@@ -45,6 +51,9 @@ def edit_session():
                     print(f"Waves Caught: {session.waves_caught or 'Not recorded'}")
                     print(f"Current notes: {session.notes}")
                     
+                    before = (session.date, session.waves_caught, session.session_duration)
+                    before_values = achievements.session_values(session)
+
                     # Get new values
                     print("\nEnter new values (or press Enter to keep current value)")
                     
@@ -69,9 +78,23 @@ def edit_session():
                         except ValueError:
                             print("Invalid number, keeping current value")
                     
-                    # Save changes
-                    db_session.commit()
+                    # Save changes (notes-only edits leave the analytics state incremental)
+                    after = (session.date, session.waves_caught, session.session_duration)
+                    try:
+                        daily_activity.record_edit(db_session, user_id, before, after)
+                        # These statements flush the edit, so a concurrent change can surface here too
+                        earned = achievements.record_edits(db_session, user_id, [before_values],
+                                                           [achievements.session_values(session)])
+                        bump_data_version(db_session, edited=after != before, user_id=user_id)
+                        db_session.commit()
+                    except StaleDataError:
+                        # Someone else (e.g. a bulk edit) changed the session since it was shown
+                        db_session.rollback()
+                        print("\nThis session was changed elsewhere while you were editing; nothing was saved.")
+                        continue
                     print("\nSession updated successfully!")
+                    for award in earned:
+                        print(f"Achievement: {award['title']}")
                     
                     # Show updated session
                     print("\nUpdated session details:")
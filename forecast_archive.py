@@ -0,0 +1,329 @@
+"""
+Historical forecast archive and forecast accuracy
+
+Forecast snapshots (spot, issue time, valid time, predicted wave height) are
+ingested from local CSV or JSON files. Instead of one row per forecast hour
+they are stored in forecast_chunks, one row per spot per month of valid
+time. Each column is kept as a compressed array:
+- issue time: int32 minutes since the epoch
+- lead: int16 minutes from issue to valid time
+- predicted height: float32
+
+Accuracy is scored against the wave heights logged on sessions. For every
+session, each forecast run issued before it is matched to the forecast hour
+nearest the session start, using one vectorized as-of join. Bias and MAE are
+then reported by lead time and by spot. The archive is shared by all users;
+accuracy is scored against each user's own sessions and cached per user in
+analytics_state and in-process, keyed on their session data version and the
+forecast data version.
+"""
+import json
+import threading
+import zlib
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, func
+from models import get_session, get_data_version, bump_data_version, AnalyticsState, ForecastChunk, SurfSession
+
+STATE_NAME = 'forecast_accuracy'
+VERSION_NAME = 'forecasts'
+
+# Leads must fit in an int16 number of minutes (about 22 days)
+MAX_LEAD_MINUTES = 2 ** 15 - 1
+# A forecast hour further than this from the session start is not compared
+MATCH_TOLERANCE = timedelta(minutes=90)
+
+HEIGHT_COLUMNS = ['wave_height', 'predicted_height', 'height']
+
+# Per-process cache: {user id: ((sessions version, forecasts version), result)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _encode(values, dtype):
+    import numpy as np
+    return zlib.compress(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+def _decode(blob, dtype):
+    import numpy as np
+    return np.frombuffer(zlib.decompress(blob), dtype=dtype)
+
+def _decode_chunk(chunk):
+    """A stored chunk as a DataFrame of spot, issue_time, valid_time, wave_height"""
+    import pandas as pd
+    issue = _decode(chunk.issue_times, 'int32').astype('int64')
+    lead = _decode(chunk.lead_minutes, 'int16').astype('int64')
+    return pd.DataFrame({
+        'spot': chunk.spot,
+        'issue_time': pd.to_datetime(issue, unit='m'),
+        'valid_time': pd.to_datetime(issue + lead, unit='m'),
+        'wave_height': _decode(chunk.heights, 'float32'),
+    })
+
+def read_forecast_file(path, spot=None):
+    """
+    Read a forecast export into spot, issue_time, valid_time, wave_height
+    CSV files need issue_time, valid_time and a wave_height (or
+    predicted_height) column, plus a spot column unless `spot` is given.
+    JSON files hold one snapshot, or a list of them, shaped like
+    {"spot": ..., "issued": ..., "forecast": [{"time": ..., "wave_height": ...}]}.
+    """
+    import pandas as pd
+
+    if path.endswith('.json'):
+        with open(path) as f:
+            snapshots = json.load(f)
+        if isinstance(snapshots, dict):
+            snapshots = [snapshots]
+        frames = []
+        for snapshot in snapshots:
+            hours = pd.DataFrame(snapshot['forecast'])
+            frames.append(pd.DataFrame({
+                'spot': snapshot.get('spot', spot),
+                'issue_time': snapshot['issued'],
+                'valid_time': hours['time'],
+                'wave_height': hours[next(c for c in HEIGHT_COLUMNS if c in hours.columns)],
+            }))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=['spot', 'issue_time', 'valid_time', 'wave_height'])
+    else:
+        df = pd.read_csv(path)
+        df.columns = [c.strip().lower() for c in df.columns]
+        df = df.rename(columns={next(c for c in HEIGHT_COLUMNS if c in df.columns): 'wave_height'})
+        if spot is not None:
+            df['spot'] = spot
+        df = df[['spot', 'issue_time', 'valid_time', 'wave_height']]
+
+    if df['spot'].isna().any():
+        raise ValueError(f"{path}: every forecast needs a spot (pass --spot)")
+    df['issue_time'] = pd.to_datetime(df['issue_time'])
+    df['valid_time'] = pd.to_datetime(df['valid_time'])
+    df['wave_height'] = pd.to_numeric(df['wave_height'], errors='coerce')
+    return df.dropna()
+
+def ingest(df):
+    """Merge forecasts into the archive; rows for an already stored issue and valid time are replaced"""
+    import pandas as pd
+
+    lead = (df['valid_time'] - df['issue_time']) // pd.Timedelta(minutes=1)
+    in_range = (lead >= 0) & (lead <= MAX_LEAD_MINUTES)
+    if not in_range.all():
+        print(f"Skipping {(~in_range).sum()} forecasts with a lead outside 0-{MAX_LEAD_MINUTES} minutes")
+    df = df[in_range]
+    if df.empty:
+        return 0
+    df = df.assign(month=df['valid_time'].dt.to_period('M').dt.start_time.dt.date)
+
+    db_session = get_session()
+    try:
+        for (spot, month), group in df.groupby(['spot', 'month']):
+            chunk = db_session.get(ForecastChunk, (spot, month))
+            frames = [_decode_chunk(chunk), group] if chunk else [group]
+            merged = (pd.concat(frames, ignore_index=True)
+                      .drop_duplicates(['issue_time', 'valid_time'], keep='last')
+                      .sort_values(['issue_time', 'valid_time']))
+            issue = merged['issue_time'].values.astype('datetime64[m]').astype('int64')
+            valid = merged['valid_time'].values.astype('datetime64[m]').astype('int64')
+            db_session.merge(ForecastChunk(
+                spot=spot, month=month, rows=len(merged),
+                issue_times=_encode(issue, 'int32'),
+                lead_minutes=_encode(valid - issue, 'int16'),
+                heights=_encode(merged['wave_height'].values, 'float32'),
+                updated_at=datetime.utcnow()
+            ))
+        bump_data_version(db_session, VERSION_NAME)
+        db_session.commit()
+        print(f"Archived {len(df)} forecasts")
+        return len(df)
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+def load_forecasts(db_session, spots=None, start=None, end=None):
+    """Archived forecasts valid between the `start` and `end` dates (inclusive months) for `spots`"""
+    import pandas as pd
+
+    query = select(ForecastChunk)
+    if spots is not None:
+        query = query.where(func.lower(ForecastChunk.spot).in_([s.lower() for s in spots]))
+    if start is not None:
+        query = query.where(ForecastChunk.month >= date(start.year, start.month, 1))
+    if end is not None:
+        query = query.where(ForecastChunk.month <= date(end.year, end.month, 1))
+    frames = [_decode_chunk(chunk) for chunk in db_session.scalars(query)]
+    if not frames:
+        return pd.DataFrame(columns=['spot', 'issue_time', 'valid_time', 'wave_height'])
+    return pd.concat(frames, ignore_index=True)
+
+def _errors(aggregated):
+    return aggregated.agg(comparisons=('error', 'size'), bias=('error', 'mean'),
+                          mae=('abs_error', 'mean')).round(2).reset_index()
+
+def _pair_runs(sessions, forecasts):
+    """
+    Pair each session with every run issued for its spot before it, within
+    the maximum lead. The runs of a spot are sorted by issue time and each
+    session's range of them is found with searchsorted, so only the pairs
+    kept are ever built (not sessions x runs).
+    """
+    import numpy as np
+    import pandas as pd
+
+    max_lead = np.timedelta64(MAX_LEAD_MINUTES, 'm')
+    issue_times = {key: np.unique(group.to_numpy())
+                   for key, group in forecasts.groupby('spot_key')['issue_time']}
+    frames = []
+    for key, spot_sessions in sessions.groupby('spot_key'):
+        issues = issue_times.get(key)
+        if issues is None:
+            continue
+        dates = spot_sessions['date'].to_numpy()
+        start = np.searchsorted(issues, dates - max_lead, side='left')
+        counts = np.searchsorted(issues, dates, side='right') - start
+        # Index of each pair's run: its session's first run plus its position in that session's range
+        first = np.repeat(start, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        frames.append(spot_sessions.iloc[np.repeat(np.arange(len(spot_sessions)), counts)]
+                      .assign(issue_time=issues[first + offsets]))
+    if not frames:
+        return sessions.iloc[:0].assign(issue_time=pd.Series(dtype='datetime64[ns]'))
+    return pd.concat(frames, ignore_index=True)
+
+def compute(sessions, forecasts):
+    """
+    Score forecasts against sessions (location, date, wave_height)
+    Bias is the mean of predicted minus logged height, so a positive bias
+    means forecasts ran high. Lead days count whole days from issue to
+    session start.
+    """
+    import pandas as pd
+
+    empty = {'overall': None, 'by_lead': [], 'by_spot': [], 'by_spot_lead': [], 'comparisons': 0}
+    sessions = sessions.dropna(subset=['wave_height', 'date'])
+    if sessions.empty or forecasts.empty:
+        return empty
+
+    sessions = sessions.assign(spot_key=sessions['location'].str.strip().str.lower())
+    forecasts = forecasts.assign(spot_key=forecasts['spot'].str.strip().str.lower())
+
+    pairs = _pair_runs(sessions, forecasts)
+    if pairs.empty:
+        return empty
+
+    # The forecast hour of that run nearest the session start
+    matched = pd.merge_asof(
+        pairs.sort_values('date'),
+        forecasts[['spot_key', 'issue_time', 'valid_time', 'wave_height']]
+        .rename(columns={'wave_height': 'predicted'}).sort_values('valid_time'),
+        left_on='date', right_on='valid_time', by=['spot_key', 'issue_time'],
+        direction='nearest', tolerance=pd.Timedelta(MATCH_TOLERANCE)
+    ).dropna(subset=['predicted'])
+    if matched.empty:
+        return empty
+
+    matched['lead_day'] = ((matched['date'] - matched['issue_time']) // pd.Timedelta(days=1)).astype(int)
+    matched['error'] = matched['predicted'] - matched['wave_height']
+    matched['abs_error'] = matched['error'].abs()
+
+    overall = matched.agg({'error': 'mean', 'abs_error': 'mean'}).round(2)
+    return {
+        'overall': {'sessions': int(matched['id'].nunique()), 'bias': float(overall['error']),
+                    'mae': float(overall['abs_error'])},
+        'by_lead': _errors(matched.groupby('lead_day')).to_dict('records'),
+        'by_spot': _errors(matched.groupby('location')).to_dict('records'),
+        'by_spot_lead': _errors(matched.groupby(['location', 'lead_day'])).to_dict('records'),
+        'comparisons': len(matched),
+    }
+
+def get_accuracy(user_id):
+    """Return forecast accuracy for a user's sessions, recomputing only if they or the forecasts changed"""
+    state_name = f"{STATE_NAME}:{user_id}"
+    db_session = get_session()
+    try:
+        version = (get_data_version(db_session, user_id=user_id)[0], get_data_version(db_session, VERSION_NAME)[0])
+        cached_version, cached = _cache.get(user_id, (None, None))
+        if cached_version == version:
+            return cached
+
+        with _cache_lock:
+            stored = db_session.get(AnalyticsState, state_name)
+            stored_state = json.loads(stored.state) if stored is not None else None
+            if stored_state is not None and [stored.data_version, stored_state['forecast_version']] == list(version):
+                result = stored_state['result']
+            else:
+                import pandas as pd
+                sessions = pd.read_sql(
+                    select(SurfSession.id, SurfSession.location, SurfSession.date, SurfSession.wave_height)
+                    .where(SurfSession.user_id == user_id)
+                    .where(SurfSession.wave_height.isnot(None)),
+                    db_session.bind
+                )
+                forecasts = load_forecasts(
+                    db_session, spots=sessions['location'].dropna().unique().tolist(),
+                    start=sessions['date'].min() if not sessions.empty else None,
+                    end=sessions['date'].max() if not sessions.empty else None
+                )
+                result = json.loads(json.dumps(compute(sessions, forecasts), default=lambda value: value.item()))
+                edit_version, _ = get_data_version(db_session, 'surf_sessions_edits', user_id=user_id)
+                db_session.merge(AnalyticsState(
+                    name=state_name, state=json.dumps({'forecast_version': version[1], 'result': result}),
+                    data_version=version[0], edit_version=edit_version, last_session_id=0,
+                    updated_at=datetime.utcnow()
+                ))
+                db_session.commit()
+            _cache[user_id] = (version, result)
+        return result
+    finally:
+        db_session.close()
+
+def archive_stats():
+    """Chunks, forecasts and stored bytes in the archive"""
+    db_session = get_session()
+    try:
+        chunks, rows, size = db_session.execute(select(
+            func.count(),
+            func.coalesce(func.sum(ForecastChunk.rows), 0),
+            func.coalesce(func.sum(func.length(ForecastChunk.issue_times) + func.length(ForecastChunk.lead_minutes)
+                                   + func.length(ForecastChunk.heights)), 0)
+        )).one()
+    finally:
+        db_session.close()
+    return {'chunks': chunks, 'forecasts': rows, 'bytes': size}
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archive forecasts and score their accuracy")
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('ingest', help="add forecast files to the archive")
+    load.add_argument('files', nargs='+')
+    load.add_argument('--spot', help="spot for files without a spot column")
+    commands.add_parser('accuracy', help="print bias and MAE by lead time and spot")
+    commands.add_parser('stats', help="print archive size")
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        for path in args.files:
+            ingest(read_forecast_file(path, args.spot))
+    elif args.command == 'stats':
+        stats = archive_stats()
+        per_row = stats['bytes'] / stats['forecasts'] if stats['forecasts'] else 0
+        print(f"{stats['forecasts']} forecasts in {stats['chunks']} chunks, "
+              f"{stats['bytes']} bytes ({per_row:.1f} bytes/forecast)")
+    else:
+        import users
+        accuracy = get_accuracy(users.cli_user_id())
+        if not accuracy['overall']:
+            print("No forecasts overlap logged sessions yet")
+            return
+        overall = accuracy['overall']
+        print(f"{overall['sessions']} sessions scored: bias {overall['bias']:+.2f} ft, MAE {overall['mae']:.2f} ft")
+        print("\nBy lead time:")
+        for row in accuracy['by_lead']:
+            print(f"  day {row['lead_day']}: bias {row['bias']:+.2f} ft, MAE {row['mae']:.2f} ft ({row['comparisons']} comparisons)")
+        print("\nBy spot:")
+        for row in accuracy['by_spot']:
+            print(f"  {row['location']}: bias {row['bias']:+.2f} ft, MAE {row['mae']:.2f} ft ({row['comparisons']} comparisons)")
+
+if __name__ == "__main__":
+    main()
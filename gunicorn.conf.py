@@ -0,0 +1,17 @@
+# Gunicorn settings, loaded automatically when gunicorn starts from this directory
+import os
+import shutil
+
+# Workers write Prometheus samples here so /metrics can add them up.
+# This has to be set before any worker imports prometheus_client.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/surftracker_metrics')
+
+def on_starting(server):
+    """Start each deployment with an empty metrics directory"""
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that exited"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,6 @@
 import subprocess
 from models import init_db
+import update_schema_search
 
 def create_database():
     try:
@@ -11,6 +12,7 @@ def create_database():
 
     # Initialize database schema
     engine = init_db()
+    update_schema_search.update_schema(engine)
     print("Database schema created successfully!")
 
 if __name__ == "__main__":
@@ -1,8 +1,13 @@
 import pandas as pd
 from sqlalchemy import create_engine
-from models import SurfSession, get_session, WaveQuality, Board
+from models import SurfSession, get_session, bump_data_version, WaveQuality, Board
 from datetime import datetime
+import metrics
+import daily_activity
+import conditions_store
+import users
 import os
+import time
 
 def convert_wave_quality(quality_str):
     """Convert string wave quality to enum value"""
@@ -14,8 +19,8 @@ def convert_wave_quality(quality_str):
     }
     return quality_map.get(quality_str.lower(), None) if quality_str else None
 
-def get_board_by_name(db_session, board_name):
-    """Get board by name, handling variations in naming"""
+def get_board_by_name(db_session, board_name, user_id):
+    """Get one of the user's boards by name, handling variations in naming"""
     if not board_name:
         return None
         
@@ -32,7 +37,9 @@ def get_board_by_name(db_session, board_name):
     elif 'nps' in board_name.lower() or 'nsp' in board_name.lower() or 'egg' in board_name.lower():
         board_name = 'NSP Egg'
     
-    board = db_session.query(Board).filter(Board.name.ilike(f"%{board_name}%")).first()
+    board = db_session.query(Board).filter(
+        Board.user_id == user_id, Board.name.ilike(f"%{board_name}%")
+    ).first()
     if not board:
         print(f"DEBUG: Could not find board matching '{board_name}'")
     return board
@@ -57,7 +64,9 @@ def clean_dataframe(df):
         'Time in water': 'session_duration',
         'Waves Caught': 'waves_caught',
         'Boards': 'board',
-        'Notes': 'notes'
+        'Notes': 'notes',
+        'Latitude': 'latitude',
+        'Longitude': 'longitude'
     }
     
     # Rename only the columns that exist
@@ -93,8 +102,24 @@ def clean_dataframe(df):
     
     return df
 
-def load_surf_data(file_path):
-    """Load surf session data from CSV or Excel file into database"""
+def name_positions(df):
+    """Fill in the location of rows with GPS coordinates but none, from the nearest known spot"""
+    if 'latitude' not in df.columns or 'longitude' not in df.columns:
+        return df
+    if 'location' not in df.columns:
+        df['location'] = None
+    latitudes = pd.to_numeric(df['latitude'], errors='coerce')
+    longitudes = pd.to_numeric(df['longitude'], errors='coerce')
+    missing = df['location'].isna() & latitudes.notna() & longitudes.notna()
+    if missing.any():
+        import spots
+        names = spots.assign_locations(zip(latitudes[missing], longitudes[missing]))
+        df.loc[missing, 'location'] = names
+        print(f"Named {sum(1 for name in names if name)} of {int(missing.sum())} sessions from GPS positions")
+    return df
+
+def load_surf_data(file_path, user_id=None):
+    """Load surf session data from CSV or Excel file into database, as the user's sessions"""
     # Determine file type by extension
     _, ext = os.path.splitext(file_path)
     
@@ -118,24 +143,34 @@ def load_surf_data(file_path):
         
         # Clean and prepare the dataframe
         df = clean_dataframe(df)
+        df = name_positions(df)
         
         print("\nProcessed columns:", df.columns.tolist())
         print(f"\nFound {len(df)} rows to import")
         
         # Get database session
         db_session = get_session()
+        if user_id is None:
+            user_id = users.cli_user_id(db_session)
         
         try:
             successful_imports = 0
+            skipped_rows = 0
+            failed_rows = 0
+            started = time.perf_counter()
+            imported_sessions = []
+            new_sessions = []
             # Convert DataFrame rows to SurfSession objects
             for idx, row in df.iterrows():
                 try:
                     # Skip rows with no date or location
                     if pd.isna(row.get('date')):
                         print(f"DEBUG: Skipping row {idx + 1}: No date")
+                        skipped_rows += 1
                         continue
                     if pd.isna(row.get('location')):
                         print(f"DEBUG: Skipping row {idx + 1}: No location")
+                        skipped_rows += 1
                         continue
                     
                     print(f"\nDEBUG: Processing row {idx + 1}")
@@ -146,13 +181,14 @@ def load_surf_data(file_path):
                     # Get board if specified
                     board = None
                     if 'board' in row and not pd.isna(row['board']):
-                        board = get_board_by_name(db_session, row['board'])
+                        board = get_board_by_name(db_session, row['board'], user_id)
                         if board:
                             print(f"Found board: {board.name} for session {idx + 1}")
                         else:
                             print(f"Warning: Board not found for session {idx + 1}: {row['board']}")
                     
                     session = SurfSession(
+                        user_id=user_id,
                         date=row['date'] if row.get('date') else datetime.now(),
                         location=row['location'],
                         wave_height=row.get('wave_height'),
@@ -168,14 +204,25 @@ def load_surf_data(file_path):
                         board=board         # Add board relationship
                     )
                     db_session.add(session)
+                    new_sessions.append(session)
+                    imported_sessions.append((session.date, session.waves_caught, session.session_duration))
                     successful_imports += 1
                 except Exception as e:
                     print(f"Error processing row {idx + 1}: {str(e)}")
                     print(f"Row data: {row.to_dict()}")
+                    failed_rows += 1
                     continue
             
             # Commit all changes
+            daily_activity.record_sessions(db_session, user_id, imported_sessions)
+            db_session.flush()
+            # Fill tide/wind/water temperature from the local conditions store
+            # before committing, so the new sessions don't count as edits
+            conditions_store.fill_conditions(db_session, [session.id for session in new_sessions])
+            bump_data_version(db_session, user_id=user_id)
             db_session.commit()
+            metrics.record_import(successful_imports, skipped_rows, failed_rows,
+                                  time.perf_counter() - started)
             print(f"\nSuccessfully loaded {successful_imports} surf sessions into database!")
         
         except Exception as e:
@@ -195,6 +242,7 @@ def load_surf_data(file_path):
         print("- Waves Caught")
         print("- Boards")
         print("- Notes")
+        print("- Latitude, Longitude (optional: names the spot of rows with no location)")
 
 if __name__ == "__main__":
     import sys
@@ -204,4 +252,6 @@ if __name__ == "__main__":
         sys.exit(1)
     
     file_path = sys.argv[1]
-    load_surf_data(file_path) 
\ No newline at end of file
+    from profiling import profiled
+    with profiled('load_data'):
+        load_surf_data(file_path) 
\ No newline at end of file
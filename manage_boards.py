@@ -1,9 +1,10 @@
 from models import get_session, Board, SurfSession
+import users
 from datetime import datetime
 
 def list_boards(db_session):
-    """List all boards in the database"""
-    boards = db_session.query(Board).all()
+    """List the user's boards"""
+    boards = db_session.query(Board).filter(Board.user_id == users.cli_user_id(db_session)).all()
     
     print("\nSurfboards:")
     print("-----------")
@@ -68,6 +69,7 @@ def add_board():
     # Save to database
     db_session = get_session()
     try:
+        board.user_id = users.cli_user_id(db_session)
         db_session.add(board)
         db_session.commit()
         print("\nBoard added successfully!")
@@ -0,0 +1,120 @@
+"""
+Prometheus metrics for the web app and the import CLI
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does this) so
+every worker writes its samples to a shared directory and /metrics reports
+the sum across workers. Without it, metrics are kept in-process.
+"""
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+from sqlalchemy import event
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+REQUEST_LATENCY = Histogram(
+    'surftracker_request_duration_seconds', 'HTTP request latency by route',
+    ['route', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+PHASE_DURATION = Histogram(
+    'surftracker_dashboard_phase_duration_seconds',
+    'Time spent in each phase of building the dashboard',
+    ['phase'],  # load_data, stats, charts
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+DB_QUERIES = Counter('surftracker_db_queries_total', 'SQL statements executed', ['route'])
+POOL_CHECKOUTS = Counter('surftracker_db_pool_checkouts_total', 'Connections checked out of the pool')
+POOL_CHECKED_OUT = Gauge('surftracker_db_pool_checked_out', 'Connections currently checked out',
+                         multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('surftracker_db_pool_overflow', 'Connections open beyond the pool size',
+                      multiprocess_mode='livesum')
+POOL_SIZE = Gauge('surftracker_db_pool_size', 'Configured connection pool size',
+                  multiprocess_mode='livesum')
+IMPORT_ROWS = Counter('surftracker_import_rows_total', 'Rows processed by load_data imports',
+                      ['result'])  # imported, skipped, failed
+IMPORT_DURATION = Histogram('surftracker_import_duration_seconds', 'Duration of load_data imports',
+                            buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+IMPORT_ROWS_PER_SECOND = Gauge('surftracker_import_rows_per_second',
+                               'Throughput of the most recent load_data import',
+                               multiprocess_mode='mostrecent')
+
+def _current_route():
+    """Flask endpoint handling the current request, or 'none' outside a request"""
+    from flask import has_request_context, request
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'none'
+
+@contextmanager
+def time_phase(phase):
+    """Record how long the wrapped dashboard phase takes"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_DURATION.labels(phase=phase).observe(time.perf_counter() - started)
+
+def instrument_engine(engine):
+    """Count queries and track connection pool checkouts/overflow for `engine`"""
+    pool = engine.pool
+    if hasattr(pool, 'size'):
+        POOL_SIZE.set(pool.size())
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERIES.labels(route=_current_route()).inc()
+
+    @event.listens_for(pool, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.inc()
+        POOL_CHECKED_OUT.inc()
+        if hasattr(pool, 'overflow'):
+            POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    @event.listens_for(pool, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        POOL_CHECKED_OUT.dec()
+        if hasattr(pool, 'overflow'):
+            POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+def record_import(imported, skipped, failed, seconds):
+    """Record the outcome of one load_data import run"""
+    IMPORT_ROWS.labels(result='imported').inc(imported)
+    IMPORT_ROWS.labels(result='skipped').inc(skipped)
+    IMPORT_ROWS.labels(result='failed').inc(failed)
+    IMPORT_DURATION.observe(seconds)
+    if seconds > 0:
+        IMPORT_ROWS_PER_SECOND.set(imported / seconds)
+
+def instrument_app(app):
+    """Time every request and serve the metrics at /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_latency(response):
+        started = g.pop('request_started', None)
+        if started is not None and request.endpoint != 'metrics':
+            REQUEST_LATENCY.labels(
+                route=request.endpoint or 'unknown',
+                method=request.method,
+                status=response.status_code
+            ).observe(time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint"""
+        if MULTIPROCESS:
+            # Aggregate the samples every worker wrote to the shared directory
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
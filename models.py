@@ -1,7 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Enum, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy import create_engine, func, Column, Integer, BigInteger, String, Float, Date, DateTime, Enum, ForeignKey, Index, LargeBinary, Text, update
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 import enum
+import os
 from datetime import datetime
 
 Base = declarative_base()
@@ -12,10 +12,26 @@ class WaveQuality(enum.Enum):
     GOOD = "good"
     EXCELLENT = "excellent"
 
+class User(Base):
+    """A surfer; sessions and boards (and everything derived from them) belong to one user"""
+    __tablename__ = 'users'
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String(100), nullable=False, unique=True)
+    password_hash = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<User(username={self.username})>"
+
 class Board(Base):
     __tablename__ = 'boards'
+    __table_args__ = (
+        Index('ix_boards_user_id_name', 'user_id', 'name'),
+    )
 
     id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)  # Owner
     name = Column(String(100), nullable=False)  # Name/model of the board
     length = Column(Float)  # Length in feet
     volume = Column(Float)  # Volume in liters
@@ -32,8 +48,13 @@ class Board(Base):
 
 class SurfSession(Base):
     __tablename__ = 'surf_sessions'
+    __table_args__ = (
+        # Every dashboard query is for one user, usually in date order
+        Index('ix_surf_sessions_user_id_date', 'user_id', 'date'),
+    )
 
     id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)  # Owner
     date = Column(DateTime, nullable=False, default=datetime.utcnow)
     location = Column(String(100), nullable=False)
     wave_height = Column(Float)  # in feet
@@ -45,24 +66,191 @@ class SurfSession(Base):
     session_duration = Column(Integer)  # in minutes
     waves_caught = Column(Integer)  # number of waves caught
     notes = Column(String(500))
+    # Full-text search over notes lives outside the ORM: a generated tsvector
+    # column (PostgreSQL) or an FTS5 table (SQLite), see update_schema_search.py
     rating = Column(Integer)  # 1-5 rating
     
     # Add relationship with Board
     board_id = Column(Integer, ForeignKey('boards.id'))
     board = relationship("Board", back_populates="sessions")
 
+    # Bumped on every update, so concurrent edits are detected instead of
+    # overwritten. ORM flushes check and bump it automatically; set-based
+    # UPDATEs (bulk_edit.py, conditions_store.py) bump it explicitly.
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+
     def __repr__(self):
         return f"<SurfSession(date={self.date}, location={self.location}, rating={self.rating})>"
 
+class SurfLogSync(Base):
+    """High-water mark for syncing a surf_feedback.py JSON log into surf_sessions"""
+    __tablename__ = 'surf_log_sync'
+
+    source = Column(String(500), primary_key=True)  # Absolute path of the JSON log
+    position = Column(Integer, nullable=False, default=0)  # Number of log entries synced so far
+    snapshot_size = Column(BigInteger)  # Snapshot file size at the last sync
+    snapshot_mtime_ns = Column(BigInteger)  # Snapshot file mtime at the last sync
+    journal_offset = Column(BigInteger)  # Journal bytes already read at the last sync
+    synced_at = Column(DateTime)
+
+    def __repr__(self):
+        return f"<SurfLogSync(source={self.source}, position={self.position})>"
+
+class DataVersion(Base):
+    """Counter bumped on every write to a table, used for HTTP validators and caches"""
+    __tablename__ = 'data_versions'
+
+    name = Column(String(50), primary_key=True)  # Table the version belongs to, e.g. surf_sessions:<user id>
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC
+
+    def __repr__(self):
+        return f"<DataVersion(name={self.name}, version={self.version})>"
+
+class ConditionObservation(Base):
+    """A tide or weather observation for a spot, loaded from local exports"""
+    __tablename__ = 'condition_observations'
+
+    id = Column(Integer, primary_key=True)
+    spot = Column(String(100), nullable=False)  # Matched case-insensitively to SurfSession.location
+    observed_at = Column(DateTime, nullable=False)
+    source = Column(String(50), nullable=False)  # Which file/format the row came from
+    tide_height = Column(Float)  # in feet
+    wind_speed = Column(Float)  # in mph
+    wind_direction = Column(String(50))
+    water_temp = Column(Float)  # in fahrenheit
+
+    def __repr__(self):
+        return f"<ConditionObservation(spot={self.spot}, observed_at={self.observed_at})>"
+
+# Spots are looked up by lower(spot), so that is what the index covers
+Index('ix_condition_observations_lower_spot_time',
+      func.lower(ConditionObservation.spot), ConditionObservation.observed_at)
+
+class Spot(Base):
+    """A surf spot's position, matched case-insensitively to SurfSession.location by name"""
+    __tablename__ = 'spots'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False, unique=True)
+    latitude = Column(Float, nullable=False)  # WGS 84 degrees
+    longitude = Column(Float, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Spot(name={self.name}, latitude={self.latitude}, longitude={self.longitude})>"
+
+class ForecastChunk(Base):
+    """One month of archived forecasts for a spot, stored column-wise (see forecast_archive.py)"""
+    __tablename__ = 'forecast_chunks'
+
+    spot = Column(String(100), primary_key=True)
+    month = Column(Date, primary_key=True)  # First day of the month the forecasts are valid in
+    rows = Column(Integer, nullable=False)
+    issue_times = Column(LargeBinary, nullable=False)  # int32 minutes since the epoch, compressed
+    lead_minutes = Column(LargeBinary, nullable=False)  # int16 minutes from issue to valid time, compressed
+    heights = Column(LargeBinary, nullable=False)  # float32 predicted wave height in feet, compressed
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ForecastChunk(spot={self.spot}, month={self.month}, rows={self.rows})>"
+
+class DailyActivity(Base):
+    """Sessions, waves and minutes surfed per user per day, kept up to date by every writer"""
+    __tablename__ = 'daily_activity'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    sessions = Column(Integer, nullable=False, default=0)
+    waves = Column(Integer, nullable=False, default=0)
+    minutes = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DailyActivity(user_id={self.user_id}, day={self.day}, sessions={self.sessions})>"
+
+class AnalyticsState(Base):
+    """Stored state of an incrementally maintained analytics result"""
+    __tablename__ = 'analytics_state'
+
+    name = Column(String(50), primary_key=True)  # Which analytics result this is, and for which user
+    state = Column(Text, nullable=False)  # JSON
+    data_version = Column(BigInteger, nullable=False)  # surf_sessions version the state reflects
+    edit_version = Column(BigInteger, nullable=False)  # surf_sessions_edits version the state reflects
+    last_session_id = Column(Integer, nullable=False, default=0)  # Highest session id folded in
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AnalyticsState(name={self.name}, data_version={self.data_version})>"
+
 # Database connection configuration
 DATABASE_URL = "postgresql://localhost/surftracker"
 
+def get_database_url():
+    """DATABASE_URL from the environment (e.g. sqlite:///surftracker.db locally), or the default"""
+    url = os.getenv('DATABASE_URL', DATABASE_URL)
+    if url.startswith('postgres://'):
+        # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+# One engine (and connection pool) per process, created on first use
+_engine = None
+_Session = None
+
+def get_engine():
+    global _engine, _Session
+    if _engine is None:
+        _engine = create_engine(get_database_url())
+        _Session = sessionmaker(bind=_engine)
+    return _engine
+
 def init_db():
-    engine = create_engine(DATABASE_URL)
+    engine = get_engine()
     Base.metadata.create_all(engine)
     return engine
 
 def get_session():
-    engine = create_engine(DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    return Session() 
\ No newline at end of file
+    get_engine()
+    return _Session()
+
+def data_version_name(name, user_id=None):
+    """Versions of per-user data are kept separately for each user"""
+    return name if user_id is None else f"{name}:{user_id}"
+
+def bump_data_version(db_session, name='surf_sessions', edited=False, user_id=None):
+    """
+    Record that `name` changed, as part of the caller's transaction
+    Call this before committing any insert, update or delete of sessions,
+    passing the id of the user whose sessions changed.
+    Pass edited=True when existing rows were updated or deleted: this also
+    bumps '<name>_edits', telling caches that only fold in new rows that they
+    have to rebuild.
+    """
+    names = [name, f"{name}_edits"] if edited else [name]
+    for changed in names:
+        changed = data_version_name(changed, user_id)
+        result = db_session.execute(
+            update(DataVersion)
+            .where(DataVersion.name == changed)
+            .values(version=DataVersion.version + 1, updated_at=datetime.utcnow())
+        )
+        if result.rowcount == 0:
+            db_session.add(DataVersion(name=changed, version=1, updated_at=datetime.utcnow()))
+            db_session.flush()
+
+def get_data_version(db_session, name='surf_sessions', user_id=None):
+    """Return (version, updated_at) for `name`, or (0, None) if it has never changed"""
+    row = db_session.get(DataVersion, data_version_name(name, user_id))
+    if row is None:
+        return 0, None
+    return row.version, row.updated_at
+
+def count_sessions(db_session, user_id):
+    """
+    Number of the user's surf sessions
+    Session ids are handed out before commit, so a session can become visible
+    after one with a higher id. State folded in by `id > last id` checks its
+    count against this and rebuilds if a session was skipped.
+    """
+    return db_session.query(func.count(SurfSession.id)).filter(SurfSession.user_id == user_id).scalar()
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from models import get_session
+
+# Largest page size accepted from the API or CLI
+MAX_PER_PAGE = 100
+
+POSTGRES_QUERY = """
+SELECT s.id, s.date, s.location, b.name AS board_name, s.notes,
+       ts_rank(s.notes_tsv, q.query) AS rank,
+       ts_headline('english', coalesce(s.notes, ''), q.query, 'MaxWords=25, MinWords=8') AS snippet
+FROM surf_sessions s
+CROSS JOIN websearch_to_tsquery('english', :query) AS q(query)
+LEFT JOIN boards b ON s.board_id = b.id
+WHERE s.user_id = :user_id AND s.notes_tsv @@ q.query {filters}
+ORDER BY rank DESC, s.date DESC
+LIMIT :limit OFFSET :offset
+"""
+
+SQLITE_QUERY = """
+SELECT s.id, s.date, s.location, b.name AS board_name, s.notes,
+       -bm25(surf_sessions_fts) AS rank,
+       snippet(surf_sessions_fts, 0, '[', ']', '...', 16) AS snippet
+FROM surf_sessions_fts
+JOIN surf_sessions s ON s.id = surf_sessions_fts.rowid
+LEFT JOIN boards b ON s.board_id = b.id
+WHERE surf_sessions_fts MATCH :query AND s.user_id = :user_id {filters}
+ORDER BY rank DESC, s.date DESC
+LIMIT :limit OFFSET :offset
+"""
+
+def _fts5_query(query):
+    """Quote each word so FTS5 treats user input as plain terms, not query syntax"""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+def search_notes(query, user_id, location=None, board_id=None, start_date=None, end_date=None,
+                 page=1, per_page=20):
+    """
+    Full-text search over a user's session notes, best matches first
+    Returns {"results": [...], "page": ..., "per_page": ..., "has_more": ...}
+    """
+    page = max(int(page), 1)
+    per_page = min(max(int(per_page), 1), MAX_PER_PAGE)
+
+    filters = []
+    params = {'user_id': user_id, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    if location:
+        filters.append("AND lower(s.location) = lower(:location)")
+        params['location'] = location
+    if board_id:
+        filters.append("AND s.board_id = :board_id")
+        params['board_id'] = int(board_id)
+    if start_date:
+        filters.append("AND s.date >= :start_date")
+        params['start_date'] = start_date
+    if end_date:
+        filters.append("AND s.date < :end_date")
+        params['end_date'] = end_date
+
+    db_session = get_session()
+    try:
+        if db_session.bind.dialect.name == 'sqlite':
+            sql, params['query'] = SQLITE_QUERY, _fts5_query(query)
+        else:
+            sql, params['query'] = POSTGRES_QUERY, query
+        if not params['query'].strip():
+            rows = []
+        else:
+            rows = db_session.execute(text(sql.format(filters=' '.join(filters))), params).mappings().all()
+    finally:
+        db_session.close()
+
+    # One extra row was fetched to tell whether another page exists
+    return {
+        'results': [dict(row) for row in rows[:per_page]],
+        'page': page,
+        'per_page': per_page,
+        'has_more': len(rows) > per_page,
+    }
+
+def parse_date_filter(value, end=False):
+    """Parse a YYYY-MM-DD filter; end dates are exclusive, so they include the whole day"""
+    if not value:
+        return None
+    date = datetime.strptime(value, '%Y-%m-%d')
+    return date + timedelta(days=1) if end else date
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search surf session notes")
+    parser.add_argument('query', help="words to search for, e.g. 'glassy barrel'")
+    parser.add_argument('--location')
+    parser.add_argument('--board-id', type=int)
+    parser.add_argument('--from', dest='start_date', help="YYYY-MM-DD")
+    parser.add_argument('--to', dest='end_date', help="YYYY-MM-DD")
+    parser.add_argument('--page', type=int, default=1)
+    parser.add_argument('--per-page', type=int, default=20)
+    args = parser.parse_args()
+
+    import users
+    found = search_notes(args.query, users.cli_user_id(), location=args.location, board_id=args.board_id,
+                         start_date=parse_date_filter(args.start_date),
+                         end_date=parse_date_filter(args.end_date, end=True),
+                         page=args.page, per_page=args.per_page)
+
+    if not found['results']:
+        print("No matching sessions found")
+    for session in found['results']:
+        print(f"\n{str(session['date'])[:10]} - {session['location']} ({session['board_name'] or 'no board'})")
+        print(f"   {session['snippet']}")
+    if found['has_more']:
+        print(f"\nMore results: --page {found['page'] + 1}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Opt-in cProfile hooks for web requests and CLI runs
+
+Nothing is profiled unless SURFTRACKER_PROFILE=1 is set. Then:
+- a web request is profiled when it has ?profile=1 or an X-Profile: 1 header
+- `python visualize_data.py` and `python load_data.py` profile the whole run
+Profiles are written as .pstats files to SURFTRACKER_PROFILE_DIR (default
+./profiles). Open them with `python -m pstats`, snakeviz, or turn them into
+a flamegraph with flameprof or gprof2dot.
+"""
+import cProfile
+import os
+import re
+import time
+from contextlib import contextmanager
+
+def profiling_enabled():
+    return os.getenv('SURFTRACKER_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+def _profile_path(name):
+    """Path for a new profile file, unique per run"""
+    directory = os.getenv('SURFTRACKER_PROFILE_DIR', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(directory, f"{safe_name}-{stamp}-{os.getpid()}.pstats")
+
+def _start():
+    """Start a profiler, or return None if another one is already running"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+def _finish(profiler, path):
+    profiler.disable()
+    profiler.dump_stats(path)
+    return path
+
+@contextmanager
+def profiled(name):
+    """Profile the wrapped block if profiling is enabled, otherwise do nothing"""
+    profiler = _start() if profiling_enabled() else None
+    try:
+        yield
+    finally:
+        if profiler:
+            print(f"Profile written to {_finish(profiler, _profile_path(name))}")
+
+def install_request_profiler(app):
+    """Profile requests that ask for it, when SURFTRACKER_PROFILE is enabled"""
+    if not profiling_enabled():
+        return
+    from flask import g, request
+
+    @app.before_request
+    def start_profiler():
+        if request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1':
+            g.profiler = _start()
+            if g.profiler:
+                g.profile_path = _profile_path(f"{request.endpoint or 'unknown'}-{request.method}")
+
+    @app.after_request
+    def add_profile_header(response):
+        if g.get('profiler'):
+            response.headers['X-Profile-File'] = os.path.basename(g.profile_path)
+        return response
+
+    # Teardown runs even when the view raises, so the profiler never stays
+    # enabled on the worker thread for later requests
+    @app.teardown_request
+    def stop_profiler(exc):
+        profiler = g.pop('profiler', None)
+        if profiler:
+            path = _finish(profiler, g.pop('profile_path'))
+            app.logger.info("Profile written to %s", path)
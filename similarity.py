@@ -0,0 +1,245 @@
+"""
+"Sessions like this one": nearest neighbours over session conditions
+
+Each user's sessions are kept in memory as a feature matrix:
+- wave height, tide height, wind speed and water temperature as z-scores
+  (float32, NaN where not recorded)
+- integer codes for spot and board
+
+A query scores every session at once with NumPy. The score is the weighted
+squared distance over the conditions the query gives, plus a fixed penalty
+where a session didn't record one, or is at another spot or on another
+board. np.argpartition then picks the top k. The matrix is cached per
+process, keyed on the user's data versions. Sessions added since it was
+built are appended, and edits, deletions or a session count that doesn't
+add up trigger a full rebuild.
+"""
+import threading
+from sqlalchemy import select
+from models import get_session, get_data_version, count_sessions, Board, SurfSession
+
+NUMERIC_FEATURES = ['wave_height', 'tide_height', 'wind_speed', 'water_temp']
+# Relative importance of each condition (in squared standard deviations)
+WEIGHTS = {'wave_height': 2.0, 'tide_height': 1.0, 'wind_speed': 1.0, 'water_temp': 0.5}
+# Added when a session didn't record a condition the query gives
+MISSING_PENALTY = 1.0
+# Added for sessions at another spot / on another board than the query's
+SPOT_PENALTY = 3.0
+BOARD_PENALTY = 1.0
+MAX_RESULTS = 100
+
+# Per-process cache: {user id: (data version, edit version, FeatureMatrix)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _features_query(user_id, after_id=0):
+    return (
+        select(SurfSession.id, SurfSession.location, SurfSession.board_id,
+               *[getattr(SurfSession, feature) for feature in NUMERIC_FEATURES])
+        .where(SurfSession.user_id == user_id)
+        .where(SurfSession.id > after_id)
+        .order_by(SurfSession.id)
+    )
+
+class FeatureMatrix:
+    """
+    One user's sessions as arrays, with spare capacity so new sessions can be
+    appended without copying. Readers use the first `size` rows; appends only
+    write past them, so a query running during an append sees a consistent
+    (slightly older) matrix.
+    """
+
+    def __init__(self, rows):
+        import numpy as np
+
+        self.spot_codes = {}
+        self.size = 0
+        capacity = max(len(rows), 1024)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.values = np.full((capacity, len(NUMERIC_FEATURES)), np.nan, dtype=np.float32)
+        self.spots = np.zeros(capacity, dtype=np.int32)
+        self.boards = np.zeros(capacity, dtype=np.int32)
+
+        raw = np.array([row[3:] for row in rows], dtype=np.float64).reshape(len(rows), len(NUMERIC_FEATURES))
+        # Scale from the sessions present at build time; appended sessions reuse it
+        with np.errstate(all='ignore'):
+            self.mean = np.nan_to_num(np.nanmean(raw, axis=0)) if len(rows) else np.zeros(len(NUMERIC_FEATURES))
+            std = np.nanstd(raw, axis=0) if len(rows) else np.ones(len(NUMERIC_FEATURES))
+        self.std = np.where(np.isfinite(std) & (std > 0), std, 1.0)
+        self.append(rows)
+
+    def spot_code(self, location):
+        """Integer code of a location, matched case-insensitively (-1 if it was never seen)"""
+        return self.spot_codes.get((location or '').strip().lower(), -1)
+
+    def normalize(self, values):
+        import numpy as np
+        return ((np.asarray(values, dtype=np.float64) - self.mean) / self.std).astype(np.float32)
+
+    def append(self, rows):
+        import numpy as np
+
+        if not rows:
+            return
+        needed = self.size + len(rows)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids))
+            self.ids = np.resize(self.ids, capacity)
+            self.values = np.concatenate([self.values, np.full((capacity - len(self.values), len(NUMERIC_FEATURES)),
+                                                               np.nan, dtype=np.float32)])
+            self.spots = np.resize(self.spots, capacity)
+            self.boards = np.resize(self.boards, capacity)
+
+        new = slice(self.size, needed)
+        self.ids[new] = [row[0] for row in rows]
+        self.spots[new] = [self.spot_codes.setdefault((row[1] or '').strip().lower(), len(self.spot_codes))
+                           for row in rows]
+        self.boards[new] = [row[2] if row[2] is not None else -1 for row in rows]
+        raw = np.array([row[3:] for row in rows], dtype=np.float64)
+        self.values[new] = self.normalize(raw)
+        self.size = needed
+
+    @property
+    def last_id(self):
+        return int(self.ids[self.size - 1]) if self.size else 0
+
+    def nearest(self, conditions, k=10, spot=None, board_id=None, exclude_id=None):
+        """
+        Top-k sessions for `conditions` ({feature: value}, missing ones are
+        ignored), as [(session id, distance)], closest first
+        """
+        import numpy as np
+
+        size = self.size
+        if size == 0:
+            return []
+        scores = np.zeros(size, dtype=np.float32)
+        given = [i for i, feature in enumerate(NUMERIC_FEATURES) if conditions.get(feature) is not None]
+        if given:
+            query = self.normalize([np.nan if conditions.get(feature) is None else conditions[feature]
+                                    for feature in NUMERIC_FEATURES])
+            for i in given:
+                column = self.values[:size, i]
+                squared = np.square(column - query[i])
+                scores += WEIGHTS[NUMERIC_FEATURES[i]] * np.where(np.isnan(column), MISSING_PENALTY, squared)
+        if spot is not None:
+            scores += SPOT_PENALTY * (self.spots[:size] != self.spot_code(spot))
+        if board_id is not None:
+            scores += BOARD_PENALTY * (self.boards[:size] != board_id)
+        if exclude_id is not None:
+            scores[self.ids[:size] == exclude_id] = np.inf
+
+        k = min(k, size)
+        top = np.argpartition(scores, k - 1)[:k] if k < size else np.arange(size)
+        top = top[np.argsort(scores[top], kind='stable')]
+        return [(int(self.ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+def get_matrix(db_session, user_id):
+    """The user's feature matrix, brought up to date with their sessions"""
+    version, _ = get_data_version(db_session, user_id=user_id)
+    edit_version, _ = get_data_version(db_session, 'surf_sessions_edits', user_id=user_id)
+    cached = _cache.get(user_id)
+    if cached is not None and cached[:2] == (version, edit_version):
+        return cached[2]
+
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached is not None and cached[:2] == (version, edit_version):
+            return cached[2]
+        matrix = None
+        if cached is not None and cached[1] == edit_version:
+            # Only sessions added since the matrix was built are read, unless
+            # the count shows one committed behind the last id appended
+            rows = db_session.execute(_features_query(user_id, after_id=cached[2].last_id)).all()
+            if cached[2].size + len(rows) == count_sessions(db_session, user_id):
+                matrix = cached[2]
+                matrix.append(rows)
+        if matrix is None:
+            matrix = FeatureMatrix(db_session.execute(_features_query(user_id)).all())
+        _cache[user_id] = (version, edit_version, matrix)
+        return matrix
+
+def _session_rows(db_session, user_id, ids):
+    rows = db_session.execute(
+        select(SurfSession.id, SurfSession.date, SurfSession.location, SurfSession.board_id,
+               Board.name.label('board_name'),
+               *[getattr(SurfSession, feature) for feature in NUMERIC_FEATURES],
+               SurfSession.wave_quality, SurfSession.waves_caught, SurfSession.session_duration,
+               SurfSession.rating, SurfSession.notes)
+        .outerjoin(Board, SurfSession.board_id == Board.id)
+        .where(SurfSession.user_id == user_id, SurfSession.id.in_(ids))
+    ).mappings().all()
+    return {row['id']: dict(row, wave_quality=row['wave_quality'].value if row['wave_quality'] else None)
+            for row in rows}
+
+def _outcomes(sessions):
+    """How the matched sessions went, on average"""
+    def average(field):
+        values = [s[field] for s in sessions if s[field] is not None]
+        return round(sum(values) / len(values), 1) if values else None
+
+    return {field: average(field) for field in ('waves_caught', 'rating', 'session_duration')}
+
+def similar_sessions(user_id, conditions=None, location=None, board_id=None, session_id=None, k=10):
+    """
+    Past sessions with conditions most like the given ones (or like session
+    `session_id`'s), with how they went
+    Returns {"query", "sessions": [... with "distance"], "outcomes"}; raises
+    LookupError if `session_id` isn't one of the user's sessions.
+    """
+    conditions = {feature: value for feature, value in (conditions or {}).items()
+                  if feature in NUMERIC_FEATURES and value is not None}
+    k = max(1, min(int(k), MAX_RESULTS))
+    db_session = get_session()
+    try:
+        if session_id is not None:
+            reference = _session_rows(db_session, user_id, [session_id]).get(session_id)
+            if reference is None:
+                raise LookupError(f"No session {session_id}")
+            conditions = {feature: reference[feature] for feature in NUMERIC_FEATURES
+                          if reference[feature] is not None}
+            location = reference['location']
+            board_id = reference['board_id']
+
+        matches = get_matrix(db_session, user_id).nearest(conditions, k, location, board_id, exclude_id=session_id)
+        rows = _session_rows(db_session, user_id, [match_id for match_id, _ in matches])
+    finally:
+        db_session.close()
+
+    sessions = [dict(rows[match_id], distance=round(distance, 3))
+                for match_id, distance in matches if match_id in rows]
+    return {
+        'query': dict(conditions, location=location, board_id=board_id),
+        'sessions': sessions,
+        'outcomes': _outcomes(sessions),
+    }
+
+def main():
+    import argparse
+    import users
+
+    parser = argparse.ArgumentParser(description="Find past sessions with similar conditions")
+    parser.add_argument('--session', type=int, help="find sessions like this session id")
+    for feature in NUMERIC_FEATURES:
+        parser.add_argument(f"--{feature.replace('_', '-')}", dest=feature, type=float)
+    parser.add_argument('--location')
+    parser.add_argument('--board-id', type=int)
+    parser.add_argument('-k', type=int, default=10, help="number of sessions (default 10)")
+    args = parser.parse_args()
+
+    try:
+        result = similar_sessions(users.cli_user_id(), {f: getattr(args, f) for f in NUMERIC_FEATURES},
+                                  location=args.location, board_id=args.board_id,
+                                  session_id=args.session, k=args.k)
+    except LookupError as e:
+        raise SystemExit(f"Error: {e}")
+    for s in result['sessions']:
+        print(f"{s['distance']:7.2f}  {s['date']:%Y-%m-%d}  {s['location']:<20} {s['wave_height'] or '-'}ft  "
+              f"waves {s['waves_caught'] if s['waves_caught'] is not None else '-'}  "
+              f"rating {s['rating'] or '-'}")
+    outcomes = result['outcomes']
+    print(f"\nOn average: {outcomes['waves_caught']} waves, rating {outcomes['rating']}, "
+          f"{outcomes['session_duration']} minutes")
+
+if __name__ == "__main__":
+    main()
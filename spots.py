@@ -0,0 +1,388 @@
+"""
+Surf spot positions and nearby-spot queries
+
+Spots (name, latitude, longitude) are shared by all users, like tide and
+forecast data, and match session locations by name. Queries run against an
+in-process index: spots are bucketed into CELL_DEGREES grid cells, so a
+radius or map query only looks at the cells it overlaps, and a KD-tree over
+their positions on the unit sphere answers nearest-spot queries however
+sparse the spots around a point are. The index is built on first use and
+rebuilt whenever the spots data version changes, so every worker picks up
+spots added elsewhere.
+
+- nearby(): spots within a radius, closest first
+- nearest(): the closest spot, e.g. to name GPS-tagged imported sessions
+- map_summary(): a user's session counts per spot (or per grid cluster)
+  inside a map's bounding box
+"""
+import csv
+import math
+import threading
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from sqlalchemy import func, select
+from models import get_session, bump_data_version, get_data_version, Spot, SurfSession
+
+VERSION_NAME = 'spots'
+
+# Grid cell size; a cell is about 28 km tall
+CELL_DEGREES = 0.25
+EARTH_RADIUS_KM = 6371.0088
+# Imported sessions are named after the nearest spot within this distance
+ASSIGN_RADIUS_KM = 5
+
+SpotPoint = namedtuple('SpotPoint', 'id name latitude longitude')
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """Great-circle (haversine) distance between two points"""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def check_position(latitude, longitude):
+    """Raise ValueError unless latitude and longitude are valid degrees"""
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("latitude must be between -90 and 90 and longitude between -180 and 180")
+
+def _unit_vector(latitude, longitude):
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+class _KDTree:
+    """
+    3-d tree over points on the unit sphere
+    Straight-line (chord) distance between unit vectors grows with great-circle
+    distance, so the nearest vector is the nearest spot, with no special cases
+    at the poles or the antimeridian.
+    """
+
+    def __init__(self, points):
+        self.root = self._build(list(points), 0)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        return (points[middle], axis,
+                self._build(points[:middle], depth + 1), self._build(points[middle + 1:], depth + 1))
+
+    def nearest(self, target):
+        """The spot whose vector is closest to `target`"""
+        best = [float('inf'), None]
+
+        def search(node):
+            if node is None:
+                return
+            (vector, spot), axis, lower, upper = node
+            distance = sum((a - b) ** 2 for a, b in zip(vector, target))
+            if distance < best[0]:
+                best[:] = [distance, spot]
+            offset = target[axis] - vector[axis]
+            search(lower if offset < 0 else upper)
+            # The far side can only hold a closer spot if the splitting plane is closer
+            if offset * offset < best[0]:
+                search(upper if offset < 0 else lower)
+
+        search(self.root)
+        return best[1]
+
+class SpotIndex:
+    """
+    Uniform latitude/longitude grid over a fixed set of spots
+    Cells are keyed (row, column); columns wrap around the antimeridian. An
+    index is never changed after it is built, so threads can share it.
+    """
+
+    def __init__(self, spots, cell_degrees=CELL_DEGREES):
+        self.cell = cell_degrees
+        self.columns = int(round(360 / cell_degrees))
+        self.spots = list(spots)
+        cells = defaultdict(list)
+        for spot in self.spots:
+            cells[(self._row(spot.latitude), self._column(spot.longitude))].append(spot)
+        self.cells = dict(cells)
+        # Rings of grid cells get sparse over oceans, so nearest() without a
+        # radius uses a KD-tree instead
+        self.tree = _KDTree([(_unit_vector(spot.latitude, spot.longitude), spot) for spot in self.spots])
+
+    def __len__(self):
+        return len(self.spots)
+
+    def _row(self, latitude):
+        return math.floor(latitude / self.cell)
+
+    def _column(self, longitude):
+        return math.floor((longitude + 180) / self.cell) % self.columns
+
+    def _rows(self, south, north):
+        return range(self._row(max(south, -90)), self._row(min(north, 90)) + 1)
+
+    def _column_set(self, west, east):
+        """Columns from west to east, crossing the antimeridian when west > east"""
+        if east < west:
+            east += 360
+        if east - west >= 360:
+            return range(self.columns)
+        first = math.floor((west + 180) / self.cell)
+        last = math.floor((east + 180) / self.cell)
+        return {column % self.columns for column in range(first, last + 1)}
+
+    def _spots_in(self, rows, columns):
+        """Spots in the cells of `rows` x `columns`"""
+        if len(rows) * len(columns) > len(self.cells):
+            # Fewer occupied cells than cells to probe (large areas)
+            for (row, column), spots in self.cells.items():
+                if row in rows and column in columns:
+                    yield from spots
+        else:
+            for row in rows:
+                for column in columns:
+                    yield from self.cells.get((row, column), ())
+
+    def within(self, latitude, longitude, radius_km):
+        """[(distance km, spot)] for spots within `radius_km`, closest first"""
+        angle = radius_km / EARTH_RADIUS_KM
+        dlat = math.degrees(angle)
+        rows = self._rows(latitude - dlat, latitude + dlat)
+        # Widest longitude span of a circle around the point (all of them if it covers a pole)
+        reach = math.sin(min(angle, math.pi / 2)) / max(math.cos(math.radians(latitude)), 1e-12)
+        if latitude + dlat >= 90 or latitude - dlat <= -90 or reach >= 1:
+            columns = range(self.columns)
+        else:
+            dlon = math.degrees(math.asin(reach))
+            columns = self._column_set(longitude - dlon, longitude + dlon)
+
+        found = []
+        for spot in self._spots_in(rows, columns):
+            distance = distance_km(latitude, longitude, spot.latitude, spot.longitude)
+            if distance <= radius_km:
+                found.append((distance, spot))
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearest(self, latitude, longitude, max_km=None):
+        """(distance km, spot) of the closest spot, or None"""
+        if max_km is not None:
+            found = self.within(latitude, longitude, max_km)
+            return found[0] if found else None
+        if not self.spots:
+            return None
+        spot = self.tree.nearest(_unit_vector(latitude, longitude))
+        return distance_km(latitude, longitude, spot.latitude, spot.longitude), spot
+
+    def in_box(self, south, west, north, east):
+        """Spots inside a bounding box; west > east means it crosses the antimeridian"""
+        def inside(spot):
+            if not south <= spot.latitude <= north:
+                return False
+            if west <= east:
+                return west <= spot.longitude <= east
+            return spot.longitude >= west or spot.longitude <= east
+
+        return [spot for spot in self._spots_in(self._rows(south, north), self._column_set(west, east))
+                if inside(spot)]
+
+# Per-process caches: (spots data version, SpotIndex) and
+# {user id: (surf_sessions data version, {lowercase location: sessions})}
+_index = (None, None)
+_index_lock = threading.Lock()
+_session_counts = {}
+
+def get_index(db_session=None):
+    """The spot index, rebuilt first if spots changed since it was built"""
+    global _index
+    own_session = db_session is None
+    db_session = db_session or get_session()
+    try:
+        version, _ = get_data_version(db_session, VERSION_NAME)
+        cached_version, index = _index
+        if cached_version == version:
+            return index
+        with _index_lock:
+            cached_version, index = _index
+            if cached_version != version:
+                rows = db_session.execute(select(Spot.id, Spot.name, Spot.latitude, Spot.longitude)).all()
+                index = SpotIndex(SpotPoint(*row) for row in rows)
+                _index = (version, index)
+            return index
+    finally:
+        if own_session:
+            db_session.close()
+
+def _spot_dict(spot, distance=None):
+    result = {'id': spot.id, 'name': spot.name, 'latitude': spot.latitude, 'longitude': spot.longitude}
+    if distance is not None:
+        result['distance_km'] = round(distance, 3)
+    return result
+
+def nearby(latitude, longitude, radius_km, limit=50):
+    """Spots within `radius_km` of a point, closest first"""
+    check_position(latitude, longitude)
+    if radius_km is None or not 0 <= radius_km < math.inf:
+        raise ValueError("radius_km must be zero or more")
+    # A negative limit would slice from the end, dropping the closest spots
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return [_spot_dict(spot, distance)
+            for distance, spot in get_index().within(latitude, longitude, radius_km)[:limit]]
+
+def nearest(latitude, longitude, max_km=None):
+    """The spot closest to a point (within `max_km`, if given), or None"""
+    check_position(latitude, longitude)
+    if max_km is not None and not 0 <= max_km < math.inf:
+        raise ValueError("max_km must be zero or more")
+    found = get_index().nearest(latitude, longitude, max_km)
+    return _spot_dict(found[1], found[0]) if found else None
+
+def assign_locations(points, max_km=ASSIGN_RADIUS_KM):
+    """Name of the nearest spot within `max_km` for each (latitude, longitude), or None"""
+    index = get_index()
+    names = []
+    for latitude, longitude in points:
+        try:
+            check_position(latitude, longitude)
+        except ValueError:
+            names.append(None)
+            continue
+        found = index.nearest(latitude, longitude, max_km)
+        names.append(found[1].name if found else None)
+    return names
+
+def session_counts(db_session, user_id):
+    """{lowercase location: sessions} for a user, recounted only after their sessions change"""
+    version, _ = get_data_version(db_session, user_id=user_id)
+    cached_version, counts = _session_counts.get(user_id, (None, None))
+    if cached_version != version:
+        location = func.lower(SurfSession.location)
+        counts = dict(db_session.execute(
+            select(location, func.count()).where(SurfSession.user_id == user_id).group_by(location)
+        ).all())
+        _session_counts[user_id] = (version, counts)
+    return counts
+
+def map_summary(user_id, south, west, north, east, cell_degrees=None):
+    """
+    A user's sessions per spot inside a map's bounding box
+    With `cell_degrees`, spots are grouped into clusters of that grid size
+    (positioned at their mean) for zoomed-out maps.
+    """
+    check_position(south, west)
+    check_position(north, east)
+    if south > north:
+        raise ValueError("south must not be north of north")
+    db_session = get_session()
+    try:
+        spots = get_index(db_session).in_box(south, west, north, east)
+        counts = session_counts(db_session, user_id)
+    finally:
+        db_session.close()
+
+    if not cell_degrees:
+        return {'spots': [dict(_spot_dict(spot), sessions=counts.get(spot.name.lower(), 0)) for spot in spots]}
+
+    clusters = {}
+    for spot in spots:
+        key = (math.floor(spot.latitude / cell_degrees), math.floor(spot.longitude / cell_degrees))
+        cluster = clusters.setdefault(key, {'spots': 0, 'sessions': 0, 'latitude': 0.0, 'longitude': 0.0})
+        cluster['spots'] += 1
+        cluster['sessions'] += counts.get(spot.name.lower(), 0)
+        cluster['latitude'] += spot.latitude
+        cluster['longitude'] += spot.longitude
+    for cluster in clusters.values():
+        cluster['latitude'] = round(cluster['latitude'] / cluster['spots'], 6)
+        cluster['longitude'] = round(cluster['longitude'] / cluster['spots'], 6)
+    return {'clusters': list(clusters.values())}
+
+def save_spots(positions):
+    """Add or move spots from [(name, latitude, longitude)]; names match case-insensitively"""
+    for name, latitude, longitude in positions:
+        if not name or not name.strip():
+            raise ValueError("spot name is required")
+        check_position(latitude, longitude)
+    db_session = get_session()
+    try:
+        names = {name.strip().lower() for name, _, _ in positions}
+        existing = {spot.name.lower(): spot for spot in
+                    db_session.query(Spot).filter(func.lower(Spot.name).in_(names))}
+        for name, latitude, longitude in positions:
+            spot = existing.get(name.strip().lower())
+            if spot is None:
+                spot = existing[name.strip().lower()] = Spot(name=name.strip()[:100])
+                db_session.add(spot)
+            spot.latitude, spot.longitude, spot.updated_at = latitude, longitude, datetime.utcnow()
+        bump_data_version(db_session, VERSION_NAME)
+        db_session.commit()
+        return len(existing)
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+def remove_spot(name):
+    """Delete a spot; returns whether it existed"""
+    db_session = get_session()
+    try:
+        deleted = db_session.query(Spot).filter(func.lower(Spot.name) == name.strip().lower()).delete(
+            synchronize_session=False)
+        if deleted:
+            bump_data_version(db_session, VERSION_NAME)
+        db_session.commit()
+        return bool(deleted)
+    finally:
+        db_session.close()
+
+def read_spots_file(path):
+    """Read [(name, latitude, longitude)] from a CSV with name, latitude and longitude columns"""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        fields = {field.strip().lower(): field for field in reader.fieldnames or []}
+        columns = [fields.get('name') or fields.get('spot'), fields.get('latitude') or fields.get('lat'),
+                   fields.get('longitude') or fields.get('lon') or fields.get('lng')]
+        if None in columns:
+            raise ValueError(f"{path} needs name, latitude and longitude columns")
+        return [(row[columns[0]], float(row[columns[1]]), float(row[columns[2]]))
+                for row in reader if row[columns[0]]]
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage surf spot positions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="add or move a spot")
+    add.add_argument('name')
+    add.add_argument('latitude', type=float)
+    add.add_argument('longitude', type=float)
+    load = commands.add_parser('import', help="add or move spots from a CSV (name, latitude, longitude)")
+    load.add_argument('file')
+    remove = commands.add_parser('remove', help="delete a spot")
+    remove.add_argument('name')
+    commands.add_parser('list', help="list spots")
+    near = commands.add_parser('near', help="spots near a position")
+    near.add_argument('latitude', type=float)
+    near.add_argument('longitude', type=float)
+    near.add_argument('--radius', type=float, default=25, help="km (default 25)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'add':
+            save_spots([(args.name, args.latitude, args.longitude)])
+            print(f"Saved {args.name}")
+        elif args.command == 'import':
+            print(f"Saved {save_spots(read_spots_file(args.file))} spots")
+        elif args.command == 'remove':
+            print(f"Removed {args.name}" if remove_spot(args.name) else f"No spot named {args.name}")
+        elif args.command == 'list':
+            for spot in sorted(get_index().spots, key=lambda s: s.name.lower()):
+                print(f"{spot.name}: {spot.latitude:.5f}, {spot.longitude:.5f}")
+        else:
+            for spot in nearby(args.latitude, args.longitude, args.radius):
+                print(f"{spot['distance_km']:8.2f} km  {spot['name']}")
+    except ValueError as e:
+        raise SystemExit(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
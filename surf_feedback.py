@@ -1,16 +1,29 @@
 # This program asks about your surf session and responds to your feedback
 
 # Import required Python modules
-from datetime import datetime  # For handling dates and times
+from array import array       # Compact typed arrays for the session columns
+from collections import Counter  # For counting sessions per location
+from datetime import datetime, timedelta  # For handling dates and times
 import json                   # For saving/loading data in JSON format
+import math                   # For NaN checks on missing wave heights
 import os                     # For file operations
-from typing import List, Dict # For type hints (helps with code understanding and IDE support)
+from typing import Dict, Iterator, Optional, Tuple # For type hints (helps with code understanding and IDE support)
+
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+MINUTES_PER_DAY = 24 * 60
+
+def parse_date(value: str) -> datetime:
+    """Parse a stored 'YYYY-MM-DD HH:MM' date (fromisoformat is much faster than strptime)"""
+    return datetime.fromisoformat(value)
 
 class SurfSession:
     """
     A class to represent a single surf session.
     This demonstrates object-oriented programming in Python.
     """
+    # __slots__ stores attributes in fixed slots instead of a per-instance __dict__
+    __slots__ = ('quality', 'date', 'notes', 'wave_height', 'location')
+
     def __init__(self, quality: str, wave_height: float = None, location: str = None, date=None):
         """
         Constructor method - called when creating a new SurfSession
@@ -33,7 +46,7 @@ class SurfSession:
         """
         return {
             'quality': self.quality,
-            'date': self.date.strftime('%Y-%m-%d %H:%M'),  # Convert datetime to string
+            'date': self.date.strftime(DATE_FORMAT),  # Convert datetime to string
             'notes': self.notes,
             'wave_height': self.wave_height,
             'location': self.location
@@ -50,7 +63,7 @@ class SurfSession:
             quality=data['quality'],
             wave_height=data['wave_height'],
             location=data['location'],
-            date=datetime.strptime(data['date'], '%Y-%m-%d %H:%M')  # Convert string back to datetime
+            date=parse_date(data['date'])  # Convert string back to datetime
         )
         session.notes = data['notes']
         return session
@@ -60,48 +73,296 @@ class SurfSession:
         String representation of the session
         This magic method is called when you print() the object
         """
-        details = [f"Surf Session on {self.date.strftime('%Y-%m-%d %H:%M')}: {self.quality}"]
+        details = [f"Surf Session on {self.date.strftime(DATE_FORMAT)}: {self.quality}"]
         if self.wave_height:
             details.append(f"Wave Height: {self.wave_height}ft")
         if self.location:
             details.append(f"Location: {self.location}")
         return " | ".join(details)
 
+class SessionStore:
+    """
+    Columnar, list-like storage for surf sessions
+    Each field lives in its own compact array instead of one Python object
+    per session:
+    - dates are integer minutes since 0001-01-01
+    - wave heights are floats, with NaN for "not recorded"
+    - qualities and locations are integer ids into interned string tables
+    SurfSession objects are only built when a row is actually accessed.
+    """
+    def __init__(self):
+        self._minutes = array('q')
+        self._wave_heights = array('d')
+        self._quality_ids = array('i')  # Qualities are free text, so allow more than 256
+        self._location_ids = array('i')  # -1 means no location
+        self._notes = []
+        self._qualities = []      # Interned quality strings, indexed by id
+        self._quality_index = {}
+        self._locations = []      # Interned location names, indexed by id
+        self._location_index = {}
+
+    def __len__(self) -> int:
+        return len(self._minutes)
+
+    def __getitem__(self, index: int) -> SurfSession:
+        """Decode one row into a SurfSession"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("session index out of range")
+        return self._decode(self._minutes[index], self._wave_heights[index],
+                            self._quality_ids[index], self._location_ids[index],
+                            self._notes[index])
+
+    def __iter__(self) -> Iterator[SurfSession]:
+        columns = zip(self._minutes, self._wave_heights, self._quality_ids,
+                      self._location_ids, self._notes)
+        for row in columns:
+            yield self._decode(*row)
+
+    def _decode(self, minutes: int, wave_height: float, quality_id: int,
+                location_id: int, notes: str) -> SurfSession:
+        days, minute_of_day = divmod(minutes, MINUTES_PER_DAY)
+        session = SurfSession(
+            quality=self._qualities[quality_id],
+            wave_height=None if wave_height != wave_height else wave_height,  # NaN != NaN
+            location=self._locations[location_id] if location_id >= 0 else None,
+            date=datetime.fromordinal(days) + timedelta(minutes=minute_of_day)
+        )
+        session.notes = notes
+        return session
+
+    def append(self, session: SurfSession):
+        """Add a session, encoding it into the columns"""
+        self._append(session.quality, session.date, session.notes,
+                     session.wave_height, session.location)
+
+    def append_dict(self, data: Dict):
+        """Add a session straight from its JSON dictionary, without building a SurfSession"""
+        self._append(data['quality'], parse_date(data['date']), data['notes'],
+                     data['wave_height'], data['location'])
+
+    def _append(self, quality: str, date: datetime, notes: str,
+                wave_height: Optional[float], location: Optional[str]):
+        self._minutes.append(date.toordinal() * MINUTES_PER_DAY + date.hour * 60 + date.minute)
+        self._wave_heights.append(math.nan if wave_height is None else wave_height)
+        self._quality_ids.append(self._intern(quality, self._qualities, self._quality_index))
+        if location is None:
+            self._location_ids.append(-1)
+        else:
+            self._location_ids.append(self._intern(location, self._locations, self._location_index))
+        self._notes.append(notes or "")
+
+    @staticmethod
+    def _intern(value: str, values: list, index: Dict[str, int]) -> int:
+        """Return the id for `value`, adding it to the table the first time it's seen"""
+        value_id = index.get(value)
+        if value_id is None:
+            value_id = index[value] = len(values)
+            values.append(value)
+        return value_id
+
+    def count_quality(self, quality: str) -> int:
+        """Number of sessions with the given quality, counted from the id column"""
+        quality_id = self._quality_index.get(quality)
+        return 0 if quality_id is None else self._quality_ids.count(quality_id)
+
+    def wave_heights(self) -> Iterator[float]:
+        """Recorded wave heights (missing heights are skipped)"""
+        return (height for height in self._wave_heights if not math.isnan(height))
+
+    def location_counts(self) -> Dict[str, int]:
+        """Number of sessions per location"""
+        counts = Counter(self._location_ids)
+        counts.pop(-1, None)
+        return {self._locations[location_id]: count for location_id, count in counts.items()}
+
+    def to_dicts(self) -> Iterator[Dict]:
+        """Yield each row as a JSON-ready dictionary"""
+        for session in self:
+            yield session.to_dict()
+
+def read_journal(journal_filename: str, offset: int = 0) -> Iterator[Tuple[Dict, int]]:
+    """
+    Yield (entry, end_offset) for each complete journal line after `offset`
+    Each entry is {'seq': position in the log, 'session': session dictionary};
+    end_offset is the byte offset just past that line.
+    """
+    with open(journal_filename, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A crash mid-append leaves a partial last line; stop before it
+                break
+            offset += len(line)
+            yield json.loads(line), offset
+
+def read_log(filename: str) -> Tuple[list, int]:
+    """
+    Read a log's session dictionaries without loading or repairing it
+    Returns (sessions, journal_offset), where journal_offset is the byte
+    offset just past the last complete journal line read. Unlike SurfLog,
+    a partial last journal line is left alone, so a writer appending at
+    the same moment isn't disturbed.
+    """
+    sessions = []
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            sessions = json.load(f)
+    journal_filename = filename + ".journal"
+    journal_offset = 0
+    if os.path.exists(journal_filename):
+        for entry, journal_offset in read_journal(journal_filename):
+            # Entries already folded into the snapshot (crash during compaction) are skipped
+            if entry['seq'] >= len(sessions):
+                sessions.append(entry['session'])
+    return sessions, journal_offset
+
+def _fsync_dir(path: str):
+    """Flush a directory entry to disk so a rename inside it survives a crash"""
+    if not hasattr(os, 'O_DIRECTORY'):  # Not available on Windows
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
 class SurfLog:
     """
     A class to manage multiple surf sessions
     Handles saving/loading data and calculating statistics
+
+    Storage is a snapshot plus a journal:
+    - The snapshot (``surf_log.json``) is a JSON list of sessions
+    - The journal (``surf_log.json.journal``) has one JSON line per session
+      added since the snapshot was written
+    New sessions are appended to the journal, so adding one never rewrites
+    the whole log. Once the journal grows as large as the snapshot, the two
+    are compacted into a new snapshot.
     """
+    # Don't bother compacting until the journal holds at least this many entries
+    COMPACT_MIN_ENTRIES = 1000
+
     def __init__(self, filename: str = "surf_log.json"):
         """Initialize with a filename to store the data"""
         self.filename = filename
-        self.sessions: List[SurfSession] = []  # Type hint showing this is a list of SurfSession objects
+        self.journal_filename = filename + ".journal"
+        self.sessions = SessionStore()  # Behaves like a list of SurfSession objects
+        self.snapshot_count = 0  # Number of sessions stored in the snapshot file
+        self.journal_count = 0   # Number of sessions stored in the journal file
+        self._reset_statistics()
         self.load_sessions()  # Load existing sessions when created
 
     def add_session(self, session: SurfSession):
-        """Add a new session and save to file"""
+        """Add a new session and append it to the journal"""
         self.sessions.append(session)
-        self.save_sessions()
+        self._count_session(session)
+        self._append_to_journal(session, len(self.sessions) - 1)
+        if self.journal_count >= max(self.COMPACT_MIN_ENTRIES, self.snapshot_count):
+            self.compact()
 
     def load_sessions(self):
         """
-        Load sessions from JSON file
+        Load sessions from the snapshot, then replay the journal on top
         Demonstrates file handling and error checking
         """
+        self.sessions = SessionStore()
         if os.path.exists(self.filename):
             with open(self.filename, 'r') as f:  # 'with' ensures file is properly closed
                 data = json.load(f)
-                # List comprehension to convert each dictionary to a SurfSession
-                self.sessions = [SurfSession.from_dict(s) for s in data]
+            # Encode each dictionary straight into the columnar store
+            for s in data:
+                self.sessions.append_dict(s)
+            del data
+        self.snapshot_count = len(self.sessions)
+        self.journal_count = 0
+
+        if os.path.exists(self.journal_filename):
+            self._replay_journal()
+        self._rebuild_statistics()
+
+    def _replay_journal(self):
+        """Append the sessions recorded in the journal after the snapshot"""
+        good_offset = 0  # Byte offset just past the last complete journal line
+        for entry, good_offset in read_journal(self.journal_filename):
+            self.journal_count += 1
+            # Each entry records its position in the log, so entries already
+            # folded into the snapshot (crash during compaction) are skipped
+            if entry['seq'] < len(self.sessions):
+                continue
+            self.sessions.append_dict(entry['session'])
+        if good_offset < os.path.getsize(self.journal_filename):
+            # Cut the partial line off so the next append starts on a fresh line
+            with open(self.journal_filename, 'r+b') as f:
+                f.truncate(good_offset)
+
+    def _rebuild_statistics(self):
+        """Recompute the running statistics from the session columns"""
+        self._reset_statistics()
+        self.good_count = self.sessions.count_quality('good')
+        for height in self.sessions.wave_heights():
+            # Only sessions with a recorded height count towards the average
+            if height:
+                self.wave_height_sum += height
+                self.wave_height_count += 1
+        self.location_counts = self.sessions.location_counts()
+
+    def _reset_statistics(self):
+        """Zero the running totals used by get_statistics"""
+        self.good_count = 0
+        self.wave_height_sum = 0.0
+        self.wave_height_count = 0
+        self.location_counts: Dict[str, int] = {}
+
+    def _count_session(self, session: SurfSession):
+        """Fold one session into the running totals (O(1) per session)"""
+        if session.quality == 'good':
+            self.good_count += 1
+        # Only sessions with a recorded height count towards the average
+        if session.wave_height:
+            self.wave_height_sum += session.wave_height
+            self.wave_height_count += 1
+        if session.location:
+            self.location_counts[session.location] = self.location_counts.get(session.location, 0) + 1
 
     def save_sessions(self):
         """
         Save sessions to JSON file
         Demonstrates file writing and data serialization
         """
-        with open(self.filename, 'w') as f:
+        self.compact()
+
+    def compact(self):
+        """
+        Write every session into a new snapshot and empty the journal
+        The snapshot is written to a temporary file and renamed over the old
+        one, so a crash leaves either the old or the new snapshot intact
+        """
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, 'w') as f:
             # Convert each session to a dictionary, then save as JSON
-            json.dump([s.to_dict() for s in self.sessions], f, indent=2)
+            json.dump(list(self.sessions.to_dicts()), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, self.filename)
+        _fsync_dir(self.filename)
+
+        # Only clear the journal once the new snapshot is safely on disk
+        with open(self.journal_filename, 'w') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.snapshot_count = len(self.sessions)
+        self.journal_count = 0
+
+    def _append_to_journal(self, session: SurfSession, seq: int):
+        """Append one session to the journal and fsync it to disk"""
+        line = json.dumps({'seq': seq, 'session': session.to_dict()}) + "\n"
+        with open(self.journal_filename, 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_count += 1
 
     def get_statistics(self) -> Dict:
         """
@@ -111,26 +372,19 @@ class SurfLog:
         if not self.sessions:
             return {"message": "No sessions recorded yet!"}
 
-        # Calculate various statistics
+        # Statistics come from running totals kept up to date by add_session,
+        # so this is constant-time no matter how long the log is
         total_sessions = len(self.sessions)
-        good_sessions = sum(1 for s in self.sessions if s.quality == 'good')
-        
-        # Calculate average wave height (only for sessions with recorded height)
-        avg_wave_height = sum(s.wave_height for s in self.sessions if s.wave_height) / \
-                         sum(1 for s in self.sessions if s.wave_height)
-        
-        # Count sessions per location using a dictionary
-        locations = {}
-        for session in self.sessions:
-            if session.location:
-                locations[session.location] = locations.get(session.location, 0) + 1
+        avg_wave_height = None
+        if self.wave_height_count:
+            avg_wave_height = round(self.wave_height_sum / self.wave_height_count, 1)
 
         return {
             "total_sessions": total_sessions,
-            "good_sessions": good_sessions,
-            "good_session_percentage": (good_sessions / total_sessions) * 100,
-            "average_wave_height": round(avg_wave_height, 1),
-            "favorite_spots": locations
+            "good_sessions": self.good_count,
+            "good_session_percentage": (self.good_count / total_sessions) * 100,
+            "average_wave_height": avg_wave_height,
+            "favorite_spots": dict(self.location_counts)
         }
 
 def get_surf_feedback(surf_log: SurfLog) -> SurfSession:
@@ -166,9 +420,15 @@ def display_statistics(stats: Dict):
     Demonstrates string formatting and data presentation
     """
     print("\n=== Surf Session Statistics ===")
+    if 'message' in stats:
+        print(stats['message'])
+        return
     print(f"Total Sessions: {stats['total_sessions']}")
     print(f"Good Sessions: {stats['good_sessions']} ({stats['good_session_percentage']:.1f}%)")
-    print(f"Average Wave Height: {stats['average_wave_height']}ft")
+    if stats['average_wave_height'] is not None:
+        print(f"Average Wave Height: {stats['average_wave_height']}ft")
+    else:
+        print("Average Wave Height: Not recorded")
     
     if stats['favorite_spots']:
         print("\nFavorite Surf Spots:")
@@ -0,0 +1,105 @@
+import os
+from datetime import datetime
+from sqlalchemy import insert
+from models import get_session, bump_data_version, SurfSession, SurfLogSync, WaveQuality
+from surf_feedback import read_log, read_journal, parse_date
+import daily_activity
+import users
+
+# surf_feedback.py only records 'good' or 'bad'
+QUALITY_MAP = {
+    'good': WaveQuality.GOOD,
+    'bad': WaveQuality.POOR,
+}
+
+def to_db_row(data):
+    """Map a surf_feedback session dictionary onto surf_sessions columns"""
+    quality = data.get('quality')
+    return {
+        'date': parse_date(data['date']),
+        'location': data.get('location') or 'Unknown',  # location is required in the database
+        'wave_height': data.get('wave_height'),
+        'wave_quality': QUALITY_MAP.get(quality.lower()) if quality else None,
+        'notes': data.get('notes') or None,
+    }
+
+def _file_signature(path):
+    """Return (size, mtime_ns) of a file, or (None, None) if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None, None
+    return stat.st_size, stat.st_mtime_ns
+
+def find_new_entries(filename, state, snapshot_signature):
+    """
+    Return (entries, position, journal_offset) for log entries not yet synced
+
+    While the snapshot is unchanged since the last sync, only the journal
+    lines appended after the saved offset are read. Once the log has been
+    compacted into a new snapshot, the whole log is read a single time to
+    pick up where the last sync stopped.
+    """
+    journal_filename = filename + ".journal"
+    journal_size, _ = _file_signature(journal_filename)
+    journal_offset = state.journal_offset or 0
+
+    snapshot_unchanged = (state.snapshot_size, state.snapshot_mtime_ns) == snapshot_signature
+    if snapshot_unchanged and journal_size is not None and journal_offset <= journal_size:
+        entries = []
+        for entry, journal_offset in read_journal(journal_filename, journal_offset):
+            if entry['seq'] >= state.position:
+                entries.append(entry['session'])
+        return entries, state.position + len(entries), journal_offset
+    if snapshot_unchanged and journal_size is None:
+        return [], state.position, 0
+
+    # Read-only: the journal offset is where the reader stopped, so lines
+    # appended while it ran are picked up by the next sync
+    sessions, journal_offset = read_log(filename)
+    if len(sessions) < state.position:
+        print(f"Warning: {filename} has fewer entries than were already synced; skipping")
+        return [], state.position, state.journal_offset
+    return sessions[state.position:], len(sessions), journal_offset
+
+def sync_surf_log(filename="surf_log.json", user_id=None):
+    """Insert sessions added to the JSON surf log since the last sync, as the user's sessions"""
+    source = os.path.abspath(filename)
+    db_session = get_session()
+    try:
+        if user_id is None:
+            user_id = users.cli_user_id(db_session)
+        SurfLogSync.__table__.create(db_session.bind, checkfirst=True)
+        state = db_session.get(SurfLogSync, source)
+        if state is None:
+            state = SurfLogSync(source=source, position=0, journal_offset=0)
+            db_session.add(state)
+
+        # Taken before reading, so a compaction that races with this sync
+        # shows up as a changed snapshot next time
+        snapshot_signature = _file_signature(filename)
+        entries, position, journal_offset = find_new_entries(filename, state, snapshot_signature)
+        if entries:
+            # One multi-row INSERT for the whole batch
+            rows = [dict(to_db_row(e), user_id=user_id) for e in entries]
+            db_session.execute(insert(SurfSession), rows)
+            daily_activity.record_sessions(db_session, user_id, [(r['date'], None, None) for r in rows])
+            bump_data_version(db_session, user_id=user_id)
+
+        state.position = position
+        state.journal_offset = journal_offset
+        state.snapshot_size, state.snapshot_mtime_ns = snapshot_signature
+        state.synced_at = datetime.now()
+        db_session.commit()
+        print(f"Synced {len(entries)} new session(s) from {filename}")
+        return len(entries)
+    except Exception as e:
+        print(f"Error syncing surf log: {str(e)}")
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+if __name__ == "__main__":
+    import sys
+    sync_surf_log(sys.argv[1] if len(sys.argv) > 1 else "surf_log.json")
@@ -0,0 +1,23 @@
+from sqlalchemy import inspect, text
+from models import get_engine
+
+def update_schema():
+    """Index condition observations on lower(spot), which is how backfills look them up"""
+    engine = get_engine()
+    with engine.connect() as connection:
+        indexes = {index['name'] for index in inspect(connection).get_indexes('condition_observations')}
+        if 'ix_condition_observations_lower_spot_time' in indexes:
+            print("condition_observations is already indexed on lower(spot)")
+            return
+        print("Indexing condition_observations on lower(spot), observed_at...")
+        connection.execute(text(
+            "CREATE INDEX ix_condition_observations_lower_spot_time "
+            "ON condition_observations (lower(spot), observed_at)"
+        ))
+        if 'ix_condition_observations_spot_time' in indexes:
+            connection.execute(text("DROP INDEX ix_condition_observations_spot_time"))
+        connection.commit()
+        print("Schema update completed successfully!")
+
+if __name__ == "__main__":
+    update_schema()
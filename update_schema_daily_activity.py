@@ -0,0 +1,22 @@
+from models import get_engine, get_session, DailyActivity
+import daily_activity
+
+def update_schema():
+    """Create the daily_activity table and fill it from existing sessions"""
+    DailyActivity.__table__.create(get_engine(), checkfirst=True)
+
+    db_session = get_session()
+    try:
+        print("Rebuilding daily activity totals...")
+        daily_activity.rebuild(db_session)
+        db_session.commit()
+        print("Daily activity table is up to date!")
+    except Exception as e:
+        print(f"Error rebuilding daily activity: {str(e)}")
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+if __name__ == "__main__":
+    update_schema()
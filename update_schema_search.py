@@ -0,0 +1,57 @@
+from sqlalchemy import text
+from models import get_engine
+
+# PostgreSQL: a generated tsvector column keeps itself current on every
+# INSERT/UPDATE, and a GIN index makes @@ lookups fast
+POSTGRES_DDL = [
+    """
+    ALTER TABLE surf_sessions
+    ADD COLUMN IF NOT EXISTS notes_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(notes, ''))) STORED;
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ix_surf_sessions_notes_tsv
+    ON surf_sessions USING GIN (notes_tsv);
+    """,
+]
+
+# SQLite: an external-content FTS5 table kept in sync by triggers
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS surf_sessions_fts
+    USING fts5(notes, content='surf_sessions', content_rowid='id', tokenize='porter');
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS surf_sessions_fts_insert AFTER INSERT ON surf_sessions BEGIN
+        INSERT INTO surf_sessions_fts(rowid, notes) VALUES (new.id, new.notes);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS surf_sessions_fts_delete AFTER DELETE ON surf_sessions BEGIN
+        INSERT INTO surf_sessions_fts(surf_sessions_fts, rowid, notes) VALUES ('delete', old.id, old.notes);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS surf_sessions_fts_update AFTER UPDATE OF notes ON surf_sessions BEGIN
+        INSERT INTO surf_sessions_fts(surf_sessions_fts, rowid, notes) VALUES ('delete', old.id, old.notes);
+        INSERT INTO surf_sessions_fts(rowid, notes) VALUES (new.id, new.notes);
+    END;
+    """,
+    # Index any sessions that existed before the table was created
+    "INSERT INTO surf_sessions_fts(surf_sessions_fts) VALUES ('rebuild');",
+]
+
+def update_schema(engine=None):
+    """Add the full-text search index over session notes"""
+    engine = engine or get_engine()
+    statements = SQLITE_DDL if engine.dialect.name == 'sqlite' else POSTGRES_DDL
+
+    with engine.connect() as connection:
+        print("Creating full-text search index on notes...")
+        for statement in statements:
+            connection.execute(text(statement))
+        connection.commit()
+        print("Search index ready!")
+
+if __name__ == "__main__":
+    update_schema()
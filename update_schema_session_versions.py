@@ -0,0 +1,18 @@
+from sqlalchemy import inspect, text
+from models import get_engine
+
+def update_schema():
+    """Add the version column that bulk edits use to detect concurrent changes"""
+    engine = get_engine()
+    with engine.connect() as connection:
+        columns = {column['name'] for column in inspect(connection).get_columns('surf_sessions')}
+        if 'version' in columns:
+            print("surf_sessions.version already exists")
+            return
+        print("Adding version to surf_sessions...")
+        connection.execute(text("ALTER TABLE surf_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        connection.commit()
+        print("Schema update completed successfully!")
+
+if __name__ == "__main__":
+    update_schema()
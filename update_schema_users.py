@@ -0,0 +1,65 @@
+import getpass
+import sys
+from sqlalchemy import inspect, text
+from werkzeug.security import generate_password_hash
+from models import get_engine, get_session, AnalyticsState, Board, DailyActivity, SurfSession, User
+import daily_activity
+
+def update_schema(username):
+    """
+    Add users, and give every existing session and board to `username`
+    Adds the user_id columns with their (user_id, ...) indexes, moves
+    daily_activity to per-user rows, and clears analytics state that was
+    computed over everyone's sessions.
+    """
+    engine = get_engine()
+
+    print("Creating users table...")
+    User.__table__.create(engine, checkfirst=True)
+
+    db_session = get_session()
+    try:
+        owner = db_session.query(User).filter(User.username == username).first()
+        if owner is None:
+            password = getpass.getpass(f"Password for {username}: ")
+            owner = User(username=username, password_hash=generate_password_hash(password))
+            db_session.add(owner)
+            db_session.commit()
+            print(f"Created user {username}")
+        owner_id = owner.id
+    finally:
+        db_session.close()
+
+    with engine.connect() as connection:
+        for table in (Board.__table__, SurfSession.__table__):
+            columns = {column['name'] for column in inspect(connection).get_columns(table.name)}
+            if 'user_id' not in columns:
+                print(f"Adding user_id to {table.name}...")
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN user_id INTEGER REFERENCES users(id)"))
+            connection.execute(text(f"UPDATE {table.name} SET user_id = :owner WHERE user_id IS NULL"),
+                               {'owner': owner_id})
+            if engine.dialect.name == 'postgresql':
+                connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN user_id SET NOT NULL"))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+        # The primary key changes from (day) to (user_id, day)
+        print("Rebuilding daily activity per user...")
+        DailyActivity.__table__.drop(connection, checkfirst=True)
+        DailyActivity.__table__.create(connection)
+        connection.execute(AnalyticsState.__table__.delete())
+        connection.commit()
+
+    db_session = get_session()
+    try:
+        daily_activity.rebuild(db_session)
+        db_session.commit()
+        print("Schema update completed successfully!")
+    finally:
+        db_session.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python update_schema_users.py <username for existing data>")
+        sys.exit(1)
+    update_schema(sys.argv[1])
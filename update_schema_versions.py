@@ -0,0 +1,21 @@
+from models import get_engine, get_session, Base, DataVersion
+
+def update_schema():
+    """Create the data_versions and surf_log_sync tables and seed the session version"""
+    engine = get_engine()
+
+    print("Creating missing tables...")
+    # create_all only creates tables that don't exist yet
+    Base.metadata.create_all(engine)
+
+    db_session = get_session()
+    try:
+        if db_session.get(DataVersion, 'surf_sessions') is None:
+            db_session.add(DataVersion(name='surf_sessions', version=1))
+            db_session.commit()
+        print("Schema update completed successfully!")
+    finally:
+        db_session.close()
+
+if __name__ == "__main__":
+    update_schema()
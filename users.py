@@ -0,0 +1,108 @@
+"""
+Surfer accounts
+
+Every session and board belongs to a user. The web app signs users in with
+a username and password (or HTTP Basic auth for the API). Command-line
+tools act as the user named by SURFTRACKER_USER, or as the only user when
+there is just one.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+from models import get_session, User
+
+# check_password_hash is deliberately slow (pbkdf2), and API clients send
+# their password with every request. Passwords that matched are remembered
+# for a while, per process, as a keyed digest (never in plain text) tied to
+# the stored hash, so changing the password invalidates them.
+AUTH_CACHE_SECONDS = 300
+AUTH_CACHE_SIZE = 1000
+_auth_cache = {}  # (password hash, digest of the password given) -> expiry time
+_auth_cache_lock = threading.Lock()
+_auth_cache_key = os.urandom(32)
+
+def create_user(username, password):
+    """Add a user and return their id"""
+    db_session = get_session()
+    try:
+        user = User(username=username, password_hash=generate_password_hash(password))
+        db_session.add(user)
+        db_session.commit()
+        return user.id
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+
+def authenticate(username, password):
+    """Return the user's id if the password matches, otherwise None"""
+    db_session = get_session()
+    try:
+        user = db_session.query(User).filter(User.username == username).first()
+    finally:
+        db_session.close()
+    if user is None:
+        return None
+    key = (user.password_hash, hmac.new(_auth_cache_key, password.encode('utf-8'), hashlib.sha256).digest())
+    now = time.monotonic()
+    if _auth_cache.get(key, 0) > now:
+        return user.id
+    if not check_password_hash(user.password_hash, password):
+        return None
+    with _auth_cache_lock:
+        if len(_auth_cache) >= AUTH_CACHE_SIZE:
+            for stale in [k for k, expires in _auth_cache.items() if expires <= now] or list(_auth_cache):
+                del _auth_cache[stale]
+        _auth_cache[key] = now + AUTH_CACHE_SECONDS
+    return user.id
+
+def cli_user_id(db_session=None):
+    """The user command-line tools act for (SURFTRACKER_USER, or the only user)"""
+    own_session = db_session is None
+    db_session = db_session or get_session()
+    try:
+        username = os.getenv('SURFTRACKER_USER')
+        if username:
+            user = db_session.query(User).filter(User.username == username).first()
+            if user is None:
+                raise SystemExit(f"No user named '{username}' (see: python users.py add)")
+            return user.id
+        users = db_session.query(User.id).limit(2).all()
+        if len(users) != 1:
+            raise SystemExit("Set SURFTRACKER_USER to the username to act as")
+        return users[0].id
+    finally:
+        if own_session:
+            db_session.close()
+
+def main():
+    import argparse
+    import getpass
+
+    parser = argparse.ArgumentParser(description="Manage surfer accounts")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="create a user")
+    add.add_argument('username')
+    commands.add_parser('list', help="list users")
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        password = getpass.getpass(f"Password for {args.username}: ")
+        if not password:
+            print("A password is required")
+            return
+        print(f"Created user {args.username} (id {create_user(args.username, password)})")
+    else:
+        db_session = get_session()
+        try:
+            for user in db_session.query(User).order_by(User.username):
+                print(f"{user.id}: {user.username}")
+        finally:
+            db_session.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,233 @@
-from models import get_session, SurfSession
-from datetime import datetime
+"""
+Data integrity checks for surf sessions and boards
 
-def verify_data():
-    """Verify the imported surf session data"""
-    db_session = get_session()
+Most checks are aggregate SQL queries: the database does the counting and
+only a few sample rows per problem come back. The one check that has to look
+at rows in order (dates that look like typos) streams them through a
+server-side cursor. Memory use stays the same however many sessions there
+are.
+
+Prints a readable report, or with --json a machine-readable one. Exits with
+status 1 when any check of severity "error" finds problems.
+"""
+import json
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select
+from models import get_engine, Board, SurfSession
+
+# Sample rows kept per check
+SAMPLE_LIMIT = 10
+# Rows fetched per round trip when streaming
+STREAM_BATCH = 10000
+
+# Bounds outside which a value is almost certainly a data entry mistake
+MAX_WAVE_HEIGHT = 60  # feet
+MAX_DURATION = 12 * 60  # minutes
+MAX_WAVES_CAUGHT = 500
+MIN_DATE = datetime(1950, 1, 1)
+# A session more than this far from the user's sessions on both sides looks
+# like a mistyped year (e.g. 2020-09-28 entered for 2023-09-28)
+DATE_GAP_DAYS = 365
+
+def _result(name, severity, description, count, samples):
+    return {
+        'name': name,
+        'severity': severity,
+        'description': description,
+        'count': int(count or 0),
+        'samples': [{key: (value.isoformat() if isinstance(value, datetime) else value)
+                     for key, value in dict(sample).items()} for sample in samples],
+    }
+
+def _query_check(connection, name, severity, description, query):
+    """Count the rows `query` returns and keep the first few as samples"""
+    count = connection.scalar(select(func.count()).select_from(query.subquery()))
+    samples = connection.execute(query.limit(SAMPLE_LIMIT)).mappings().all() if count else []
+    return _result(name, severity, description, count, samples)
+
+def check_duplicates(connection):
+    location = func.lower(SurfSession.location)
+    groups = (
+        select(SurfSession.user_id, SurfSession.date, location.label('location'),
+               func.count().label('sessions'), func.min(SurfSession.id).label('first_id'),
+               func.max(SurfSession.id).label('last_id'))
+        .group_by(SurfSession.user_id, SurfSession.date, location)
+        .having(func.count() > 1)
+        .order_by(func.count().desc(), func.min(SurfSession.id))
+    )
+    result = _query_check(connection, 'duplicate_sessions', 'warning',
+                          "Sessions of the same user at the same spot and start time", groups)
+    # Count the extra copies, not the groups
+    subquery = groups.subquery()
+    result['count'] = int(connection.scalar(select(func.coalesce(func.sum(subquery.c.sessions - 1), 0))))
+    return result
+
+def check_boards(connection):
+    missing = _query_check(
+        connection, 'unknown_boards', 'error', "Sessions whose board_id has no board",
+        select(SurfSession.id, SurfSession.user_id, SurfSession.board_id)
+        .outerjoin(Board, SurfSession.board_id == Board.id)
+        .where(SurfSession.board_id.isnot(None), Board.id.is_(None))
+        .order_by(SurfSession.id)
+    )
+    other_user = _query_check(
+        connection, 'boards_of_other_users', 'error', "Sessions using a board owned by another user",
+        select(SurfSession.id, SurfSession.user_id, SurfSession.board_id, Board.user_id.label('board_user_id'))
+        .join(Board, SurfSession.board_id == Board.id)
+        .where(Board.user_id != SurfSession.user_id)
+        .order_by(SurfSession.id)
+    )
+    orphaned = _query_check(
+        connection, 'orphaned_boards', 'info', "Boards no session uses",
+        select(Board.id, Board.user_id, Board.name)
+        .where(~select(SurfSession.id).where(SurfSession.board_id == Board.id).exists())
+        .order_by(Board.id)
+    )
+    return [missing, other_user, orphaned]
+
+def check_ranges(connection):
+    def out_of_range(name, description, column, low, high):
+        return _query_check(
+            connection, name, 'warning', description,
+            select(SurfSession.id, SurfSession.user_id, SurfSession.date, column)
+            .where(or_(column < low, column > high))
+            .order_by(SurfSession.id)
+        )
+
+    return [
+        out_of_range('implausible_wave_heights', f"Wave heights below 0 or above {MAX_WAVE_HEIGHT} ft",
+                     SurfSession.wave_height, 0, MAX_WAVE_HEIGHT),
+        out_of_range('implausible_durations', f"Durations below 1 or above {MAX_DURATION} minutes",
+                     SurfSession.session_duration, 1, MAX_DURATION),
+        out_of_range('implausible_waves_caught', f"Waves caught below 0 or above {MAX_WAVES_CAUGHT}",
+                     SurfSession.waves_caught, 0, MAX_WAVES_CAUGHT),
+        out_of_range('implausible_dates', f"Dates before {MIN_DATE:%Y} or in the future",
+                     SurfSession.date, MIN_DATE, datetime.now() + timedelta(days=1)),
+        _query_check(connection, 'sessions_without_user', 'error', "Sessions with no owner",
+                     select(SurfSession.id, SurfSession.date, SurfSession.location)
+                     .where(SurfSession.user_id.is_(None))
+                     .order_by(SurfSession.id)),
+    ]
+
+def _suggest_date(when, neighbour):
+    """The same day in the neighbouring session's year, if that year fits"""
     try:
-        # Get all surf sessions
-        surf_sessions = db_session.query(SurfSession).all()
-        
-        print(f"\nFound {len(surf_sessions)} surf sessions in database:")
-        print("\nSample of first 5 sessions:")
-        for i, surf_session in enumerate(surf_sessions[:5]):
-            print(f"\nSession {i + 1}:")
-            print(f"Date: {surf_session.date}")
-            print(f"Location: {surf_session.location}")
-            print(f"Wave Height: {surf_session.wave_height}ft")
-            print(f"Duration: {surf_session.session_duration} minutes")
-            print(f"Waves Caught: {surf_session.waves_caught or 'Not recorded'}")
-            print(f"Notes: {surf_session.notes}")
-        
-        # Print some statistics
-        print("\nStatistics:")
-        print(f"Total sessions: {len(surf_sessions)}")
-        
-        # Calculate total waves caught
-        total_waves = sum(s.waves_caught or 0 for s in surf_sessions)
-        sessions_with_waves = sum(1 for s in surf_sessions if s.waves_caught is not None)
-        avg_waves = total_waves / sessions_with_waves if sessions_with_waves > 0 else 0
-        
-        print(f"Total waves caught: {total_waves}")
-        print(f"Average waves per session: {avg_waves:.1f}")
-        
-        # Count sessions by location
-        locations = {}
-        for surf_session in surf_sessions:
-            locations[surf_session.location] = locations.get(surf_session.location, 0) + 1
-        
-        print("\nSessions by location:")
-        for location, count in sorted(locations.items(), key=lambda x: x[1], reverse=True):
-            print(f"{location}: {count} sessions")
-            
-    finally:
-        db_session.close()
+        suggested = when.replace(year=neighbour.year)
+    except ValueError:  # 29 February
+        return None
+    return suggested if abs(suggested - neighbour) <= timedelta(days=DATE_GAP_DAYS) else None
+
+def check_isolated_dates(connection):
+    """
+    Find sessions far from all of the user's other sessions, streaming
+    (user_id, date) in index order and keeping only a three-row window
+    """
+    gap = timedelta(days=DATE_GAP_DAYS)
+    count = 0
+    samples = []
+
+    def consider(before, row, after):
+        nonlocal count
+        neighbours = [n for n in (before, after) if n is not None and n.user_id == row.user_id]
+        if not neighbours or any(abs(row.date - n.date) <= gap for n in neighbours):
+            return
+        count += 1
+        if len(samples) < SAMPLE_LIMIT:
+            nearest = min(neighbours, key=lambda n: abs(row.date - n.date))
+            suggested = _suggest_date(row.date, nearest.date)
+            samples.append({'id': row.id, 'user_id': row.user_id, 'date': row.date,
+                            'suggested_date': suggested})
+
+    rows = connection.execution_options(stream_results=True, yield_per=STREAM_BATCH).execute(
+        select(SurfSession.id, SurfSession.user_id, SurfSession.date)
+        .order_by(SurfSession.user_id, SurfSession.date)
+    )
+    before = current = None
+    for row in rows:
+        if current is not None:
+            consider(before, current, row)
+        before, current = current, row
+    if current is not None:
+        consider(before, current, None)
+
+    return _result('isolated_dates', 'warning',
+                   f"Sessions more than {DATE_GAP_DAYS} days from the user's other sessions (year typos)",
+                   count, samples)
+
+def summarize(connection):
+    totals = connection.execute(select(
+        func.count(), func.count(func.distinct(SurfSession.user_id)),
+        func.coalesce(func.sum(SurfSession.waves_caught), 0), func.avg(SurfSession.waves_caught),
+        func.min(SurfSession.date), func.max(SurfSession.date)
+    )).one()
+    locations = connection.execute(
+        select(SurfSession.location, func.count().label('sessions'))
+        .group_by(SurfSession.location)
+        .order_by(func.count().desc())
+        .limit(SAMPLE_LIMIT)
+    ).all()
+    return {
+        'sessions': totals[0],
+        'users': totals[1],
+        'total_waves': int(totals[2]),
+        'average_waves_per_session': round(float(totals[3]), 1) if totals[3] is not None else None,
+        'first_session': totals[4].isoformat() if totals[4] else None,
+        'last_session': totals[5].isoformat() if totals[5] else None,
+        'top_locations': [{'location': location, 'sessions': sessions} for location, sessions in locations],
+    }
+
+def verify_data():
+    """Run every check and return the report"""
+    engine = get_engine()
+    with engine.connect() as connection:
+        checks = [check_duplicates(connection)]
+        checks += check_boards(connection)
+        checks += check_ranges(connection)
+        checks.append(check_isolated_dates(connection))
+        summary = summarize(connection)
+
+    return {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'database': engine.dialect.name,
+        'ok': not any(c['count'] for c in checks if c['severity'] == 'error'),
+        'summary': summary,
+        'checks': checks,
+    }
+
+def print_report(report):
+    summary = report['summary']
+    print(f"\n{summary['sessions']} sessions from {summary['users']} users "
+          f"({summary['first_session'] or '-'} to {summary['last_session'] or '-'})")
+    print(f"Total waves caught: {summary['total_waves']}")
+    print(f"Average waves per session: {summary['average_waves_per_session'] or 0:.1f}")
+    print("\nTop locations:")
+    for row in summary['top_locations']:
+        print(f"  {row['location']}: {row['sessions']} sessions")
+
+    print("\nChecks:")
+    for check in report['checks']:
+        status = 'ok' if not check['count'] else f"{check['count']} found"
+        print(f"  [{check['severity']}] {check['name']}: {status} - {check['description']}")
+        for sample in check['samples']:
+            print(f"      {sample}")
+    print("\nAll error checks passed" if report['ok'] else "\nErrors found")
 
 if __name__ == "__main__":
-    verify_data() 
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check surf session data for problems")
+    parser.add_argument('--json', nargs='?', const='-', metavar='FILE',
+                        help="write the report as JSON to FILE (or stdout)")
+    args = parser.parse_args()
+
+    report = verify_data()
+    if args.json == '-':
+        print(json.dumps(report, indent=2, default=str))
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print_report(report)
+    else:
+        print_report(report)
+    sys.exit(0 if report['ok'] else 1)
@@ -1,41 +1,160 @@
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from sqlalchemy import create_engine, text
-from models import get_session, SurfSession, Board
+# pandas and plotly are imported inside the functions that use them, so
+# importing this module (e.g. from app.py or a CLI) stays cheap
+from sqlalchemy import select, text
+from models import get_session, bump_data_version, SurfSession, Board
+from metrics import time_phase
+import daily_activity
 import calendar
 from datetime import datetime
 import os
 
-# Ensure the static/visualizations directory exists
-os.makedirs('static/visualizations', exist_ok=True)
+VISUALIZATIONS_DIR = 'static/visualizations'
 
-def load_data_from_db():
-    """Load surf session data from database into a pandas DataFrame"""
+EMPTY_SUMMARY_STATS = {
+    'total_sessions': 0, 'total_waves': 0, 'avg_waves_per_session': 0,
+    'total_hours': 0, 'favorite_spot': '-', 'favorite_board': '-',
+}
+
+def get_boards(user_id):
+    """Get a user's boards, for the board picker on the add session form"""
     session = get_session()
-    
-    # Query all surf sessions with board information
-    query = """
-    SELECT 
-        s.date,
-        s.location,
-        s.wave_height,
-        s.session_duration,
-        s.waves_caught,
-        s.notes,
-        b.name as board_name
+    try:
+        return session.query(Board).filter(Board.user_id == user_id).order_by(Board.name).all()
+    finally:
+        session.close()
+
+def add_session_to_db(user_id, date, location, board_id, wave_height, session_duration, waves_caught, notes):
+    """Add a surf session submitted through the web form"""
+    session = get_session()
+    try:
+        board = session.get(Board, int(board_id)) if board_id else None
+        if board_id and (board is None or board.user_id != user_id):
+            raise ValueError("Unknown board")
+        surf_session = SurfSession(
+            user_id=user_id,
+            date=datetime.strptime(date, '%Y-%m-%d'),
+            location=location,
+            board_id=board.id if board else None,
+            wave_height=wave_height,
+            session_duration=session_duration,
+            waves_caught=waves_caught,
+            notes=notes
+        )
+        session.add(surf_session)
+        daily_activity.record_sessions(session, user_id, [(surf_session.date, waves_caught, session_duration)])
+        bump_data_version(session, user_id=user_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+# Columns load_data_from_db can select, with the SQL for each
+SESSION_COLUMNS = {
+    'date': 's.date',
+    'location': 's.location',
+    'board_name': 'b.name AS board_name',
+    'wave_height': 's.wave_height',
+    'session_duration': 's.session_duration',
+    'waves_caught': 's.waves_caught',
+    'notes': 's.notes',
+}
+# What the dashboard stats and charts use. Notes are left out: they are most
+# of the memory of a session row and only the recent sessions table shows them.
+CHART_COLUMNS = ['date', 'location', 'board_name', 'wave_height', 'session_duration', 'waves_caught']
+# Low-cardinality strings, stored as pandas categories (one small code per row)
+CATEGORY_COLUMNS = ('location', 'board_name')
+INTEGER_COLUMNS = ('session_duration', 'waves_caught')
+# Rows read per chunk, so strings become categories before the next chunk arrives
+LOAD_CHUNK_ROWS = 100000
+
+def _categorize(chunk):
+    for column in CATEGORY_COLUMNS:
+        if column in chunk:
+            chunk[column] = chunk[column].astype('category')
+    return chunk
+
+def compact_frame(chunks, columns):
+    """
+    Combine chunks read by load_data_from_db into one memory-lean DataFrame
+    Categories are unified across chunks (pd.concat would turn mismatched
+    ones back into object columns), integers are downcast to the smallest
+    type that fits and floats to float32. Integer columns with missing values
+    stay floats, so they keep working with plotly and NaN-aware aggregations.
+    """
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    chunks = [_categorize(chunk) for chunk in chunks]
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    for column in CATEGORY_COLUMNS:
+        if column in chunks[0] and len(chunks) > 1:
+            categories = union_categoricals([chunk[column] for chunk in chunks]).categories
+            for chunk in chunks:
+                chunk[column] = chunk[column].cat.set_categories(categories)
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+    for column in INTEGER_COLUMNS:
+        if column in df:
+            downcast = 'integer' if df[column].notna().all() else 'float'
+            df[column] = pd.to_numeric(df[column], downcast=downcast)
+    if 'wave_height' in df:
+        df['wave_height'] = df['wave_height'].astype('float32')
+    return df
+
+def load_data_from_db(user_id, columns=CHART_COLUMNS):
+    """
+    Load a user's surf sessions into a typed pandas DataFrame
+    Only `columns` (keys of SESSION_COLUMNS) are selected; see compact_frame
+    for the dtypes.
+    """
+    import pandas as pd
+
+    unknown = set(columns) - set(SESSION_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown session columns: {', '.join(sorted(unknown))}")
+
+    # The user's rows come from a range scan of the (user_id, date) index;
+    # boards are only joined when their names are wanted
+    query = f"""
+    SELECT {', '.join(SESSION_COLUMNS[column] for column in columns)}
     FROM surf_sessions s
-    LEFT JOIN boards b ON s.board_id = b.id
+    {'LEFT JOIN boards b ON s.board_id = b.id' if 'board_name' in columns else ''}
+    WHERE s.user_id = :user_id
     ORDER BY s.date
     """
-    
-    df = pd.read_sql(query, session.bind)
-    session.close()
+
+    session = get_session()
+    try:
+        with time_phase('load_data'):
+            chunks = pd.read_sql(text(query), session.bind, params={'user_id': user_id},
+                                 parse_dates=['date'] if 'date' in columns else None,
+                                 chunksize=LOAD_CHUNK_ROWS)
+            df = compact_frame(chunks, columns)
+    finally:
+        session.close()
     return df
 
-def create_progression_charts(df):
+def add_date_parts(df):
+    """
+    Add integer year and month columns
+    Truncating the datetime64 values to months gives months since 1970 in one
+    vectorized cast, and year and month follow with integer arithmetic.
+    """
+    months = df['date'].to_numpy().astype('datetime64[M]').astype('int64')
+    df['year'] = (months // 12 + 1970).astype('int16')
+    df['month'] = (months % 12 + 1).astype('int8')
+    return df
+
+def create_progression_charts(df, output_dir=VISUALIZATIONS_DIR):
     """Create charts showing surfing progression"""
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     # Average waves per session by month and year
     monthly_waves = df.groupby(['year', 'month']).agg({
         'waves_caught': ['mean', 'count']
@@ -62,7 +181,7 @@ def create_progression_charts(df):
     )
     
     fig_progression.update_layout(height=800, title_text="Surfing Progression")
-    fig_progression.write_html('static/visualizations/progression.html')
+    fig_progression.write_html(os.path.join(output_dir, 'progression.html'))
     
     # Monthly patterns across years
     monthly_patterns = df.groupby(['year', 'month'])['waves_caught'].agg(['mean', 'count']).reset_index()
@@ -70,95 +189,132 @@ def create_progression_charts(df):
                          title='Average Waves by Month (Year Comparison)',
                          labels={'month': 'Month', 'mean': 'Average Waves Caught'})
     fig_monthly.update_xaxes(ticktext=calendar.month_abbr[1:], tickvals=list(range(1,13)))
-    fig_monthly.write_html('static/visualizations/monthly_patterns.html')
+    fig_monthly.write_html(os.path.join(output_dir, 'monthly_patterns.html'))
     
     return monthly_patterns
 
+def _most_common(series, default='-'):
+    """The most frequent value in `series`, or `default` when it has none (e.g. no boards set)"""
+    modes = series.mode()
+    return modes.iloc[0] if len(modes) else default
+
 def create_summary_stats(df):
     """Create summary statistics for the dashboard"""
     total_sessions = len(df)
     total_waves = df['waves_caught'].sum()
     avg_waves_per_session = df['waves_caught'].mean()
     total_hours = df['session_duration'].sum() / 60
-    favorite_spot = df['location'].mode().iloc[0]
-    favorite_board = df['board_name'].mode().iloc[0]
+    favorite_spot = _most_common(df['location'])
+    favorite_board = _most_common(df['board_name'])
     
     return {
         'total_sessions': total_sessions,
         'total_waves': int(total_waves),
-        'avg_waves_per_session': round(avg_waves_per_session, 1),
-        'total_hours': round(total_hours, 1),
+        'avg_waves_per_session': round(float(avg_waves_per_session), 1),
+        'total_hours': round(float(total_hours), 1),
         'favorite_spot': favorite_spot,
         'favorite_board': favorite_board
     }
 
 def create_yearly_stats(df):
     """Create year-by-year statistics"""
+    # compact_frame stores float32 columns; widen the aggregates before
+    # rounding so 2.3 doesn't come out as 2.299999952316284
     yearly_stats = df.groupby('year').agg({
         'waves_caught': ['count', 'sum', 'mean'],
         'session_duration': 'sum',
         'wave_height': 'mean'
-    }).round(1)
+    }).astype('float64').round(1)
     
     yearly_stats.columns = ['sessions', 'total_waves', 'avg_waves_per_session', 'total_minutes', 'avg_wave_height']
     yearly_stats['total_hours'] = (yearly_stats['total_minutes'] / 60).round(1)
     yearly_stats = yearly_stats.drop('total_minutes', axis=1)
+    yearly_stats[['sessions', 'total_waves']] = yearly_stats[['sessions', 'total_waves']].astype('int64')
     
     return yearly_stats.reset_index().to_dict('records')
 
-def get_recent_sessions(df):
-    """Get the last 10 surf sessions"""
-    recent_sessions = df.sort_values('date', ascending=False).head(10)
-    return recent_sessions[['date', 'location', 'board_name', 'wave_height', 'session_duration', 'waves_caught', 'notes']].to_dict('records')
+def get_recent_sessions(user_id, limit=10):
+    """Get a user's last `limit` surf sessions, with notes, for the dashboard table"""
+    session = get_session()
+    try:
+        # Selected through the ORM columns so dates come back as datetimes on SQLite too
+        rows = session.execute(
+            select(SurfSession.id, SurfSession.date, SurfSession.location, Board.name.label('board_name'),
+                   SurfSession.wave_height, SurfSession.session_duration, SurfSession.waves_caught,
+                   SurfSession.notes)
+            .outerjoin(Board, SurfSession.board_id == Board.id)
+            .where(SurfSession.user_id == user_id)
+            .order_by(SurfSession.date.desc())
+            .limit(limit)
+        ).mappings().all()
+    finally:
+        session.close()
+    return [dict(row) for row in rows]
+
+def create_visualizations(user_id, output_dir=VISUALIZATIONS_DIR):
+    """Create a user's charts in `output_dir` and return (summary, yearly, recent sessions)"""
+    # Ensure the output directory exists
+    os.makedirs(output_dir, exist_ok=True)
+
+    df = load_data_from_db(user_id)
+    if df.empty:
+        # A new user with no sessions yet: nothing to chart
+        return EMPTY_SUMMARY_STATS, [], []
 
-def create_visualizations(df):
-    """Create and display various visualizations"""
     # Add month and year columns for aggregation
-    df['month'] = df['date'].dt.month
-    df['year'] = df['date'].dt.year
-    df['month_name'] = df['date'].dt.strftime('%B')
-    
+    add_date_parts(df)
+
     # Generate summary statistics
-    summary_stats = create_summary_stats(df)
-    yearly_stats = create_yearly_stats(df)
-    recent_sessions = get_recent_sessions(df)
-    
+    with time_phase('stats'):
+        summary_stats = create_summary_stats(df)
+        yearly_stats = create_yearly_stats(df)
+        recent_sessions = get_recent_sessions(user_id)
+
+    with time_phase('charts'):
+        render_charts(df, output_dir)
+
+    print(f"\nVisualization files have been created in {output_dir}/")
+
+    return summary_stats, yearly_stats, recent_sessions
+
+def render_charts(df, output_dir=VISUALIZATIONS_DIR):
+    """Write every dashboard chart to `output_dir`"""
+    import pandas as pd
+    import plotly.express as px
+
     # Create progression charts
-    monthly_patterns = create_progression_charts(df)
+    monthly_patterns = create_progression_charts(df, output_dir)
     
     # Original visualizations
     fig_location = px.pie(df, names='location', title='Surf Sessions by Location')
-    fig_location.write_html('static/visualizations/surf_locations.html')
+    fig_location.write_html(os.path.join(output_dir, 'surf_locations.html'))
     
     fig_board = px.bar(df['board_name'].value_counts(), 
                       title='Sessions by Board',
                       labels={'value': 'Number of Sessions', 'index': 'Board'})
-    fig_board.write_html('static/visualizations/surf_boards.html')
+    fig_board.write_html(os.path.join(output_dir, 'surf_boards.html'))
     
-    monthly_sessions = df.groupby(['year', 'month', 'month_name']).size().reset_index(name='count')
+    monthly_sessions = df.groupby(['year', 'month']).size().reset_index(name='count')
     monthly_sessions['date'] = pd.to_datetime(monthly_sessions[['year', 'month']].assign(day=1))
     fig_timeline = px.line(monthly_sessions, x='date', y='count',
                           title='Number of Sessions Over Time',
                           labels={'count': 'Number of Sessions', 'date': 'Month'})
-    fig_timeline.write_html('static/visualizations/surf_timeline.html')
+    fig_timeline.write_html(os.path.join(output_dir, 'surf_timeline.html'))
     
     fig_waves = px.box(df, y='wave_height', x='year', title='Wave Height Distribution by Year')
-    fig_waves.write_html('static/visualizations/wave_heights.html')
+    fig_waves.write_html(os.path.join(output_dir, 'wave_heights.html'))
     
     fig_performance = px.box(df, x='board_name', y='waves_caught',
                            title='Waves Caught by Board Type')
-    fig_performance.write_html('static/visualizations/board_performance.html')
+    fig_performance.write_html(os.path.join(output_dir, 'board_performance.html'))
     
     fig_duration = px.box(df, x='location', y='session_duration',
                          title='Session Duration by Location')
-    fig_duration.write_html('static/visualizations/session_duration.html')
-    
-    print("\nVisualization files have been created in static/visualizations/")
-    
-    return summary_stats, yearly_stats, recent_sessions
+    fig_duration.write_html(os.path.join(output_dir, 'session_duration.html'))
 
 if __name__ == "__main__":
-    print("Loading data from database...")
-    df = load_data_from_db()
-    print("Creating visualizations...")
-    create_visualizations(df) 
\ No newline at end of file
+    from profiling import profiled
+    with profiled('visualize_data'):
+        import users
+        print("Creating visualizations...")
+        create_visualizations(users.cli_user_id()) 
\ No newline at end of file